@@ -0,0 +1,68 @@
+"""
+Cold-start benchmark of the pointeval CLI.
+
+Runs lightweight subcommands in fresh interpreters and fails when the median
+wall time exceeds the budget, or when a heavy dependency is imported by them.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+CLI = str(Path(__file__).resolve().parent / 'cli.py')
+LIGHTWEIGHT_COMMANDS = [
+    ['--help'],
+    ['load', '--help'],
+    ['precision', '--help'],
+    ['report', '--help'],
+    ['must-alias', '--help'],
+    ['callsites', '--help'],
+    ['irdiff', '--help'],
+    ['stats', '--help'],
+    ['history', '--help'],
+    ['compare', '--help'],
+    ['serve', '--help'],
+]
+HEAVY_MODULES = ['scipy', 'numpy', 'tabulate', 'bitsets', 'disjoint_set']
+IMPORT_CHECK = (
+    "import contextlib, io, sys, cli\n"
+    "with contextlib.redirect_stdout(io.StringIO()):\n"
+    "    for args in {commands!r}:\n"
+    "        try:\n"
+    "            cli.main(args)\n"
+    "        except SystemExit:\n"
+    "            pass\n"
+    "print(','.join(m for m in {heavy!r} if m in sys.modules))"
+).format(commands=LIGHTWEIGHT_COMMANDS, heavy=HEAVY_MODULES)
+
+
+def median_startup(args, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, CLI, *args], stdout=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('startup benchmark')
+    parser.add_argument('--budget', type=float, default=0.3, help='median cold start budget in seconds')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for command in LIGHTWEIGHT_COMMANDS:
+        elapsed = median_startup(command, args.repeat)
+        status = 'ok' if elapsed <= args.budget else 'OVER BUDGET'
+        failed |= elapsed > args.budget
+        print(f"pointeval {' '.join(command):25s} {elapsed * 1000:8.1f} ms  {status}")
+
+    imported = subprocess.run([sys.executable, '-c', IMPORT_CHECK], capture_output=True, text=True,
+                              cwd=str(Path(CLI).parent), check=True).stdout.strip()
+    if imported:
+        failed = True
+        print(f"heavy modules imported at startup: {imported}")
+    sys.exit(1 if failed else 0)
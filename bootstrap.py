@@ -0,0 +1,82 @@
+import warnings
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_RESAMPLES = 10000
+
+
+def bootstrap_confidence_intervals(
+    samples: Dict[str, Tuple[Sequence[float], Sequence[float]]],
+    n_resamples: int = DEFAULT_RESAMPLES,
+    confidence: float = 0.95,
+    seed: Optional[int] = None,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Percentile bootstrap confidence intervals for paired differences.
+
+    All series are resampled in one vectorized batch: the differences are padded
+    into a (series, benchmarks) matrix and a single (series, resamples, benchmarks)
+    index array is drawn, scaled to each series' own length and masked past it.
+
+    Parameters
+    ----------
+    samples : Dict[str, Tuple[Sequence[float], Sequence[float]]]
+        Mapping of a series name to its paired (x, y) columns, e.g.
+        (``precision_ir``, ``precision_actual``) over benchmarks
+    n_resamples : int
+        Number of bootstrap resamples per series
+    confidence : float
+        Confidence level of the intervals
+    seed : Optional[int]
+        Seed of the random generator
+
+    Returns
+    -------
+    Dict[str, Dict[str, float]]
+        Per series: number of pairs, mean difference x - y and its interval, and the
+        standardized effect size (mean / sd of the differences) and its interval
+    """
+    names = list(samples.keys())
+    diffs = [np.asarray(samples[n][0], dtype=float) - np.asarray(samples[n][1], dtype=float) for n in names]
+    lengths = np.array([len(d) for d in diffs])
+    if len(names) == 0 or lengths.min() == 0:
+        raise ValueError("every series needs at least one pair")
+    padded = np.zeros((len(names), lengths.max()))
+    for i, d in enumerate(diffs):
+        padded[i, :len(d)] = d
+
+    rng = np.random.default_rng(seed)
+    draws = rng.random((len(names), n_resamples, lengths.max()))
+    indices = (draws * lengths[:, None, None]).astype(np.intp)
+    resampled = padded[np.arange(len(names))[:, None, None], indices]
+    mask = np.arange(lengths.max())[None, None, :] < lengths[:, None, None]
+    resampled *= mask
+
+    n = lengths[:, None]
+    means = resampled.sum(axis=2) / n
+    variances = (resampled ** 2).sum(axis=2) / n - means ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        effects = means / np.sqrt(np.clip(variances, 0, None))
+    effects[~np.isfinite(effects)] = np.nan
+
+    alpha = (1 - confidence) / 2
+    mean_ci = np.quantile(means, [alpha, 1 - alpha], axis=1)
+    with warnings.catch_warnings():
+        # resamples with constant differences have no effect size
+        warnings.simplefilter('ignore', RuntimeWarning)
+        effect_ci = np.nanquantile(effects, [alpha, 1 - alpha], axis=1)
+
+    results = {}
+    for i, name in enumerate(names):
+        sd = diffs[i].std()
+        results[name] = {
+            'n': int(lengths[i]),
+            'mean_diff': float(diffs[i].mean()),
+            'ci_low': float(mean_ci[0, i]),
+            'ci_high': float(mean_ci[1, i]),
+            'effect_size': float(diffs[i].mean() / sd) if sd != 0 else float('nan'),
+            'effect_ci_low': float(effect_ci[0, i]),
+            'effect_ci_high': float(effect_ci[1, i]),
+        }
+    return results
@@ -0,0 +1,95 @@
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from varpointstodb import VarPointsToTable
+from virtualcallvardb import VirtualCallVariablesTable
+from utils import pp_dictionary
+
+# Receiver type counts at or above this value share the last histogram bucket.
+HISTOGRAM_CAP = 10
+
+
+class CallSitePrecision:
+    """
+    Per-call-site polymorphism of virtual calls for the Soot and WALA representations.
+
+    Parameters
+    ----------
+    benchmark : str
+        Benchmark name
+    analysis : str
+        Analysis type (e.g. 1cs, 2os)
+    """
+    def __init__(self, benchmark: str, analysis: str) -> None:
+        self.benchmark = benchmark
+        self.analysis = analysis
+        self.tables = {
+            ir: (VarPointsToTable(benchmark=benchmark, analysis=analysis, ir=ir),
+                 VirtualCallVariablesTable(benchmark=benchmark, analysis=analysis, ir=ir))
+            for ir in ('soot', 'wala')
+        }
+        self._receivers: Dict[str, Dict[str, Tuple[int, int]]] = {}
+
+    def __repr__(self) -> str:
+        return f'CallSitePrecision (benchmark= {self.benchmark}, analysis= {self.analysis})'
+
+    def receivers(self, ir: str) -> Dict[str, Tuple[int, int]]:
+        """(#receiver objects, #receiver types) of every virtual call site of an IR."""
+        if ir not in self._receivers:
+            db, virtualcall_db = self.tables[ir]
+            self._receivers[ir] = db.receivers_per_call_site(virtualcall_db.table_name)
+        return self._receivers[ir]
+
+    def ir_metrics(self, ir: str) -> Dict[str, Any]:
+        """
+        Summarize the call-site polymorphism of an IR.
+
+        Returns
+        -------
+        Dict[str, Any]
+            Numbers of sites, unresolved (no receiver), monomorphic and polymorphic sites
+            by receiver type, average receiver objects and types per site, and the
+            histogram of receiver types per site
+        """
+        receivers = self.receivers(ir)
+        histogram = Counter(min(types, HISTOGRAM_CAP) for _, types in receivers.values())
+        nb_sites = len(receivers)
+        return {
+            'call_sites': nb_sites,
+            'unresolved_sites': histogram.get(0, 0),
+            'mono_sites': histogram.get(1, 0),
+            'poly_sites': sum(cnt for types, cnt in histogram.items() if types >= 2),
+            'avg_receiver_objs': sum(objs for objs, _ in receivers.values()) / nb_sites if nb_sites else 0,
+            'avg_receiver_types': sum(types for _, types in receivers.values()) / nb_sites if nb_sites else 0,
+            'type_histogram': {(f'{t}+' if t == HISTOGRAM_CAP else str(t)): histogram[t] for t in sorted(histogram)},
+        }
+
+    def site_differences(self) -> List[Dict[str, Any]]:
+        """
+        Call sites whose receivers differ between the two IRs, most different first.
+
+        Sites found in only one IR are reported with ``None`` counts for the other.
+        """
+        soot, wala = self.receivers('soot'), self.receivers('wala')
+        diffs = []
+        for site in soot.keys() | wala.keys():
+            s, w = soot.get(site), wala.get(site)
+            if s == w:
+                continue
+            diffs.append({
+                'site': site,
+                'soot_objs': s[0] if s else None,
+                'wala_objs': w[0] if w else None,
+                'soot_types': s[1] if s else None,
+                'wala_types': w[1] if w else None,
+            })
+        diffs.sort(key=lambda d: abs((d['soot_types'] or 0) - (d['wala_types'] or 0)), reverse=True)
+        return diffs
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        res = {ir: self.ir_metrics(ir) for ir in ('soot', 'wala')}
+        for ir, metrics in res.items():
+            print(f'----------------------------- {ir.capitalize()} Call-Site Precision -----------------------------')
+            print(f"benchmark = {self.benchmark}, analysis = {self.analysis}")
+            pp_dictionary(metrics)
+        return res
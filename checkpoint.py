@@ -0,0 +1,136 @@
+import json
+import sqlite3
+from pathlib import Path
+from sqlite3 import Error
+from typing import Any, Dict, List, Optional
+
+from sketches import HyperLogLog
+
+CHECKPOINT_PATH = Path(".") / "db" / "checkpoints.db"
+# Result series of a precision sweep, in the order they are computed for a benchmark.
+SERIES = ('soot_ir', 'wala_ir', 'soot_cha', 'wala_cha')
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, (set, frozenset)):
+        return {'__set__': sorted(value)}
+    raise TypeError(f"cannot checkpoint {type(value).__name__}")
+
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    return set(obj['__set__']) if set(obj) == {'__set__'} else obj
+
+
+class Checkpoint:
+    """
+    Durable store of the per-benchmark results of a precision sweep.
+
+    Each (benchmark, series) result is committed as soon as it is computed, so a
+    sweep that crashes or is killed resumes with the missing results only, and
+    the reports can be regenerated from whatever is stored. Exact and approximate
+    sweeps of an analysis are kept apart. Every result is stored with the
+    fingerprint of the tables it was computed from, so results of tables loaded
+    again since are not resumed.
+
+    Parameters
+    ----------
+    analysis : str
+        Analysis type (e.g. 1cs, 2os)
+    approximate : bool
+        Whether the results come from the HyperLogLog approximate mode
+    path : Path
+        SQLite file holding the checkpoints
+    """
+    def __init__(self, analysis: str, approximate: bool = False, path: Path = CHECKPOINT_PATH) -> None:
+        self.analysis = analysis
+        self.mode = 'approximate' if approximate else 'exact'
+        self.path = path
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS results (analysis string, mode string, benchmark string, '
+                         'series string, result string, fingerprint string, '
+                         'PRIMARY KEY (analysis, mode, benchmark, series))')
+            if 'fingerprint' not in [r[1] for r in conn.execute('PRAGMA table_info(results)')]:
+                # checkpoints written before fingerprints were stored never match, so they are recomputed
+                conn.execute("ALTER TABLE results ADD COLUMN fingerprint string DEFAULT ''")
+            conn.execute('CREATE TABLE IF NOT EXISTS sketches (analysis string, mode string, benchmark string, '
+                         'name string, sketch blob, PRIMARY KEY (analysis, mode, benchmark, name))')
+            conn.execute('CREATE TABLE IF NOT EXISTS memory_reports (analysis string, mode string, '
+                         'benchmark string, report string, PRIMARY KEY (analysis, mode, benchmark))')
+            conn.commit()
+        except Error as e:
+            print(f"Checkpoint: {e}")
+
+    def __repr__(self) -> str:
+        return f'Checkpoint [analysis = {self.analysis}, mode = {self.mode}, path = {self.path}]'
+
+    def _write(self, query: str, params: tuple) -> None:
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute(query, (self.analysis, self.mode) + params)
+            conn.commit()
+        except Error as e:
+            print(f"Checkpoint: {e}")
+
+    def _read(self, query: str, params: tuple = ()) -> List[tuple]:
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute(query, (self.analysis, self.mode) + params).fetchall()
+        except Error as e:
+            print(f"Checkpoint: {e}")
+            return []
+
+    def save(self, benchmark: str, series: str, result: Dict[str, Any], fingerprint: str = '') -> None:
+        """Commit the result of one series of a benchmark, computed from tables with the given fingerprint."""
+        self._write('INSERT OR REPLACE INTO results (analysis, mode, benchmark, series, result, fingerprint) '
+                    'VALUES (?,?,?,?,?,?)', (benchmark, series, json.dumps(result, default=_encode), fingerprint))
+
+    def completed(self, benchmark: str, fingerprint: Optional[str] = None) -> List[str]:
+        """Series of a benchmark whose result is stored (computed from tables with ``fingerprint``, if given)."""
+        rows = self._read('SELECT series, fingerprint from results where analysis = ? and mode = ? and benchmark = ?',
+                          (benchmark,))
+        return [r[0] for r in rows if fingerprint is None or r[1] == fingerprint]
+
+    def results(self, series: str, benchmarks: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Stored results of a series, restricted to and ordered like ``benchmarks``
+        (all stored benchmarks, in the order they were stored, by default).
+        """
+        rows = self._read('SELECT benchmark, result from results where analysis = ? and mode = ? and series = ? '
+                          'order by rowid', (series,))
+        stored = {b: json.loads(r, object_hook=_decode) for b, r in rows}
+        order = stored if benchmarks is None else [b for b in benchmarks if b in stored]
+        return [stored[b] for b in order]
+
+    def save_sketches(self, benchmark: str, sketches: Dict[str, HyperLogLog]) -> None:
+        for name, sketch in sketches.items():
+            self._write('INSERT OR REPLACE INTO sketches VALUES (?,?,?,?,?)', (benchmark, name, sketch.to_bytes()))
+
+    def suite_sketches(self, benchmarks: Optional[List[str]] = None) -> Dict[str, HyperLogLog]:
+        """Sketches of the stored benchmarks (all by default), merged per name."""
+        merged: Dict[str, HyperLogLog] = {}
+        rows = self._read('SELECT benchmark, name, sketch from sketches where analysis = ? and mode = ?')
+        for benchmark, name, data in rows:
+            if benchmarks is not None and benchmark not in benchmarks:
+                continue
+            sketch = HyperLogLog.from_bytes(data)
+            merged[name] = merged[name].merge(sketch) if name in merged else sketch
+        return merged
+
+    def save_memory_report(self, benchmark: str, report: str) -> None:
+        self._write('INSERT OR REPLACE INTO memory_reports VALUES (?,?,?,?)', (benchmark, report))
+
+    def memory_reports(self, benchmarks: Optional[List[str]] = None) -> List[tuple]:
+        rows = self._read('SELECT benchmark, report from memory_reports where analysis = ? and mode = ? '
+                          'order by rowid')
+        return [r for r in rows if benchmarks is None or r[0] in benchmarks]
+
+    def clear(self) -> None:
+        """Forget every stored result of this analysis and mode."""
+        conn = sqlite3.connect(self.path)
+        try:
+            for table in ('results', 'sketches', 'memory_reports'):
+                conn.execute(f'DELETE FROM {table} where analysis = ? and mode = ?', (self.analysis, self.mode))
+            conn.commit()
+        except Error as e:
+            print(f"Checkpoint:clear: {e}")
@@ -0,0 +1,311 @@
+"""
+pointeval command line interface.
+
+Subcommands import their heavy dependencies (bitsets, scipy, numpy, tabulate)
+only when they run, so that ``pointeval --help`` and argument errors stay fast.
+"""
+import argparse
+import importlib
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from facts import ANALYSIS_LOG_ROOT, RELATIONS
+from outputs import COMPRESSIONS
+from queryclient import DEFAULT_ADDRESS
+from utils import ANALYSES, BENCHMARKS, IRS
+
+
+def _memory_budget(args: argparse.Namespace):
+    if not args.memory_budget:
+        return None
+    from outofcore import MemoryBudget
+    return MemoryBudget(args.memory_budget, args.spill_dir)
+
+
+def _add_memory_budget_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--memory-budget', type=int, metavar='MB',
+                        help='RAM budget in MiB; larger tables are processed out of core')
+    parser.add_argument('--spill-dir', help='directory for out-of-core temporary files (the first one applies to the whole process)')
+
+
+def run_load(args: argparse.Namespace) -> int:
+    import sqlite3
+    from facts import load_relation
+    from sharedfacts import LAYOUTS, load_relation_shared
+    from utils import DATABASE_PATH
+    varpointsto_loader = importlib.import_module('create-varpointsto-db')
+    relations = list(RELATIONS) if 'all' in args.relation else args.relation
+    conn = sqlite3.connect(DATABASE_PATH)
+    for ir in args.ir:
+        for b in args.b:
+            for a in args.a:
+                print(f"Loading analysis={a} benchmark={b} ir={ir}")
+                for name in relations:
+                    if name == 'varpointsto':
+                        varpointsto_loader.load_var_points_to_db(benchmark=b, analysis=a, ir=ir,
+                                                                 projections=args.projections,
+                                                                 pointsto_sets=args.pointsto_sets,
+                                                                 ctx_trie=args.ctx_trie,
+                                                                 log_root=args.log_root,
+                                                                 shared=args.shared)
+                    elif args.shared and name in LAYOUTS:
+                        load_relation_shared(conn, RELATIONS[name], b, a, ir, args.log_root)
+                    else:
+                        load_relation(conn, RELATIONS[name], b, a, ir, args.log_root)
+    return 0
+
+
+def run_precision(args: argparse.Namespace) -> int:
+    import precision
+    from outputs import OutputOptions
+    budget = _memory_budget(args)
+    output = OutputOptions(args.dump_format == 'binary', args.dump_compression, args.async_dumps)
+    if args.b:
+        precision.runner_single_benchmark(args.a, [args.b], budget, args.approximate, output,
+                                          args.soft_memory_limit, args.trace_memory)
+        return 0
+    compute = {
+        '1cs': precision.compute_precision_1cs,
+        '1os': precision.compute_precision_1os,
+        '2cs': precision.compute_precision_2cs,
+        '2os': precision.compute_precision_2os,
+    }
+    compute[args.a](budget, approximate=args.approximate, soft_memory_limit=args.soft_memory_limit,
+                    trace_memory=args.trace_memory, history_label=args.history_label, fresh=args.fresh,
+                    output=output)
+    return 0
+
+
+def run_report(args: argparse.Namespace) -> int:
+    from checkpoint import Checkpoint
+    from precision import write_reports
+    write_reports(args.a, Checkpoint(args.a, args.approximate), args.b)
+    return 0
+
+
+def run_must_alias(args: argparse.Namespace) -> int:
+    from must_alias import MustAlias
+    ma = MustAlias(benchmark=args.b, analysis=args.a, ir=args.ir, memory_budget=_memory_budget(args))
+    if args.refine_from:
+        ma.refine_partition(args.refine_from)
+        alias_sets = ma.ci_alias_classes(refined_from=args.refine_from)
+    elif args.ci:
+        ma.compute_ci_partition()
+        alias_sets = ma.ci_alias_classes()
+    else:
+        alias_sets = ma.compute_must_alias()
+    nb_alias_sets = 0
+    for alias_set in alias_sets:
+        nb_alias_sets += 1
+        if args.verbose:
+            print(alias_set)
+    print(f"{ma}: #alias sets = {nb_alias_sets}")
+    return 0
+
+
+def run_callsites(args: argparse.Namespace) -> int:
+    from callsite_precision import CallSitePrecision
+    for b in args.b:
+        callsites = CallSitePrecision(benchmark=b, analysis=args.a)
+        callsites.report()
+        diffs = callsites.site_differences()
+        print(f"{len(diffs)} call sites differ between soot and wala")
+        for d in diffs[:args.top]:
+            print(f"    {d['site']}: soot {d['soot_objs']} objs / {d['soot_types']} types, "
+                  f"wala {d['wala_objs']} objs / {d['wala_types']} types")
+    return 0
+
+
+def run_irdiff(args: argparse.Namespace) -> int:
+    from irdiff import CrossIRDiff
+    from utils import pretty_print_csv
+    for b in args.b:
+        res = CrossIRDiff(benchmark=b, analysis=args.a, memory_budget=_memory_budget(args)).report(args.top)
+        if args.csv_dir:
+            for name in ('variables', 'methods'):
+                if res[name]:
+                    pretty_print_csv(res[name], str(Path(args.csv_dir) / f"irdiff-{name}-{b}-{args.a}.csv"))
+    return 0
+
+
+def run_stats(args: argparse.Namespace) -> int:
+    from utils import print_bootstrap_results, print_wilcoxon_results, read_results_csv
+    results_dir = Path(args.results_dir)
+    series = {}
+    for a in args.a:
+        for ir in IRS:
+            ir_file = results_dir / f"{ir}-ir-results-{a}.csv"
+            cha_file = results_dir / f"{ir}-cha-results-{a}.csv"
+            if ir_file.exists():
+                series[f"{a} {ir} IR"] = (read_results_csv(str(ir_file)), ('precision_ir', 'precision_actual'))
+            if cha_file.exists():
+                series[f"{a} {ir} CHA"] = (read_results_csv(str(cha_file)), ('precision_prev', 'precision'))
+    if not series:
+        print(f"No result files for analyses {args.a} in {results_dir}", file=sys.stderr)
+        return 1
+    for msg, (results, fields) in series.items():
+        print_wilcoxon_results(results, fields, f"{msg} Wilcoxon", sys.stdout)
+    print_bootstrap_results({f"{msg} Bootstrap": s for msg, s in series.items()}, sys.stdout,
+                            n_resamples=args.resamples, confidence=args.confidence)
+    print()
+    return 0
+
+
+def run_history(args: argparse.Namespace) -> int:
+    from perfhistory import PerfHistory
+    for r in PerfHistory().runs(args.a):
+        print(f"{r['run']:>5}  {r['started']}  {r['analysis']:4s}  {r['benchmarks']:>3} benchmarks  "
+              f"{r['seconds']:10.1f} s  {r['label']}")
+    return 0
+
+
+def run_compare(args: argparse.Namespace) -> int:
+    from perfhistory import PerfHistory
+    history = PerfHistory()
+    run = args.run if args.run is not None else history.latest_run(history.run_analysis(args.base))
+    if run is None or run == args.base:
+        print(f"No later run to compare against run {args.base}", file=sys.stderr)
+        return 1
+    regressions = history.compare(args.base, run, args.threshold, args.memory_threshold, args.min_seconds)
+    print(f"Run {run} against run {args.base}: {len(regressions)} regressions")
+    for r in regressions:
+        scope = f"{r['benchmark']} {r['ir']}:{r['stage']}" if r['ir'] else f"{r['benchmark']} {r['stage']}"
+        cause = 'input tables changed' if r['data_changed'] else 'same input tables'
+        if r['metric'] == 'seconds':
+            before, after = f"{r['base']:.2f} s", f"{r['current']:.2f} s"
+        else:
+            before, after = f"{r['base'] / 2 ** 20:.1f} MB", f"{r['current'] / 2 ** 20:.1f} MB"
+        print(f"    {scope:45s} {r['metric']:11s} {before:>10s} -> {after:>10s} "
+              f"(x{r['ratio']:.2f}, rows {r['base_rows']:,} -> {r['rows']:,}, {cause})")
+    return 1 if regressions else 0
+
+
+def _preload_spec(value: str) -> List[tuple]:
+    parts = value.split(':')
+    if len(parts) not in (2, 3) or parts[0] not in BENCHMARKS or parts[1] not in ANALYSES \
+            or (len(parts) == 3 and parts[2] not in IRS):
+        raise argparse.ArgumentTypeError(f"expected BENCHMARK:ANALYSIS[:IR], got {value}")
+    irs = parts[2:] or IRS
+    return [(parts[0], parts[1], ir) for ir in irs]
+
+
+def run_serve(args: argparse.Namespace) -> int:
+    from queryserver import QueryServer
+    preload = [key for spec in args.preload for key in spec]
+    QueryServer(args.address, _memory_budget(args), args.idle_timeout, args.workers).run(preload)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser('pointeval', description='Evaluate the effect of program representation '
+                                                              'on Doop points-to results')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    load = subparsers.add_parser('load', help='load Doop outputs into the points-to database')
+    load.add_argument('-a', nargs='+', choices=ANALYSES, required=True)
+    load.add_argument('-b', nargs='+', choices=BENCHMARKS, default=BENCHMARKS)
+    load.add_argument('--ir', nargs='+', choices=IRS, default=IRS)
+    load.add_argument('--relation', nargs='+', choices=[*RELATIONS, 'all'], default=['varpointsto', 'virtualcalls'],
+                      help='Doop relations to load (plain, .gz or .zst fact files)')
+    load.add_argument('--log-root', default=ANALYSIS_LOG_ROOT,
+                      help='directory holding <analysis>/<benchmark>_<ir>/database')
+    load.add_argument('--projections', action='store_true', help='build context-insensitive projections')
+    load.add_argument('--pointsto-sets', action='store_true', help='hash-cons the points-to sets')
+    load.add_argument('--ctx-trie', action='store_true',
+                      help='store contexts in a prefix-shared trie and replace the table by a view')
+    load.add_argument('--shared', action='store_true',
+                      help='store heap objects, variables, contexts and virtual calls once for all analyses '
+                           'of a benchmark and IR; the tables become views')
+    load.set_defaults(func=run_load)
+
+    prec = subparsers.add_parser('precision', help='compute IR and class hierarchy precision')
+    prec.add_argument('-a', choices=ANALYSES, required=True)
+    prec.add_argument('-b', choices=BENCHMARKS)
+    prec.add_argument('--approximate', action='store_true',
+                      help='estimate distinct variable counts with HyperLogLog sketches')
+    prec.add_argument('--soft-memory-limit', type=int, metavar='MB',
+                      help='abort a benchmark with a diagnostic when resident memory exceeds this limit')
+    prec.add_argument('--trace-memory', action='store_true', help='record tracemalloc snapshots per stage')
+    prec.add_argument('--history-label', default='', help='label of this run in the performance history')
+    prec.add_argument('--fresh', action='store_true',
+                      help='discard the checkpointed results of this analysis instead of resuming')
+    prec.add_argument('--dump-format', choices=['text', 'binary'], default='text',
+                      help='format of the heap dumps and method logs')
+    prec.add_argument('--dump-compression', choices=COMPRESSIONS, help='compress the heap dumps and method logs')
+    prec.add_argument('--async-dumps', action='store_true',
+                      help='write the heap dumps and method logs in a background thread')
+    _add_memory_budget_arguments(prec)
+    prec.set_defaults(func=run_precision)
+
+    report = subparsers.add_parser('report', help='regenerate the precision reports from the checkpointed results')
+    report.add_argument('-a', choices=ANALYSES, required=True)
+    report.add_argument('-b', nargs='+', choices=BENCHMARKS, help='benchmarks to report (all stored by default)')
+    report.add_argument('--approximate', action='store_true', help='report the approximate-mode results')
+    report.set_defaults(func=run_report)
+
+    must_alias = subparsers.add_parser('must-alias', help='group variables with identical points-to sets')
+    must_alias.add_argument('-a', choices=ANALYSES, required=True)
+    must_alias.add_argument('-b', choices=BENCHMARKS, required=True)
+    must_alias.add_argument('--ir', choices=IRS, required=True)
+    must_alias.add_argument('-v', '--verbose', action='store_true', help='print every alias set')
+    must_alias.add_argument('--ci', action='store_true',
+                            help='partition context-insensitive variables and persist the partition')
+    must_alias.add_argument('--refine-from', choices=ANALYSES, metavar='ANALYSIS',
+                            help='split the persisted partition of a coarser analysis (e.g. 1cs for 2cs)')
+    _add_memory_budget_arguments(must_alias)
+    must_alias.set_defaults(func=run_must_alias)
+
+    callsites = subparsers.add_parser('callsites', help='per-call-site receiver counts and polymorphism')
+    callsites.add_argument('-a', choices=ANALYSES, required=True)
+    callsites.add_argument('-b', nargs='+', choices=BENCHMARKS, default=BENCHMARKS)
+    callsites.add_argument('--top', type=int, default=20, help='number of differing call sites to list')
+    callsites.set_defaults(func=run_callsites)
+
+    irdiff = subparsers.add_parser('irdiff', help='match soot and wala variables and rank their points-to differences')
+    irdiff.add_argument('-a', choices=ANALYSES, required=True)
+    irdiff.add_argument('-b', nargs='+', choices=BENCHMARKS, default=BENCHMARKS)
+    irdiff.add_argument('--top', type=int, default=20, help='number of methods and variables to rank')
+    irdiff.add_argument('--csv-dir', help='also write the rankings as CSV files to this directory')
+    _add_memory_budget_arguments(irdiff)
+    irdiff.set_defaults(func=run_irdiff)
+
+    stats = subparsers.add_parser('stats', help='Wilcoxon tests and bootstrap intervals over stored results')
+    stats.add_argument('-a', nargs='+', choices=ANALYSES, default=ANALYSES)
+    stats.add_argument('--results-dir', default='results')
+    stats.add_argument('--resamples', type=int, default=10000)
+    stats.add_argument('--confidence', type=float, default=0.95)
+    stats.set_defaults(func=run_stats)
+
+    history = subparsers.add_parser('history', help='list the precision runs in the performance history')
+    history.add_argument('-a', choices=ANALYSES)
+    history.set_defaults(func=run_history)
+
+    compare = subparsers.add_parser('compare', help='flag stages whose time or memory regressed against a run')
+    compare.add_argument('base', type=int, help='ID of the reference run')
+    compare.add_argument('run', type=int, nargs='?', help='ID of the run to check (latest of the same analysis)')
+    compare.add_argument('--threshold', type=float, default=0.2, help='relative slowdown reported as a regression')
+    compare.add_argument('--memory-threshold', type=float,
+                         help='relative peak memory increase reported as a regression (--threshold by default)')
+    compare.add_argument('--min-seconds', type=float, default=1.0, help='ignore the time of faster stages')
+    compare.set_defaults(func=run_compare)
+
+    serve = subparsers.add_parser('serve', help='keep tables warm and answer queries from queryclient proxies')
+    serve.add_argument('--address', default=DEFAULT_ADDRESS, help='HOST:PORT or unix:PATH to listen on')
+    serve.add_argument('--preload', nargs='+', type=_preload_spec, default=[], metavar='BENCHMARK:ANALYSIS[:IR]',
+                       help='tables to load before accepting queries (both IRs by default)')
+    serve.add_argument('--idle-timeout', type=float, default=600.0, metavar='SECONDS',
+                       help='evict tables nobody queried for this long')
+    serve.add_argument('--workers', type=int, default=4, help='queries computed at the same time')
+    _add_memory_budget_arguments(serve)
+    serve.set_defaults(func=run_serve)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
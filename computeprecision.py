@@ -1,11 +1,15 @@
 import logging
-from typing import Dict, Set, Tuple, Any, List, Optional
+from typing import Dict, Set, Tuple, Any, Iterable, List, Optional
 
 from varpointstodb import VarPointsToTable
 from virtualcallvardb import VirtualCallVariablesTable
 from exclusive_classes import exclusive_classes_wala, exclusive_classes_soot
 from utils import get_type_info, pp_dictionary
 from virtual_call_stats import number_virtual_calls
+from outofcore import MemoryBudget
+from sketches import DEFAULT_PRECISION, HyperLogLog
+from memprofile import MemoryProfiler
+from outputs import OutputOptions, RecordWriter
 
 
 def is_exclass_type(var: str, ex_class: Set[str]) -> bool:
@@ -24,17 +28,52 @@ class ComputePrecision:
         Benchmark name
     analysis : str
         Analysis type (e.g. 1-call-site, 2-call-site, and others)
+    memory_budget : Optional[MemoryBudget]
+        RAM budget; tables that exceed it are processed out of core in SQLite
+    approximate : bool
+        Estimate distinct variable counts with HyperLogLog sketches in one streaming pass per IR
+    sketch_precision : int
+        Precision of the sketches used in approximate mode
+    profiler : Optional[MemoryProfiler]
+        Memory instrumentation of the stages; a profiler without soft limit is used by default
+    output : Optional[OutputOptions]
+        Format of the heap dumps and method logs (uncompressed text by default); asynchronous
+        writers keep running until ``close_outputs``
     """
-    def __init__(self, benchmark: str, analysis: str) -> None:
+    def __init__(
+        self,
+        benchmark: str,
+        analysis: str,
+        memory_budget: Optional[MemoryBudget] = None,
+        approximate: bool = False,
+        sketch_precision: int = DEFAULT_PRECISION,
+        profiler: Optional[MemoryProfiler] = None,
+        output: Optional[OutputOptions] = None,
+    ) -> None:
         logging.basicConfig(filename='info.log', filemode='w', level=logging.INFO)
         self.analysis = analysis
         self.benchmark = benchmark
+        self.memory_budget = memory_budget
+        self.approximate = approximate
+        self.sketch_precision = sketch_precision
+        self.sketches: Dict[str, Dict[str, HyperLogLog]] = {}
+        self._sketch_counts: Dict[str, Dict[str, Any]] = {}
+        self.profiler = profiler or MemoryProfiler()
+        self.output = output or OutputOptions()
+        self.pending_outputs: List[RecordWriter] = []
+        self._out_of_core: Dict[str, bool] = {}
         self.soot_db = VarPointsToTable(benchmark=benchmark, analysis=analysis, ir='soot')
         self.wala_db = VarPointsToTable(benchmark=benchmark, analysis=analysis, ir='wala')
+        self.soot_db.profiler = self.profiler
+        self.wala_db.profiler = self.profiler
         wala_virtualcall_vars_db = VirtualCallVariablesTable(benchmark=benchmark, analysis=analysis, ir='wala')
         soot_virtualcall_vars_db = VirtualCallVariablesTable(benchmark=benchmark, analysis=analysis, ir='soot')
         self.wala_virtualcall_vars = wala_virtualcall_vars_db.virtualcall_variables()
         self.soot_virtualcall_vars = soot_virtualcall_vars_db.virtualcall_variables()
+        self.virtualcall_tables = {
+            self.soot_db.db: soot_virtualcall_vars_db.table_name,
+            self.wala_db.db: wala_virtualcall_vars_db.table_name,
+        }
         self.interesting_types: Set[str] = set()
         logging.debug("soot db length", self.soot_db.db.__len__())
         logging.debug("wala db length", self.wala_db.db.__len__())
@@ -75,14 +114,23 @@ class ComputePrecision:
         Dict[str, Any]
             Dictionary of precision metrics
         """
+        if self.approximate:
+            return self._ir_precision_approximate(interesting_methods, db, ir)
+        if self.is_out_of_core(db):
+            return self._ir_precision_out_of_core(interesting_methods, db, ir)
         _vars = db.variables_of_enclosed_method(tuple(interesting_methods))
+        self.profiler.record_collection('variables_of_enclosed_method', _vars)
         vars = self.select_virtualcall_variables(_vars, virtual_call_vars)
         rel_heap_objs = db.heap_objs_for_var(vars)
-        dump_heap_info_to_file(f"{self.benchmark}_{ir}.dump", rel_heap_objs)
+        self.profiler.record_collection('heap_objs_for_var', rel_heap_objs)
+        self._track(dump_heap_info_to_file(f"{self.benchmark}_{ir}.dump", rel_heap_objs, output=self.output))
         nb_virtual_calls = number_virtual_calls(analysis=self.analysis, benchmark=self.benchmark, ir=ir)
         precision_ir = len(rel_heap_objs) / nb_virtual_calls
         total_heap_objs = db.all_heap_ctx_pair()
+        self.profiler.record_collection('all_heap_ctx_pair', total_heap_objs)
         total_vars = db.all_variables_ctx_pair()
+        self.profiler.record_collection('all_variables_ctx_pair', total_vars)
+        self.profiler.record_sqlite()
         precision_actual = len(total_heap_objs) / len(total_vars) if len(total_vars) != 0 else 0
         return {
             'interesting_types': len(interesting_methods),
@@ -95,18 +143,126 @@ class ComputePrecision:
             'nb_virtual_calls': nb_virtual_calls,
         }
 
+    def is_out_of_core(self, db: VarPointsToTable) -> bool:
+        """Check whether the table is too large for the memory budget and must be processed in SQLite."""
+        if self.memory_budget is None:
+            return False
+        if db.db not in self._out_of_core:
+            # counting the rows scans the whole table, so it is only done once per table
+            self._out_of_core[db.db] = self.memory_budget.exceeded_by(len(db))
+        out_of_core = self._out_of_core[db.db]
+        if out_of_core:
+            print(f"\t\t{db.db} exceeds {self.memory_budget}; computing out of core")
+        return out_of_core
+
+    def _ir_precision_out_of_core(
+        self,
+        interesting_methods: Set[str],
+        db: VarPointsToTable,
+        ir: str,
+    ) -> Dict[str, Any]:
+        """Out-of-core variant of ``_ir_precision`` keeping every intermediate set in SQLite."""
+        conn = self.memory_budget.connect()
+        db.spill_values(conn, 'ooc_methods', interesting_methods)
+        nb_vars = db.spill_variables(conn, 'ooc_vars', self.virtualcall_tables[db.db], 'enclosingMethod', 'ooc_methods')
+        nb_rel_heap_objs = sum(1 for _ in db.iter_heap_objs_for_spilled(conn, 'ooc_vars'))
+        self._track(dump_heap_info_to_file(f"{self.benchmark}_{ir}.dump",
+                                           db.iter_heap_objs_for_spilled(conn, 'ooc_vars', distinct=True),
+                                           distinct=True, output=self.output))
+        self.profiler.record_sqlite(conn)
+        conn.close()
+        nb_virtual_calls = number_virtual_calls(analysis=self.analysis, benchmark=self.benchmark, ir=ir)
+        precision_ir = nb_rel_heap_objs / nb_virtual_calls
+        total_heap_objs = len(db)
+        total_vars = db.count_variables_ctx_pair()
+        precision_actual = total_heap_objs / total_vars if total_vars != 0 else 0
+        return {
+            'interesting_types': len(interesting_methods),
+            'relevant_vars': nb_vars,
+            'relevant_heap_objects': nb_rel_heap_objs,
+            'vars': total_vars,
+            'heap_objects': total_heap_objs,
+            'precision_ir': precision_ir,
+            'precision_actual': precision_actual,
+            'nb_virtual_calls': nb_virtual_calls,
+        }
+
+    def _sketch_table(self, db: VarPointsToTable, ir: str) -> Tuple[Dict[str, HyperLogLog], Dict[str, Any]]:
+        """
+        Feed the approximate-mode sketches and counters of one IR in a single pass over its table.
+
+        Distinct (varCtx, var) counts go to HyperLogLog sketches kept in ``self.sketches[ir]``.
+        Heap object counts are row counts, so they are accumulated exactly. Relevance of a row
+        only depends on its variable, which makes the row-wise counts equal to the ones of
+        ``heap_objs_for_var``.
+        """
+        if ir in self.sketches:
+            return self.sketches[ir], self._sketch_counts[ir]
+        self.resolve_interesting_types()
+        if ir == 'soot':
+            ex_types, virtualcall_vars = exclusive_classes_soot(self.benchmark), self.soot_virtualcall_vars
+        else:
+            ex_types, virtualcall_vars = exclusive_classes_wala(self.benchmark), self.wala_virtualcall_vars
+        sketches = {name: HyperLogLog(self.sketch_precision)
+                    for name in ('vars', 'relevant_vars', 'variables', 'ex_vars')}
+        counts: Dict[str, Any] = {'heap_objects': 0, 'relevant_heap_objects': 0, 'heap_objs': 0, 'ex_heap_objs': 0}
+        ex_vars_types: Set[str] = set()
+        for var_ctx, var, heap_obj, method, var_type in db.iter_rows(
+                'varCtx', 'var', 'heapObj', 'enclosingMethod', 'varType'):
+            var_ctx_pair = (var_ctx, var)
+            sketches['vars'].add(var_ctx_pair)
+            counts['heap_objects'] += 1
+            if var not in virtualcall_vars:
+                continue
+            # same filter as the `heapObj not like '%null%'` clause of heap_objs_for_var
+            is_heap_obj = 'null' not in heap_obj.lower()
+            sketches['variables'].add(var_ctx_pair)
+            counts['heap_objs'] += is_heap_obj
+            if method in self.interesting_types:
+                sketches['relevant_vars'].add(var_ctx_pair)
+                counts['relevant_heap_objects'] += is_heap_obj
+            if var_type in ex_types:
+                sketches['ex_vars'].add(var_ctx_pair)
+                counts['ex_heap_objs'] += is_heap_obj
+                ex_vars_types.add(get_type_info(var))
+        counts['ex_type'] = len(ex_types)
+        counts['ex_vars_types'] = ex_vars_types
+        self.sketches[ir] = sketches
+        self._sketch_counts[ir] = counts
+        return sketches, counts
+
+    def _ir_precision_approximate(self, interesting_methods: Set[str], db: VarPointsToTable, ir: str) -> Dict[str, Any]:
+        """Approximate variant of ``_ir_precision``; ``*_error`` keys hold 95% error bounds."""
+        sketches, counts = self._sketch_table(db, ir)
+        nb_virtual_calls = number_virtual_calls(analysis=self.analysis, benchmark=self.benchmark, ir=ir)
+        total_vars = sketches['vars'].estimate()
+        return {
+            'interesting_types': len(interesting_methods),
+            'relevant_vars': round(sketches['relevant_vars'].estimate()),
+            'relevant_vars_error': sketches['relevant_vars'].error_bound(),
+            'relevant_heap_objects': counts['relevant_heap_objects'],
+            'vars': round(total_vars),
+            'vars_error': sketches['vars'].error_bound(),
+            'heap_objects': counts['heap_objects'],
+            'precision_ir': counts['relevant_heap_objects'] / nb_virtual_calls,
+            'precision_actual': counts['heap_objects'] / total_vars if total_vars != 0 else 0,
+            'nb_virtual_calls': nb_virtual_calls,
+        }
+
     def _compute_interesting_methods(self) -> None:
         """Compute interesting methods with different variable counts across IRs."""
         ex_class_soot = exclusive_classes_soot(self.benchmark)
         ex_class_wala = exclusive_classes_wala(self.benchmark)
 
         soot_var_methods = self.soot_db.get_var_enclosing_method()
+        self.profiler.record_collection('soot_var_methods', soot_var_methods)
         _soot_var_methods = soot_var_methods.copy()
         for v in _soot_var_methods:
             if is_exclass_type(v, ex_class_soot):
                 soot_var_methods.remove(v)
 
         wala_var_methods = self.wala_db.get_var_enclosing_method()
+        self.profiler.record_collection('wala_var_methods', wala_var_methods)
         _wala_var_methods = wala_var_methods.copy()
         for v in _wala_var_methods:
             if is_exclass_type(v, ex_class_wala):
@@ -115,6 +271,8 @@ class ComputePrecision:
         types_union = soot_var_methods.intersection(wala_var_methods)
         soot_vars_for_type = self.soot_db.count_nb_of_variables_method()
         wala_vars_for_type = self.wala_db.count_nb_of_variables_method()
+        self.profiler.record_collection('soot_vars_for_type', soot_vars_for_type)
+        self.profiler.record_collection('wala_vars_for_type', wala_vars_for_type)
 
         for t in types_union:
             soot_vars_cnt = soot_vars_for_type.get(t, 0)
@@ -125,22 +283,36 @@ class ComputePrecision:
             f"soot var methods = {len(soot_var_methods)}; wala var methods = {len(wala_var_methods)}; "
             f"interesting types = {len(self.interesting_types)}")
 
-        with open(f"logs/soot_{self.analysis}_{self.benchmark}_var_types.log", 'w+') as fh:
-            for k, v in soot_vars_for_type.items():
-                fh.write(f"{k}:{v}\n")
-        with open(f"logs/wala_{self.analysis}_{self.benchmark}_var_types.log", 'w+') as fh:
-            for k, v in wala_vars_for_type.items():
-                fh.write(f"{k}:{v}\n")
+        for ir, vars_for_type in (('soot', soot_vars_for_type), ('wala', wala_vars_for_type)):
+            writer = self.output.writer(f"logs/{ir}_{self.analysis}_{self.benchmark}_var_types.log",
+                                        text_format=lambda r: f"{r[0]}:{r[1]}")
+            writer.write_all(vars_for_type.items())
+            self._track(writer)
+
+    def _track(self, writer: RecordWriter) -> None:
+        """Close a writer now, or when ``close_outputs`` is called if it writes asynchronously."""
+        writer.finish()
+        if self.output.asynchronous:
+            self.pending_outputs.append(writer)
+        else:
+            writer.close()
+
+    def close_outputs(self) -> None:
+        """Wait for the asynchronous dump and log writers to finish."""
+        while self.pending_outputs:
+            self.pending_outputs.pop(0).close()
 
     def resolve_interesting_types(self) -> None:
         """Cache set of interesting methods to prevent redundant database calls."""
         if len(self.interesting_types) == 0:
-            self._compute_interesting_methods()
+            with self.profiler.stage('interesting_methods'):
+                self._compute_interesting_methods()
 
     def soot_ir_precision(self) -> Dict[str, Any]:
         """Compute precision for soot IR."""
         self.resolve_interesting_types()
-        res = self._ir_precision(self.interesting_types, self.soot_db, self.soot_virtualcall_vars, "soot")
+        with self.profiler.stage('soot:ir_precision'):
+            res = self._ir_precision(self.interesting_types, self.soot_db, self.soot_virtualcall_vars, "soot")
         print('----------------------------- Soot IR Precision -----------------------------------------')
         print(f"benchmark = {self.benchmark}, analysis = {self.analysis}")
         pp_dictionary(res)
@@ -149,7 +321,8 @@ class ComputePrecision:
     def wala_ir_precision(self) -> Dict[str, Any]:
         """Compute precision for wala IR."""
         self.resolve_interesting_types()
-        res = self._ir_precision(self.interesting_types, self.wala_db, self.wala_virtualcall_vars, "wala")
+        with self.profiler.stage('wala:ir_precision'):
+            res = self._ir_precision(self.interesting_types, self.wala_db, self.wala_virtualcall_vars, "wala")
         print('----------------------------- Wala IR Precision -----------------------------------------')
         print(f"benchmark = {self.benchmark}, analysis = {self.analysis}")
         pp_dictionary(res)
@@ -186,13 +359,20 @@ class ComputePrecision:
         Dict[str, Any]
             Dictionary with precision metrics
         """
+        if self.approximate:
+            return self._class_hierarchy_precision_approximate(db)
+        if self.is_out_of_core(db):
+            return self._class_hierarchy_precision_out_of_core(ex_types, db)
         _ex_vars = db.variables_by_enclosed_method_class(tuple(ex_types))
         ex_vars = self.select_virtualcall_variables(_ex_vars, virtualcall_vars)
         ex_heap_objs = db.heap_objs_for_var(ex_vars)
 
         _all_vars = db.all_variables_ctx_pair()
+        self.profiler.record_collection('all_variables_ctx_pair', _all_vars)
         variables = self.select_virtualcall_variables(_all_vars, virtualcall_vars)
         heap_objs = db.heap_objs_for_var(variables)
+        self.profiler.record_collection('heap_objs_for_var', heap_objs)
+        self.profiler.record_sqlite()
         precision_prev = len(heap_objs) / len(variables) if len(variables) != 0 else 0
         if ex_heap_objs is None:
             ex_heap_objs = []
@@ -215,24 +395,96 @@ class ComputePrecision:
             'ex_vars_types': ex_vars_types,
         }
 
+    def _class_hierarchy_precision_out_of_core(self, ex_types: Set[str], db: VarPointsToTable) -> Dict[str, Any]:
+        """Out-of-core variant of ``class_hierarchy_precision`` keeping every intermediate set in SQLite."""
+        virtualcall_table = self.virtualcall_tables[db.db]
+        conn = self.memory_budget.connect()
+        db.spill_values(conn, 'ooc_ex_types', ex_types)
+        nb_ex_vars = db.spill_variables(conn, 'ooc_ex_vars', virtualcall_table, 'varType', 'ooc_ex_types')
+        nb_ex_heap_objs = sum(1 for _ in db.iter_heap_objs_for_spilled(conn, 'ooc_ex_vars'))
+        ex_vars_types = {get_type_info(r[0]) for r in conn.execute('SELECT DISTINCT var from ooc_ex_vars')}
+        nb_variables = db.spill_variables(conn, 'ooc_vars', virtualcall_table)
+        nb_heap_objs = sum(1 for _ in db.iter_heap_objs_for_spilled(conn, 'ooc_vars'))
+        self.profiler.record_sqlite(conn)
+        conn.close()
+        precision_prev = nb_heap_objs / nb_variables if nb_variables != 0 else 0
+        precision = (
+            (nb_heap_objs - nb_ex_heap_objs) / (nb_variables - nb_ex_vars)
+            if (nb_variables - nb_ex_vars) != 0
+            else 0
+        )
+        return {
+            'ex_type': len(ex_types),
+            'ex_vars': nb_ex_vars,
+            'ex_heap_objs': nb_ex_heap_objs,
+            'heap_objs': nb_heap_objs,
+            'variables': nb_variables,
+            'precision': precision,
+            'precision_prev': precision_prev,
+            'ex_vars_types': ex_vars_types,
+        }
+
+    def _class_hierarchy_precision_approximate(self, db: VarPointsToTable) -> Dict[str, Any]:
+        """Approximate variant of ``class_hierarchy_precision``; ``*_error`` keys hold 95% error bounds."""
+        ir = 'soot' if db is self.soot_db else 'wala'
+        sketches, counts = self._sketch_table(db, ir)
+        variables = sketches['variables'].estimate()
+        ex_vars = sketches['ex_vars'].estimate()
+        precision_prev = counts['heap_objs'] / variables if variables != 0 else 0
+        precision = (
+            (counts['heap_objs'] - counts['ex_heap_objs']) / (variables - ex_vars)
+            if round(variables - ex_vars) != 0
+            else 0
+        )
+        return {
+            'ex_type': counts['ex_type'],
+            'ex_vars': round(ex_vars),
+            'ex_vars_error': sketches['ex_vars'].error_bound(),
+            'ex_heap_objs': counts['ex_heap_objs'],
+            'heap_objs': counts['heap_objs'],
+            'variables': round(variables),
+            'variables_error': sketches['variables'].error_bound(),
+            'precision': precision,
+            'precision_prev': precision_prev,
+            'ex_vars_types': counts['ex_vars_types'],
+        }
+
     def soot_class_hierarchy_precision(self) -> Dict[str, Any]:
         ex_types = exclusive_classes_soot(self.benchmark)
-        res = self.class_hierarchy_precision(ex_types, self.soot_db, self.soot_virtualcall_vars)
+        with self.profiler.stage('soot:cha_precision'):
+            res = self.class_hierarchy_precision(ex_types, self.soot_db, self.soot_virtualcall_vars)
         print("=============== SOOT CLASS HIERARCHY PRECISION =========================")
         pp_dictionary(res)
         return res
 
     def wala_class_hierarchy_precision(self) -> Dict[str, Any]:
         ex_types = exclusive_classes_wala(self.benchmark)
-        res = self.class_hierarchy_precision(ex_types, self.wala_db, self.wala_virtualcall_vars)
+        with self.profiler.stage('wala:cha_precision'):
+            res = self.class_hierarchy_precision(ex_types, self.wala_db, self.wala_virtualcall_vars)
         print("=============== WALA CLASS HIERARCHY PRECISION =========================")
         pp_dictionary(res)
         return res
 
 
-def dump_heap_info_to_file(filename: str, list_of_heap_objs: List[Tuple[str, str]]) -> None:
-    """Write unique heap objects to a file."""
-    set_of_heap_objs = set(list_of_heap_objs)
-    with open(filename, 'w+') as fh:
-        for heap_obj in set_of_heap_objs:
-            fh.write(f'{heap_obj}\n')
+def dump_heap_info_to_file(
+    filename: str,
+    list_of_heap_objs: Iterable[Tuple[str, str]],
+    distinct: bool = False,
+    output: Optional[OutputOptions] = None,
+) -> RecordWriter:
+    """
+    Write unique heap objects to a file as they are streamed.
+
+    Duplicates are dropped on the fly unless ``distinct`` says the input is already
+    duplicate-free. The returned writer is closed, except when ``output`` is
+    asynchronous: it is then finished and the caller closes it once the remaining
+    buffers may be awaited. A dump that fails is closed right away.
+    """
+    writer = (output or OutputOptions()).writer(filename, distinct=not distinct)
+    try:
+        writer.write_all(list_of_heap_objs)
+        writer.finish()
+    finally:
+        if output is None or not output.asynchronous or not writer.finished:
+            writer.close()
+    return writer
@@ -0,0 +1,273 @@
+import sqlite3
+import time
+from sqlite3 import Error
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ROOT_CTX_ID = 0
+
+
+def ctx_table(table: str) -> str:
+    """Name of the context trie of a points-to table."""
+    return f'{table}_ctx'
+
+
+def rows_table(table: str) -> str:
+    """Name of the points-to rows with heapCtx/varCtx replaced by context IDs."""
+    return f'{table}_rows'
+
+
+def ctx_strings_table(table: str) -> str:
+    """Name of the context strings used by the rows of a points-to table, by context ID."""
+    return f'{table}_ctxstr'
+
+
+def parse_context(ctx: str) -> Tuple[str, ...]:
+    """
+    Split a Doop context such as ``[<a: void m(int,int)>/invoke1, <b>/new T/0]`` into its elements.
+
+    Elements are separated by ``, `` outside of angle brackets. They are returned most
+    recent first (Doop prints them oldest first), so that truncating a context to
+    depth k keeps a prefix of the tuple. A context that is not in brackets is
+    returned as its only element; ``ContextTrie`` keeps it apart from the bracketed
+    context of that element.
+    """
+    if not (ctx.startswith('[') and ctx.endswith(']')):
+        return (ctx,)
+    body = ctx[1:-1]
+    if not body:
+        return ()
+    elements = []
+    depth = 0
+    start = 0
+    for i, c in enumerate(body):
+        if c == '<':
+            depth += 1
+        elif c == '>':
+            depth -= 1
+        elif c == ',' and depth == 0 and body.startswith(', ', i):
+            elements.append(body[start:i])
+            start = i + 2
+    elements.append(body[start:])
+    return tuple(reversed(elements))
+
+
+def format_context(elements: Tuple[str, ...]) -> str:
+    """Inverse of ``parse_context``."""
+    return f"[{', '.join(reversed(elements))}]"
+
+
+class ContextTrie:
+    """
+    In-memory builder of a context trie.
+
+    Every context is a node pointing to its parent, the same context without its
+    oldest element, plus that element. IDs are assigned parents first. A context
+    that is not in brackets is an opaque node of depth 0 without parent, which
+    truncation keeps whole.
+    """
+    def __init__(self) -> None:
+        self.ids: Dict[Tuple[str, ...], int] = {(): ROOT_CTX_ID}
+        self.nodes: List[Tuple[int, Optional[int], Optional[str], int]] = [(ROOT_CTX_ID, None, None, 0)]
+        # ID of every context string added, to map the rows without parsing their contexts again
+        self.contexts: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def add(self, ctx: str) -> int:
+        """Insert a context string (and all of its prefixes) and return its ID."""
+        ctx_id = self.contexts.get(ctx)
+        if ctx_id is not None:
+            return ctx_id
+        if not (ctx.startswith('[') and ctx.endswith(']')):
+            ctx_id = len(self.nodes)
+            self.nodes.append((ctx_id, None, ctx, 0))
+            self.contexts[ctx] = ctx_id
+            return ctx_id
+        elements = parse_context(ctx)
+        parent = ROOT_CTX_ID
+        for depth in range(1, len(elements) + 1):
+            path = elements[:depth]
+            node = self.ids.get(path)
+            if node is None:
+                node = len(self.nodes)
+                self.ids[path] = node
+                self.nodes.append((node, parent, path[-1], depth))
+            parent = node
+        self.contexts[ctx] = parent
+        return parent
+
+
+def node_context(nodes: Dict[int, Tuple[Optional[int], Optional[str]]], ctx_id: int) -> str:
+    """
+    Rebuild the context string of a trie node.
+
+    Parameters
+    ----------
+    nodes : Dict[int, Tuple[Optional[int], Optional[str]]]
+        (parent, elem) of every trie node, by context ID
+    ctx_id : int
+        ID of the node
+    """
+    parent, elem = nodes[ctx_id]
+    if parent is None and ctx_id != ROOT_CTX_ID:
+        return elem
+    # walking up to the root visits the elements oldest first
+    elements = []
+    while ctx_id != ROOT_CTX_ID:
+        parent, elem = nodes[ctx_id]
+        elements.append(elem)
+        ctx_id = parent
+    return format_context(tuple(reversed(elements)))
+
+
+def is_trie_view(conn: sqlite3.Connection, table: str) -> bool:
+    """Check whether a points-to table was replaced by a view over its context trie."""
+    row = conn.execute("SELECT sql from sqlite_master where type = 'view' and name = ?", (table,)).fetchone()
+    return row is not None and rows_table(table) in row[0]
+
+
+def _trie_view_sql(table: str) -> str:
+    strings = ctx_strings_table(table)
+    return (
+        f'CREATE VIEW {table} AS '
+        f'SELECT hc.ctx AS heapCtx, r.heapObj, vc.ctx AS varCtx, r.var, r.heapType, r.enclosingMethod, r.varType '
+        f'from {rows_table(table)} r '
+        f'JOIN {strings} hc on hc.ctxId = r.heapCtxId JOIN {strings} vc on vc.ctxId = r.varCtxId'
+    )
+
+
+def build_context_trie(conn: sqlite3.Connection, table: str, replace: bool = False) -> None:
+    """
+    Store the contexts of a points-to table in a trie and its rows with context IDs.
+
+    ``<table>_ctx`` holds one row per trie node (ctxId, parent, elem, depth), unique
+    on (parent, elem), and ``<table>_rows`` holds the points-to rows with
+    ``heapCtxId``/``varCtxId`` instead of the context strings. ``<table>_ctxstr``
+    keeps the string of every context used by a row, indexed both ways. With
+    ``replace``, the string table is dropped and recreated as a view joining them,
+    so ``VarPointsToTable`` queries keep working while every row only stores two
+    integers for its contexts.
+
+    The trie is built under temporary names and swapped in within one transaction,
+    so a failure leaves the previous table, view and trie untouched. A table that
+    already is a trie view is rebuilt from its rows and stays a view.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Connection to the points-to database
+    table : str
+        Name of the context-sensitive points-to table
+    replace : bool
+        Replace the table by a view over the trie and the ID rows
+    """
+    ctx = ctx_table(table)
+    rows = rows_table(table)
+    strings = ctx_strings_table(table)
+    new_ctx = f'{ctx}_new'
+    new_rows = f'{rows}_new'
+    new_strings = f'{strings}_new'
+    start = time.time()
+    if conn.in_transaction:
+        conn.commit()
+    cur = conn.cursor()
+    try:
+        cur.execute('BEGIN')
+        trie_view = is_trie_view(conn, table)
+        if replace and not trie_view and \
+                cur.execute("SELECT 1 from sqlite_master where type = 'view' and name = ?", (table,)).fetchone():
+            print(f"build_context_trie: {table} is a view; keeping it")
+            replace = False
+        trie = ContextTrie()
+        for r in cur.execute(f'SELECT DISTINCT heapCtx from {table} UNION SELECT DISTINCT varCtx from {table}'):
+            trie.add(r[0])
+        cur.execute(f'DROP TABLE IF EXISTS {new_ctx}')
+        cur.execute(f'DROP TABLE IF EXISTS {new_rows}')
+        cur.execute(f'DROP TABLE IF EXISTS {new_strings}')
+        cur.execute(f'CREATE TABLE {new_ctx} (ctxId integer PRIMARY KEY, parent integer, elem string, depth integer)')
+        cur.executemany(f'INSERT INTO {new_ctx} VALUES (?,?,?,?)', trie.nodes)
+        # indexed on the strings to map the rows to their IDs
+        cur.execute('DROP TABLE IF EXISTS temp.ctx_strings')
+        cur.execute('CREATE TEMP TABLE ctx_strings (ctx string PRIMARY KEY, ctxId integer)')
+        cur.executemany('INSERT INTO ctx_strings VALUES (?,?)', trie.contexts.items())
+        cur.execute(f'CREATE TABLE {new_strings} (ctxId integer PRIMARY KEY, ctx string)')
+        cur.execute(f'INSERT INTO {new_strings} SELECT ctxId, ctx from ctx_strings')
+        cur.execute(
+            f'CREATE TABLE {new_rows} AS '
+            f'SELECT hc.ctxId AS heapCtxId, t.heapObj, vc.ctxId AS varCtxId, t.var, '
+            f't.heapType, t.enclosingMethod, t.varType '
+            f'from {table} t JOIN ctx_strings hc on hc.ctx = t.heapCtx JOIN ctx_strings vc on vc.ctx = t.varCtx'
+        )
+        cur.execute('DROP TABLE temp.ctx_strings')
+        nb_rows = cur.execute(f'SELECT count(*) from {new_rows}').fetchone()[0]
+        nb_table_rows = cur.execute(f'SELECT count(*) from {table}').fetchone()[0]
+        if nb_rows != nb_table_rows:
+            print(f"build_context_trie: {new_rows} has {nb_rows} rows but {table} has {nb_table_rows}; keeping {table}")
+            conn.rollback()
+            return
+
+        # swap: the old view must go before the tables it reads from are dropped and renamed
+        if trie_view:
+            cur.execute(f'DROP VIEW {table}')
+        cur.execute(f'DROP TABLE IF EXISTS {ctx}')
+        cur.execute(f'DROP TABLE IF EXISTS {rows}')
+        cur.execute(f'DROP TABLE IF EXISTS {strings}')
+        cur.execute(f'ALTER TABLE {new_ctx} RENAME TO {ctx}')
+        cur.execute(f'ALTER TABLE {new_rows} RENAME TO {rows}')
+        cur.execute(f'ALTER TABLE {new_strings} RENAME TO {strings}')
+        cur.execute(f'CREATE UNIQUE INDEX {ctx}_elem ON {ctx} (parent, elem)')
+        cur.execute(f'CREATE INDEX {strings}_ctx ON {strings} (ctx)')
+        cur.execute(f'CREATE INDEX {rows}_var ON {rows} (var, varCtxId)')
+        cur.execute(f'CREATE INDEX {rows}_varCtxId ON {rows} (varCtxId)')
+        if replace and not trie_view:
+            cur.execute(f'DROP TABLE {table}')
+        if replace or trie_view:
+            cur.execute(_trie_view_sql(table))
+        conn.commit()
+        print(f'Built context trie {ctx} with {len(trie)} nodes in {time.time() - start} seconds')
+    except Error as e:
+        conn.rollback()
+        print(f"build_context_trie: {e}")
+
+
+def unpack_context_trie(conn: sqlite3.Connection, table: str) -> None:
+    """
+    Turn a trie view back into a plain points-to table and drop its trie, in one transaction.
+
+    Loading facts appends to a plain table, which a view does not allow.
+    """
+    if not is_trie_view(conn, table):
+        return
+    if conn.in_transaction:
+        conn.commit()
+    try:
+        conn.execute('BEGIN')
+        conn.execute(f'DROP TABLE IF EXISTS {table}_plain')
+        conn.execute(f'CREATE TABLE {table}_plain AS SELECT * from {table}')
+        conn.execute(f'DROP VIEW {table}')
+        conn.execute(f'DROP TABLE {ctx_table(table)}')
+        conn.execute(f'DROP TABLE {rows_table(table)}')
+        conn.execute(f'DROP TABLE IF EXISTS {ctx_strings_table(table)}')
+        conn.execute(f'ALTER TABLE {table}_plain RENAME TO {table}')
+        conn.commit()
+    except Error as e:
+        conn.rollback()
+        print(f"unpack_context_trie: {e}")
+
+
+def truncation_map(nodes: Iterable[Tuple[int, Optional[int], int]], depth: int) -> Dict[int, int]:
+    """
+    Map every context ID to its ancestor of at most ``depth`` elements.
+
+    Parameters
+    ----------
+    nodes : Iterable[Tuple[int, Optional[int], int]]
+        (ctxId, parent, depth) of every trie node, parents before children
+    depth : int
+        Maximum context depth to keep
+    """
+    ancestor: Dict[int, int] = {}
+    for ctx_id, parent, node_depth in nodes:
+        ancestor[ctx_id] = ctx_id if node_depth <= depth else ancestor[parent]
+    return ancestor
@@ -1,89 +1,54 @@
-import os
 import sqlite3
-from sqlite3 import Error
-from utils import get_heap_type_info
+from facts import ANALYSIS_LOG_ROOT, RELATIONS, load_relation
+from projections import build_ci_projections, drop_ci_projections
+from pointsto_sets import build_pointsto_sets, drop_pointsto_sets
+from contexttrie import build_context_trie, unpack_context_trie
+from sharedfacts import load_relation_shared
+from utils import DATABASE_PATH
 
-DATABASE_PATH = os.path.join(".", "db", "varpointsto.db")
-ANALYSIS_LOG_ROOT = "analysis-logs"
-LOG_FILE_NAME = 'Stats_Simple_Application_VarPointsTo.csv'
+RELATION = RELATIONS['varpointsto']
 
 
-def load_var_points_to_db(benchmark, analysis, ir):
-    dir_name = f'{benchmark}_{ir}'
-    log_file = os.path.join(".", ANALYSIS_LOG_ROOT, analysis, dir_name, "database", LOG_FILE_NAME)
-    print("log file name", log_file)
-    db_entries = []
-    # with open(log_file, 'r') as fh:
-    try:
-        fh = open(log_file, 'r')
-        for line in fh:
-            pts_info = line.split('\t')  # tuple of form (heapCtx, heapObj, varCtx, var)
-            heap_type = get_heap_type_info(pts_info[1])
-            var_enclosing_method = get_var_method_info(pts_info[3])
-            pts_info.append(heap_type)
-            pts_info.append(var_enclosing_method)
-            pts_info.append(get_var_type_info(pts_info[3]))
-            db_entries.append(tuple(pts_info))
-    except FileNotFoundError as e:
-        print(f"Error = {e}")
-
-
-    table_name = '{}_{}_{}'.format(benchmark, analysis, ir)
-    # create table if not exists
+def load_var_points_to_db(benchmark, analysis, ir, projections=False, pointsto_sets=False, ctx_trie=False,
+                          log_root=ANALYSIS_LOG_ROOT, shared=False):
+    table_name = RELATION.table_name(benchmark, analysis, ir)
     conn = sqlite3.connect(DATABASE_PATH)
-    cur = conn.cursor()
-    try:
-        query = f'CREATE TABLE IF NOT EXISTS {table_name} (heapCtx string,' \
-                f' heapObj string,' \
-                f' varCtx string,' \
-                f' var string,' \
-                f' heapType string,' \
-                f' enclosingMethod string,' \
-                f' varType string)'
-        print(query)
-        cur.execute(query)
-        conn.commit()
-    except Error as e:
-        print(e)
-    # populate tables
-    try:
-        query = f"INSERT INTO {table_name} VALUES (?,?,?,?,?,?,?)"
-        print(query)
-        cur.executemany(query, db_entries)
-        conn.commit()
-        print(f'Populated database entries {cur.rowcount}')
-    except Error as e:
-        print(e)
-
-
-def get_var_method_info(variable):
-    """Extracts the type information of the containing method and class name in a variable."""
-    pos_angle = variable.find('<')
-    pos_colon = variable.find('>')
-    if pos_colon != -1 and pos_angle != -1:
-        return variable[pos_angle + 1:pos_colon]
+    # heap objects, variables and contexts stored once for all analyses; the table becomes a view over IDs
+    if shared:
+        load_relation_shared(conn, RELATION, benchmark, analysis, ir, log_root)
     else:
-        return variable
+        # facts are appended to a plain table, so a table replaced by its context trie becomes one again
+        unpack_context_trie(conn, table_name)
+        if load_relation(conn, RELATION, benchmark, analysis, ir, log_root):
+            # tables built from the previous rows are stale (a shared load drops them itself,
+            # and the trie of a plain table was unpacked above)
+            drop_ci_projections(conn, table_name)
+            drop_pointsto_sets(conn, table_name)
+    # contexts stored once in a prefix-shared trie; the table becomes a view over context IDs
+    # (a shared table already is a view, so the trie is only built next to it)
+    if ctx_trie:
+        build_context_trie(conn, table_name, replace=not shared)
+    # context-insensitive projections used by VarPointsToTable for context-independent queries
+    if projections:
+        build_ci_projections(conn, table_name)
+    # one row per distinct points-to set, plus a var -> set ID map
+    if pointsto_sets:
+        build_pointsto_sets(conn, table_name)
 
 
-def get_var_type_info(variable: str):
-    """Extracts the type information of the containign method"""
-    pos_angle = variable.find('<')
-    pos_colon = variable.find(':')
-    if pos_colon != -1 and pos_angle != -1:
-        return variable[pos_angle + 1:pos_colon]
-    else:
-        return variable
+if __name__ == '__main__':
+    import argparse
 
+    parser = argparse.ArgumentParser(description='Load the VarPointsTo facts of the 2os analysis')
+    parser.add_argument('--projections', action='store_true', help='build context-insensitive projections')
+    parser.add_argument('--pointsto-sets', action='store_true', help='hash-cons the points-to sets')
+    parser.add_argument('--ctx-trie', action='store_true',
+                        help='store contexts in a trie and replace the table by a view over context IDs')
+    args = parser.parse_args()
 
-if __name__ == '__main__':
     benchmarks = ['avrora', 'batik', 'eclipse', 'h2', 'jython', 'lusearch', 'luindex', 'pmd', 'sunflow', 'tradebeans', 'xalan']
-    benchmarks.remove('eclipse')
-    benchmarks.remove('jython')
     analyses = ['2os']
 
-    # benchmarks = ['eclipse', 'jython']
-
     print(f'Analysis = {analyses}')
     print(f'Benchmarks = {benchmarks}')
     input('Press enter to continue.... ')
@@ -92,5 +57,6 @@ if __name__ == '__main__':
         for b in benchmarks:
             for a in analyses:
                 print(f"Loading table analysis={a} benchmark={b}  ir={ir}.......")
-                load_var_points_to_db(analysis=a, benchmark=b, ir=ir)
+                load_var_points_to_db(analysis=a, benchmark=b, ir=ir, projections=args.projections,
+                                      pointsto_sets=args.pointsto_sets, ctx_trie=args.ctx_trie)
                 print("COMPLETED")
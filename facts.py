@@ -0,0 +1,234 @@
+"""
+Streaming readers for Doop fact files.
+
+Each relation we load is described once in ``RELATIONS``: the fact file it
+comes from, its columns, the columns derived from them and the table it is
+loaded into. Fact files are read line by line, whether they are plain,
+gzip- or zstd-compressed, so archived Doop outputs never have to be
+decompressed on disk.
+"""
+import gzip
+import io
+import sqlite3
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from sqlite3 import Error
+from typing import Callable, Dict, Iterator, Optional, TextIO, Tuple
+
+from utils import get_heap_type_info, get_type_info, get_var_method_info
+
+ANALYSIS_LOG_ROOT = "analysis-logs"
+# Table renewing the stamp of every loaded table, see ``stamp_load``.
+LOAD_STAMPS = 'load_stamps'
+
+
+def _open_plain(path: Path, stack: ExitStack) -> TextIO:
+    return stack.enter_context(open(path, 'r'))
+
+
+def _open_gzip(path: Path, stack: ExitStack) -> TextIO:
+    return stack.enter_context(gzip.open(path, 'rt'))
+
+
+def _open_zstd(path: Path, stack: ExitStack) -> TextIO:
+    try:
+        from compression import zstd  # Python 3.14+
+    except ImportError:
+        zstd = None
+    if zstd is not None:
+        return stack.enter_context(zstd.open(path, 'rt'))
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(f"reading {path} needs Python 3.14 or the zstandard package "
+                          f"(pip install pointeval[zstd])") from None
+    raw = stack.enter_context(open(path, 'rb'))
+    reader = stack.enter_context(zstandard.ZstdDecompressor().stream_reader(raw))
+    return io.TextIOWrapper(reader)
+
+
+# Fact file suffix -> function opening it as text; register_reader adds formats.
+READERS: Dict[str, Callable[[Path, ExitStack], TextIO]] = {
+    '': _open_plain,
+    '.gz': _open_gzip,
+    '.zst': _open_zstd,
+}
+
+
+def register_reader(suffix: str, opener: Callable[[Path, ExitStack], TextIO]) -> None:
+    """Read fact files ending with ``suffix`` (e.g. ``.bz2``) with ``opener``."""
+    READERS[suffix] = opener
+
+
+class Relation:
+    """
+    Declarative description of a Doop fact file and of the table it is loaded into.
+
+    Parameters
+    ----------
+    name : str
+        Name of the relation on the command line
+    file_name : str
+        Name of the uncompressed fact file in a Doop ``database`` directory
+    columns : Tuple[str, ...]
+        Tab-separated columns of the fact file
+    table : str
+        Table name pattern, formatted with ``benchmark``, ``analysis`` and ``ir``
+    derived : Tuple[Tuple[str, str, Callable[[str], str]], ...]
+        (column, source column, function) of the columns computed from the file columns
+    indexes : Tuple[str, ...]
+        Columns to index once the table is loaded
+    """
+    def __init__(
+        self,
+        name: str,
+        file_name: str,
+        columns: Tuple[str, ...],
+        table: str,
+        derived: Tuple[Tuple[str, str, Callable[[str], str]], ...] = (),
+        indexes: Tuple[str, ...] = (),
+    ) -> None:
+        self.name = name
+        self.file_name = file_name
+        self.columns = columns
+        self.table = table
+        self.derived = tuple((column, columns.index(source), fn) for column, source, fn in derived)
+        self.indexes = indexes
+
+    def __repr__(self) -> str:
+        return f'Relation [name = {self.name}, file = {self.file_name}]'
+
+    @property
+    def all_columns(self) -> Tuple[str, ...]:
+        return self.columns + tuple(column for column, _, _ in self.derived)
+
+    def table_name(self, benchmark: str, analysis: str, ir: str) -> str:
+        return self.table.format(benchmark=benchmark, analysis=analysis, ir=ir)
+
+    def row(self, fields: Tuple[str, ...]) -> Tuple[str, ...]:
+        return fields + tuple(fn(fields[source]) for _, source, fn in self.derived)
+
+
+RELATIONS: Dict[str, Relation] = {r.name: r for r in (
+    Relation('varpointsto', 'Stats_Simple_Application_VarPointsTo.csv',
+             ('heapCtx', 'heapObj', 'varCtx', 'var'), '{benchmark}_{analysis}_{ir}',
+             derived=(('heapType', 'heapObj', get_heap_type_info),
+                      ('enclosingMethod', 'var', get_var_method_info),
+                      ('varType', 'var', get_type_info))),
+    Relation('virtualcalls', 'VirtualMethodInvocation.csv',
+             ('virtualCallSite', 'virtualVar'), 'virtualcall_var_{benchmark}_{analysis}_{ir}'),
+    Relation('callgraph', 'CallGraphEdge.csv',
+             ('callerCtx', 'invocation', 'calleeCtx', 'callee'), 'callgraph_{benchmark}_{analysis}_{ir}',
+             derived=(('callerMethod', 'invocation', get_var_method_info),),
+             indexes=('callerMethod', 'callee')),
+    Relation('reachable', 'Reachable.csv', ('method',), 'reachable_{benchmark}_{analysis}_{ir}',
+             indexes=('method',)),
+)}
+
+
+def fact_dir(analysis: str, benchmark: str, ir: str, root: str = ANALYSIS_LOG_ROOT) -> Path:
+    """Doop ``database`` directory of an analysis run."""
+    return Path(root) / analysis / f'{benchmark}_{ir}' / 'database'
+
+
+def find_fact_file(directory: Path, file_name: str) -> Optional[Path]:
+    """Return the plain or compressed fact file in ``directory``, if any."""
+    for suffix in READERS:
+        path = directory / f'{file_name}{suffix}'
+        if path.exists():
+            return path
+    return None
+
+
+@contextmanager
+def open_fact_file(path: Path) -> Iterator[TextIO]:
+    """Open a plain or compressed fact file as text, chosen by its suffix."""
+    opener = READERS.get(path.suffix, _open_plain)
+    with ExitStack() as stack:
+        yield opener(path, stack)
+
+
+def read_facts(relation: Relation, path: Path, derived: bool = True) -> Iterator[Tuple[str, ...]]:
+    """
+    Stream the rows of a fact file, with the derived columns appended unless ``derived`` is False.
+
+    Lines whose number of columns does not match the relation are skipped and counted.
+    """
+    nb_columns = len(relation.columns)
+    skipped = 0
+    with open_fact_file(path) as fh:
+        for line in fh:
+            fields = tuple(line.rstrip('\r\n').split('\t'))
+            if len(fields) != nb_columns:
+                skipped += 1
+                continue
+            yield relation.row(fields) if derived else fields
+    if skipped:
+        print(f"read_facts: skipped {skipped} malformed lines of {path}")
+
+
+def stamp_load(conn: sqlite3.Connection, table: str, nb_rows: int) -> None:
+    """
+    Record, in the transaction of a load, that the rows of ``table`` changed.
+
+    Every load gets a new random stamp, so ``perfhistory.table_fingerprint`` tells
+    two loads apart without reading their rows, even when they have the same size.
+    """
+    conn.execute(f'CREATE TABLE IF NOT EXISTS {LOAD_STAMPS} (tableName string PRIMARY KEY, nbRows integer, '
+                 f'stamp string)')
+    conn.execute(f'INSERT OR REPLACE INTO {LOAD_STAMPS} VALUES (?,?,?)', (table, nb_rows, uuid.uuid4().hex[:16]))
+
+
+def load_stamp(conn: sqlite3.Connection, table: str) -> Optional[Tuple[int, str]]:
+    """Return the (number of rows, stamp) of the last load of ``table``, or None if it was not stamped."""
+    if conn.execute("SELECT 1 from sqlite_master where type = 'table' and name = ?", (LOAD_STAMPS,)).fetchone() is None:
+        return None
+    row = conn.execute(f'SELECT nbRows, stamp from {LOAD_STAMPS} where tableName = ?', (table,)).fetchone()
+    return (row[0], row[1]) if row is not None else None
+
+
+def load_relation(
+    conn: sqlite3.Connection,
+    relation: Relation,
+    benchmark: str,
+    analysis: str,
+    ir: str,
+    root: str = ANALYSIS_LOG_ROOT,
+) -> int:
+    """
+    Append the facts of a relation for one analysis run to its table.
+
+    Returns
+    -------
+    int
+        Number of rows loaded (0 when the fact file is missing)
+    """
+    directory = fact_dir(analysis, benchmark, ir, root)
+    path = find_fact_file(directory, relation.file_name)
+    if path is None:
+        print(f"load_relation: no {relation.file_name}[{'|'.join(s for s in READERS if s)}] in {directory}")
+        return 0
+    table = relation.table_name(benchmark, analysis, ir)
+    columns = ', '.join(f'{c} string' for c in relation.all_columns)
+    placeholders = ','.join('?' * len(relation.all_columns))
+    start = time.time()
+    try:
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {table} ({columns})')
+        before = conn.execute(f'SELECT count(*) from {table}').fetchone()[0]
+        conn.executemany(f'INSERT INTO {table} VALUES ({placeholders})', read_facts(relation, path))
+        for column in relation.indexes:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})')
+        after = conn.execute(f'SELECT count(*) from {table}').fetchone()[0]
+        stamp_load(conn, table, after)
+        conn.commit()
+        nb_rows = after - before
+        print(f'Loaded {nb_rows} rows of {path} into {table} in {time.time() - start} seconds')
+        return nb_rows
+    except (ImportError, OSError, EOFError) as e:
+        conn.rollback()
+        print(f"load_relation: {e}")
+    except Error as e:
+        print(f"load_relation: {e}")
+    return 0
@@ -0,0 +1,257 @@
+"""
+Per-variable comparison of the Soot and WALA points-to tables.
+
+Variables of both IRs are normalized to a common key, the enclosing method
+plus the source-level local name, and both tables are streamed sorted on that
+key so that they are matched with a sort-merge join in one pass, holding one
+variable's points-to sets at a time.
+"""
+import heapq
+import re
+import sqlite3
+import time
+from sqlite3 import Error
+from typing import Any, Dict, Iterator, List, Optional, Pattern, Tuple
+
+from memprofile import MemoryProfiler
+from outofcore import MemoryBudget
+from utils import DATABASE_PATH, get_var_method_info
+from varpointstodb import VarPointsToTable
+
+# Separates the method from the local in a variable key; sorts before any printable
+# character, so keys sort like (method, local) tuples both in SQLite and in Python.
+KEY_SEPARATOR = '\x01'
+
+# Per IR: (suffix removed from source-level locals, pattern of compiler-generated locals).
+# Soot (Jimple) splits locals into SSA versions ``x#_12``, names stack locals ``$r1``,
+# ``$stack3`` and temporaries ``temp$0``, and unnamed reference and boolean locals ``r0``,
+# ``z1``. Other one-letter names such as ``i2`` or ``s1`` are common source locals, so
+# they are kept; WALA names its value numbers ``v3``.
+IR_LOCALS: Dict[str, Tuple[Optional[Pattern[str]], Pattern[str]]] = {
+    'soot': (re.compile(r'#_\d+$'), re.compile(r'^(\$.*|[rz]\d+|temp\$\d+)$')),
+    'wala': (None, re.compile(r'^v\d+$')),
+}
+HEAP_INDEX = re.compile(r'/\d+$')
+
+
+def normalize_variable(var: str, ir: str) -> Tuple[str, str, bool]:
+    """
+    Map a Doop variable of an IR to (method, local, source-level).
+
+    Source-level locals are stripped of IR-specific versioning so that both IRs
+    agree on them; compiler-generated locals are prefixed with the IR and never match.
+    """
+    var = var.rstrip('\n')
+    method = get_var_method_info(var)
+    pos = var.find('>/')
+    local = var[pos + 2:] if pos != -1 else var
+    if local == '@this':
+        local = 'this'
+    suffix, generated = IR_LOCALS[ir]
+    if suffix is not None:
+        local = suffix.sub('', local)
+    if generated.match(local):
+        return method, f'{ir}:{local}', False
+    return method, local, True
+
+
+def variable_key(ir: str, var: str) -> str:
+    method, local, _ = normalize_variable(var, ir)
+    return f'{method}{KEY_SEPARATOR}{local}'
+
+
+def heap_key(heap_obj: str) -> str:
+    """Allocation site without its per-IR instruction index (``<m>/new T/0`` -> ``<m>/new T``)."""
+    return HEAP_INDEX.sub('', heap_obj)
+
+
+def iter_variable_sets(conn: sqlite3.Connection, table: str, ir: str) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Stream the normalized points-to set of every normalized variable of a table, ordered by key.
+
+    Versions of a local (and all contexts) are merged, and null pseudo heap objects
+    are excluded as in ``VarPointsToTable.heap_objs_for_var``. SQLite sorts the rows,
+    on disk when they do not fit its cache.
+    """
+    query = (
+        f"SELECT DISTINCT variable_key(?, var), heap_key(heapObj) from {table} "
+        f"where heapObj not like '%null%' order by 1, 2"
+    )
+    current_key = None
+    heaps: List[str] = []
+    for key, heap in conn.execute(query, (ir,)):
+        if key != current_key:
+            if current_key is not None:
+                yield current_key, heaps
+            current_key = key
+            heaps = []
+        heaps.append(heap)
+    if current_key is not None:
+        yield current_key, heaps
+
+
+def merge_variable_sets(
+    soot: Iterator[Tuple[str, List[str]]],
+    wala: Iterator[Tuple[str, List[str]]],
+) -> Iterator[Tuple[str, Optional[List[str]], Optional[List[str]]]]:
+    """Sort-merge join of two key-ordered streams; the missing side is None."""
+    s, w = next(soot, None), next(wala, None)
+    while s is not None or w is not None:
+        if w is None or (s is not None and s[0] < w[0]):
+            yield s[0], s[1], None
+            s = next(soot, None)
+        elif s is None or w[0] < s[0]:
+            yield w[0], None, w[1]
+            w = next(wala, None)
+        else:
+            yield s[0], s[1], w[1]
+            s, w = next(soot, None), next(wala, None)
+
+
+def _count_common(a: List[str], b: List[str]) -> int:
+    """Size of the intersection of two sorted, duplicate-free lists."""
+    i = j = common = 0
+    while i < len(a) and j < len(b):
+        if a[i] == b[j]:
+            common += 1
+            i += 1
+            j += 1
+        elif a[i] < b[j]:
+            i += 1
+        else:
+            j += 1
+    return common
+
+
+class CrossIRDiff:
+    """
+    Match the variables of the Soot and WALA tables and rank their points-to differences.
+
+    Parameters
+    ----------
+    benchmark : str
+        Benchmark name
+    analysis : str
+        Analysis type (e.g. 1cs, 2os)
+    memory_budget : Optional[MemoryBudget]
+        Bounds the SQLite page cache and spill directory used to sort both tables
+    profiler : Optional[MemoryProfiler]
+        Memory instrumentation of the diff stage
+    """
+    def __init__(
+        self,
+        benchmark: str,
+        analysis: str,
+        memory_budget: Optional[MemoryBudget] = None,
+        profiler: Optional[MemoryProfiler] = None,
+    ) -> None:
+        self.benchmark = benchmark
+        self.analysis = analysis
+        self.memory_budget = memory_budget
+        self.profiler = profiler or MemoryProfiler()
+        self.soot_db = VarPointsToTable(benchmark=benchmark, analysis=analysis, ir='soot')
+        self.wala_db = VarPointsToTable(benchmark=benchmark, analysis=analysis, ir='wala')
+
+    def __repr__(self) -> str:
+        return f'CrossIRDiff (benchmark= {self.benchmark}, analysis= {self.analysis})'
+
+    def _source_table(self, db: VarPointsToTable) -> str:
+        # contexts do not take part in the comparison
+        return db.ci_db if db.has_projections() else db.db
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = self.memory_budget.connect() if self.memory_budget is not None else sqlite3.connect(DATABASE_PATH)
+        conn.create_function('variable_key', 2, variable_key, deterministic=True)
+        conn.create_function('heap_key', 1, heap_key, deterministic=True)
+        return conn
+
+    def diff(self, top: int = 50) -> Dict[str, Any]:
+        """
+        Compare the context-insensitive points-to sets of every matched variable.
+
+        Parameters
+        ----------
+        top : int
+            Number of variables and methods kept in the rankings
+
+        Returns
+        -------
+        Dict[str, Any]
+            ``summary`` with the matched, mismatched and unmatched variable counts;
+            ``variables``, the ``top`` matched variables with the largest symmetric
+            difference between their sets; ``methods``, the ``top`` methods with
+            the largest total symmetric difference over their matched variables
+        """
+        soot_conn, wala_conn = self._connect(), self._connect()
+        summary = {'matched_vars': 0, 'differing_vars': 0, 'soot_only_vars': 0, 'wala_only_vars': 0,
+                   'soot_generated_vars': 0, 'wala_generated_vars': 0}
+        methods: Dict[str, Dict[str, int]] = {}
+        ranked: List[Tuple[Tuple[int, int], int, Dict[str, Any]]] = []
+        try:
+            with self.profiler.stage('ir_diff'):
+                start = time.time()
+                merged = merge_variable_sets(
+                    iter_variable_sets(soot_conn, self._source_table(self.soot_db), 'soot'),
+                    iter_variable_sets(wala_conn, self._source_table(self.wala_db), 'wala'),
+                )
+                for count, (key, soot, wala) in enumerate(merged):
+                    method, local = key.split(KEY_SEPARATOR, 1)
+                    m = methods.setdefault(method, {'matched': 0, 'differing': 0, 'soot_only': 0, 'wala_only': 0,
+                                                    'soot_objs': 0, 'wala_objs': 0, 'sym_diff': 0})
+                    if soot is None or wala is None:
+                        ir = 'soot' if wala is None else 'wala'
+                        generated = local.startswith(f'{ir}:')
+                        summary[f'{ir}_generated_vars' if generated else f'{ir}_only_vars'] += 1
+                        m[f'{ir}_only'] += 1
+                        continue
+                    common = _count_common(soot, wala)
+                    sym_diff = len(soot) + len(wala) - 2 * common
+                    summary['matched_vars'] += 1
+                    m['matched'] += 1
+                    m['soot_objs'] += len(soot)
+                    m['wala_objs'] += len(wala)
+                    m['sym_diff'] += sym_diff
+                    if sym_diff:
+                        summary['differing_vars'] += 1
+                        m['differing'] += 1
+                        row = {'method': method, 'local': local, 'soot_objs': len(soot), 'wala_objs': len(wala),
+                               'common': common, 'soot_only_objs': len(soot) - common,
+                               'wala_only_objs': len(wala) - common}
+                        item = ((sym_diff, abs(len(soot) - len(wala))), count, row)
+                        if len(ranked) < top:
+                            heapq.heappush(ranked, item)
+                        elif item > ranked[0]:
+                            heapq.heapreplace(ranked, item)
+                self.profiler.record_collection('methods', methods)
+                print(f"\t\tCompared {summary['matched_vars']} matched variables in {time.time() - start} seconds")
+        except Error as e:
+            print(f"CrossIRDiff:diff: {e}")
+        finally:
+            soot_conn.close()
+            wala_conn.close()
+        variables = [row for _, _, row in sorted(ranked, key=lambda item: item[0], reverse=True)]
+        top_methods = heapq.nlargest(
+            top, ((name, m) for name, m in methods.items() if m['differing']),
+            key=lambda kv: (kv[1]['sym_diff'], abs(kv[1]['soot_objs'] - kv[1]['wala_objs'])),
+        )
+        return {
+            'summary': summary,
+            'variables': variables,
+            'methods': [{'method': name, **m} for name, m in top_methods],
+        }
+
+    def report(self, top: int = 20) -> Dict[str, Any]:
+        res = self.diff(top)
+        print('----------------------------- Cross-IR Points-to Diff -----------------------------')
+        print(f"benchmark = {self.benchmark}, analysis = {self.analysis}")
+        for k, v in res['summary'].items():
+            print(f'{k:25s}', f'{v:,}')
+        print("Methods where the representation most affects precision:")
+        for m in res['methods']:
+            print(f"    {m['method']}: {m['differing']}/{m['matched']} matched variables differ, "
+                  f"{m['soot_objs']} soot / {m['wala_objs']} wala objects, symmetric difference {m['sym_diff']}")
+        print("Variables:")
+        for v in res['variables']:
+            print(f"    {v['method']} {v['local']}: soot {v['soot_objs']} / wala {v['wala_objs']} objects, "
+                  f"{v['soot_only_objs']} soot-only, {v['wala_only_objs']} wala-only")
+        return res
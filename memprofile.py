@@ -0,0 +1,207 @@
+import os
+import resource
+import sqlite3
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Sized
+
+from utils import DATABASE_PATH
+
+MB = 1024 * 1024
+SIZE_SAMPLE = 100
+
+
+class MemoryLimitExceeded(Exception):
+    """Raised when a stage crosses the soft memory limit; the message is the diagnostic."""
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes."""
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return peak_rss()
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _object_size(obj: Any) -> int:
+    size = sys.getsizeof(obj)
+    if isinstance(obj, tuple):
+        size += sum(sys.getsizeof(o) for o in obj)
+    return size
+
+
+def estimate_size(collection: Sized) -> int:
+    """Approximate deep size of a collection of small tuples/strings, extrapolated from a sample."""
+    size = sys.getsizeof(collection)
+    n = len(collection)
+    if n == 0:
+        return size
+    if isinstance(collection, dict):
+        sample = list(islice(collection.items(), SIZE_SAMPLE))
+        per_item = sum(_object_size(k) + _object_size(v) for k, v in sample) / len(sample)
+    else:
+        sample = list(islice(collection, SIZE_SAMPLE))
+        per_item = sum(_object_size(x) for x in sample) / len(sample)
+    return size + int(per_item * n)
+
+
+def sqlite_usage(conn: Optional[sqlite3.Connection] = None) -> Dict[str, int]:
+    """Page cache, mmap and file size settings of a SQLite connection (a fresh one by default)."""
+    own = conn is None
+    if own:
+        conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        usage = {pragma: conn.execute(f'PRAGMA {pragma}').fetchone()[0]
+                 for pragma in ('page_size', 'page_count', 'cache_size', 'mmap_size')}
+    finally:
+        if own:
+            conn.close()
+    # a negative cache_size is in KiB, a positive one in pages
+    cache_size = usage['cache_size']
+    usage['cache_bytes'] = -cache_size * 1024 if cache_size < 0 else cache_size * usage['page_size']
+    usage['file_bytes'] = usage['page_count'] * usage['page_size']
+    return usage
+
+
+class StageRecord:
+    """
+    Time, memory and collection sizes of one profiled stage.
+
+    ``peak_rss`` is the largest resident set size sampled while the stage ran (at
+    its start and end and at every ``check``), so it reflects this stage only.
+    ``process_peak_rss`` is the kernel's high-water mark of the whole process when
+    the stage ended, which may come from an earlier stage.
+    """
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.seconds = 0.0
+        self.rss_before = 0
+        self.rss_after = 0
+        self.peak_rss = 0
+        self.process_peak_rss = 0
+        self.traced_peak: Optional[int] = None
+        self.top_allocations: List[str] = []
+        self.collections: Dict[str, Dict[str, int]] = {}
+        self.sqlite: Dict[str, int] = {}
+        self.aborted = False
+
+    def __repr__(self) -> str:
+        return f'StageRecord [name = {self.name}, seconds = {self.seconds:.2f}, peak_rss = {self.peak_rss // MB} MB]'
+
+    def rows(self) -> int:
+        """Size of the largest collection recorded in the stage."""
+        return max((c['len'] for c in self.collections.values()), default=0)
+
+    def report(self) -> str:
+        traced = f", traced peak {self.traced_peak / MB:.1f} MB" if self.traced_peak is not None else ""
+        lines = [
+            f"{self.name}{' (ABORTED)' if self.aborted else ''}: {self.seconds:.2f} s, "
+            f"rss {self.rss_before / MB:.1f} -> {self.rss_after / MB:.1f} MB, "
+            f"peak rss {self.peak_rss / MB:.1f} MB (process peak so far {self.process_peak_rss / MB:.1f} MB){traced}"
+        ]
+        for name, c in self.collections.items():
+            lines.append(f"    {name:30s} {c['len']:>12,} items  ~{c['bytes'] / MB:10.1f} MB")
+        if self.sqlite:
+            lines.append(f"    sqlite cache {self.sqlite['cache_bytes'] / MB:.1f} MB, "
+                         f"mmap {self.sqlite['mmap_size'] / MB:.1f} MB, file {self.sqlite['file_bytes'] / MB:.1f} MB")
+        lines.extend(f"    {a}" for a in self.top_allocations)
+        return '\n'.join(lines)
+
+
+class MemoryProfiler:
+    """
+    Per-stage memory instrumentation with an optional soft limit.
+
+    Parameters
+    ----------
+    soft_limit_mb : Optional[int]
+        Resident memory (MiB) above which the running stage is aborted with ``MemoryLimitExceeded``
+    trace : bool
+        Also record the tracemalloc peak and top allocation sites of every stage (slower)
+    top_allocations : int
+        Number of allocation sites listed per stage when tracing
+    """
+    def __init__(self, soft_limit_mb: Optional[int] = None, trace: bool = False, top_allocations: int = 5) -> None:
+        self.soft_limit = soft_limit_mb * MB if soft_limit_mb else None
+        self.trace = trace
+        self.top_allocations = top_allocations
+        self.stages: List[StageRecord] = []
+        self._current: Optional[StageRecord] = None
+        self._running: List[StageRecord] = []
+
+    def __repr__(self) -> str:
+        return f'MemoryProfiler [stages = {len(self.stages)}, soft_limit = {self.soft_limit}]'
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageRecord]:
+        record = StageRecord(name)
+        outer = self._current
+        self._current = record
+        self._running.append(record)
+        if self.trace:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        record.rss_before = record.peak_rss = current_rss()
+        start = time.time()
+        try:
+            self.check(name)
+            yield record
+        except MemoryLimitExceeded:
+            record.aborted = True
+            raise
+        finally:
+            record.seconds = time.time() - start
+            record.rss_after = current_rss()
+            self._sample(record.rss_after)
+            record.process_peak_rss = max(peak_rss(), record.rss_after)
+            if self.trace:
+                record.traced_peak = tracemalloc.get_traced_memory()[1]
+                stats = tracemalloc.take_snapshot().statistics('lineno')[:self.top_allocations]
+                record.top_allocations = [str(s) for s in stats]
+            self.stages.append(record)
+            self._running.pop()
+            self._current = outer
+
+    def _sample(self, rss: int) -> None:
+        for record in self._running:
+            record.peak_rss = max(record.peak_rss, rss)
+
+    def check(self, where: str) -> None:
+        """Sample resident memory for the running stages and abort them if it is above the soft limit."""
+        rss = current_rss()
+        self._sample(rss)
+        if self.soft_limit is not None and rss > self.soft_limit:
+            stage = self._current.name if self._current is not None else '<no stage>'
+            largest = ''
+            if self._current is not None and self._current.collections:
+                name, c = max(self._current.collections.items(), key=lambda kv: kv[1]['bytes'])
+                largest = f"; largest collection {name} with {c['len']:,} items (~{c['bytes'] / MB:.1f} MB)"
+            raise MemoryLimitExceeded(
+                f"stage {stage} at {where}: rss {rss / MB:.1f} MB exceeds soft limit "
+                f"{self.soft_limit / MB:.0f} MB{largest}"
+            )
+
+    def record_collection(self, name: str, collection: Sized) -> None:
+        """Record the length and approximate size of an intermediate collection, then check the soft limit."""
+        if self._current is not None:
+            self._current.collections[name] = {'len': len(collection), 'bytes': estimate_size(collection)}
+        self.check(name)
+
+    def record_sqlite(self, conn: Optional[sqlite3.Connection] = None) -> None:
+        """Record the SQLite cache and mmap usage in the running stage."""
+        if self._current is not None:
+            self._current.sqlite = sqlite_usage(conn)
+
+    def report(self) -> str:
+        return '\n'.join(s.report() for s in self.stages)
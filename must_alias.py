@@ -1,17 +1,103 @@
+import sqlite3
 import time
-from typing import Iterator, Set, Tuple
+from sqlite3 import Error
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 from collections import defaultdict
 
 from varpointstodb import VarPointsToTable
 from disjoint_set import DisjointSet
+from outofcore import MemoryBudget
+from pointsto_sets import ci_set_digest, iter_pointsto_sets, set_digest
+from projections import table_exists
+from memprofile import MemoryProfiler
+from utils import DATABASE_PATH
+
+SPILL_BATCH_SIZE = 50000
+PARTITIONS_TABLE = 'must_alias_partitions'
+
+
+def partition_table(benchmark: str, analysis: str, ir: str, refined_from: str = '') -> str:
+    """
+    Name of the table holding the persisted context-insensitive alias partition of an analysis.
+
+    A partition refined from a coarser analysis is stored apart from the one
+    computed from scratch, since they may differ.
+    """
+    suffix = f'_from_{refined_from}' if refined_from else ''
+    return f'must_alias_{benchmark}_{analysis}_{ir}{suffix}'
+
+
+def is_persisted(conn: sqlite3.Connection, table: str, refined_from: str = '') -> bool:
+    """Check that a partition table was completed, from its row in the registry written last."""
+    if not table_exists(conn, PARTITIONS_TABLE):
+        return False
+    query = f'SELECT 1 from {PARTITIONS_TABLE} where tableName = ? and refinedFrom = ?'
+    return conn.execute(query, (table, refined_from)).fetchone() is not None and table_exists(conn, table)
+
+
+class _PartitionWriter:
+    """
+    Batched writer of (classId, var) rows into a fresh partition table.
+
+    Rows are written under a temporary name, which replaces the partition and is
+    registered in one transaction on ``close``, so an interrupted run never leaves
+    an incomplete partition behind under the final name.
+    """
+    def __init__(self, conn: sqlite3.Connection, table: str) -> None:
+        self.conn = conn
+        self.table = table
+        self.new_table = f'{table}_new'
+        self.nb_classes = 0
+        self.rows: List[Tuple[int, str]] = []
+        conn.execute(f'DROP TABLE IF EXISTS {self.new_table}')
+        conn.execute(f'CREATE TABLE {self.new_table} (classId integer, var string)')
+
+    def add_class(self, variables: List[str]) -> None:
+        self.rows.extend((self.nb_classes, v) for v in variables)
+        self.nb_classes += 1
+        if len(self.rows) >= SPILL_BATCH_SIZE:
+            self.flush()
+
+    def add_member(self, class_id: int, var: str) -> None:
+        self.rows.append((class_id, var))
+        if len(self.rows) >= SPILL_BATCH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        self.conn.executemany(f'INSERT INTO {self.new_table} VALUES (?,?)', self.rows)
+        self.rows.clear()
+
+    def close(self, refined_from: str) -> None:
+        self.flush()
+        self.conn.commit()
+        self.conn.execute('BEGIN')
+        self.conn.execute(f'DROP TABLE IF EXISTS {self.table}')
+        self.conn.execute(f'ALTER TABLE {self.new_table} RENAME TO {self.table}')
+        self.conn.execute(f'CREATE INDEX {self.table}_classId ON {self.table} (classId)')
+        self.conn.execute(f'CREATE UNIQUE INDEX {self.table}_var ON {self.table} (var)')
+        self.conn.execute(f'CREATE TABLE IF NOT EXISTS {PARTITIONS_TABLE} (tableName string PRIMARY KEY, '
+                          f'refinedFrom string, nbClasses integer, created string)')
+        self.conn.execute(f'INSERT OR REPLACE INTO {PARTITIONS_TABLE} VALUES (?,?,?,?)',
+                          (self.table, refined_from, self.nb_classes, time.strftime('%Y-%m-%d %H:%M:%S')))
+        self.conn.commit()
 
 
 class MustAlias:
-    def __init__(self, benchmark: str, analysis: str, ir: str) -> None:
+    def __init__(
+        self,
+        benchmark: str,
+        analysis: str,
+        ir: str,
+        memory_budget: Optional[MemoryBudget] = None,
+        profiler: Optional[MemoryProfiler] = None,
+    ) -> None:
         self._bm = benchmark
         self._analysis = analysis
         self._ir = ir
+        self.memory_budget = memory_budget
+        self.profiler = profiler or MemoryProfiler()
         self.table = VarPointsToTable(benchmark, analysis, ir)
+        self.table.profiler = self.profiler
 
     def __repr__(self) -> str:
         return f"MustAlias (benchmark= {self._bm}, analysis= {self._analysis}, ir= {self._ir})"
@@ -20,19 +106,230 @@ class MustAlias:
         return self.__repr__()
 
     def compute_must_alias(self) -> Iterator[Set]:
-        pointsto_map = self.table.pointsto_map()
-        variables = pointsto_map.keys()
-        alias_sets = DisjointSet()
-        print(f"\t\t#Variables= {len(variables)}")
-
-        visited_heap_objects: dict = defaultdict()
-        for v_i in variables:
-            heap_objs = int(pointsto_map[v_i])
-            if heap_objs in visited_heap_objects.keys():
-                v_j = visited_heap_objects[heap_objs]
-                if not alias_sets.connected(v_i, v_j):
-                    alias_sets.union(v_i, v_j)
-            else:
-                alias_sets.find(v_i)
-            visited_heap_objects[heap_objs] = v_i
+        if self.table.has_pointsto_sets():
+            print("\t\tGrouping variables by hash-consed points-to set")
+            return self.table.pointsto_set_groups()
+        if self.memory_budget is not None and self.memory_budget.exceeded_by(len(self.table)):
+            print(f"\t\t{self.table.db} exceeds {self.memory_budget}; grouping out of core")
+            return self._compute_must_alias_out_of_core()
+        with self.profiler.stage(f'{self._ir}:must_alias'):
+            pointsto_map = self.table.pointsto_map()
+            self.profiler.record_collection('pointsto_map', pointsto_map)
+            variables = pointsto_map.keys()
+            alias_sets = DisjointSet()
+            print(f"\t\t#Variables= {len(variables)}")
+
+            visited_heap_objects: dict = defaultdict()
+            for v_i in variables:
+                heap_objs = int(pointsto_map[v_i])
+                if heap_objs in visited_heap_objects.keys():
+                    v_j = visited_heap_objects[heap_objs]
+                    if not alias_sets.connected(v_i, v_j):
+                        alias_sets.union(v_i, v_j)
+                else:
+                    alias_sets.find(v_i)
+                visited_heap_objects[heap_objs] = v_i
+            self.profiler.record_collection('visited_heap_objects', visited_heap_objects)
         return alias_sets.itersets()
+
+    def _compute_must_alias_out_of_core(self) -> Iterator[Set]:
+        """
+        Group variables with equal points-to sets without holding the map in memory.
+
+        Each variable's points-to set is streamed in sorted order and reduced to a
+        digest; (digest, variable) rows are spilled to a temporary table that
+        SQLite sorts externally, so groups come out one at a time.
+        """
+        start = time.time()
+        conn = self.memory_budget.connect()
+        conn.execute('CREATE TEMP TABLE alias_digests (digest blob, varCtx string, var string)')
+        batch: List[Tuple[bytes, str, str]] = []
+        for var, heap_objs in iter_pointsto_sets(conn.cursor(), self.table.db):
+            batch.append((set_digest(heap_objs), var[0], var[1]))
+            if len(batch) >= SPILL_BATCH_SIZE:
+                conn.executemany('INSERT INTO alias_digests VALUES (?,?,?)', batch)
+                batch.clear()
+        conn.executemany('INSERT INTO alias_digests VALUES (?,?,?)', batch)
+        print(f"\t\tSpilled points-to set digests in {time.time() - start} seconds")
+
+        current_digest = None
+        group: Set[Tuple[str, str]] = set()
+        for row in conn.execute('SELECT digest, varCtx, var from alias_digests order by digest'):
+            if row[0] != current_digest:
+                if group:
+                    yield group
+                current_digest = row[0]
+                group = set()
+            group.add((row[1], row[2]))
+        if group:
+            yield group
+        conn.close()
+
+    def _ci_pointsto_table(self) -> str:
+        """Table to read context-insensitive (var, heapObj) pairs from, indexed on var."""
+        if self.table.has_projections():
+            return self.table.ci_db
+        self.table.ensure_var_index()
+        return self.table.db
+
+    def partition_table(self, analysis: Optional[str] = None, refined_from: str = '') -> str:
+        return partition_table(self._bm, analysis or self._analysis, self._ir, refined_from)
+
+    def compute_ci_partition(self) -> int:
+        """
+        Partition the context-insensitive variables by their context-insensitive
+        points-to sets (heap objects of all contexts) and persist the partition.
+
+        Variables are streamed in order, so only one digest per distinct set is
+        held in memory. Heap contexts are dropped, so that partitions of analyses
+        with different context depths are comparable.
+
+        Returns
+        -------
+        int
+            Number of alias classes
+        """
+        conn = sqlite3.connect(DATABASE_PATH)
+        table = self.partition_table()
+        query = f'SELECT DISTINCT var, heapObj from {self._ci_pointsto_table()} order by var, heapObj'
+        try:
+            with self.profiler.stage(f'{self._ir}:ci_must_alias'):
+                start = time.time()
+                writer = _PartitionWriter(conn, table)
+                class_ids: Dict[bytes, int] = {}
+                current_var = None
+                heap_objs: List[str] = []
+                for var, heap_obj in conn.execute(query):
+                    if var != current_var:
+                        if current_var is not None:
+                            writer.add_member(class_ids.setdefault(ci_set_digest(heap_objs), len(class_ids)),
+                                              current_var)
+                        current_var = var
+                        heap_objs = []
+                    heap_objs.append(heap_obj)
+                if current_var is not None:
+                    writer.add_member(class_ids.setdefault(ci_set_digest(heap_objs), len(class_ids)), current_var)
+                self.profiler.record_collection('class_ids', class_ids)
+                writer.nb_classes = len(class_ids)
+                writer.close(refined_from='')
+                print(f"\t\tPersisted {writer.nb_classes} alias classes in {table} in {time.time() - start} seconds")
+                return writer.nb_classes
+        except Error as e:
+            print(f"MustAlias:compute_ci_partition: {e}")
+            return 0
+
+    def refine_partition(self, coarse_analysis: str) -> int:
+        """
+        Refine the persisted partition of a coarser analysis (e.g. 1cs for 2cs) with
+        the points-to sets of this analysis, and persist the result apart from the
+        partition computed from scratch (read it with ``ci_alias_classes(refined_from=...)``).
+
+        Only variables in non-singleton classes of the coarse partition are looked
+        up, and each class is split on its own by grouping its members on their
+        context-insensitive points-to sets in this analysis. Classes are never
+        merged: two variables end up together when their sets are equal in both
+        analyses. This is the partition ``compute_ci_partition`` would return
+        whenever the finer partition refines the coarser one, which deeper contexts
+        usually (but not necessarily) yield. Variables missing from this analysis
+        are left out, and variables missing from the coarse partition are grouped
+        among themselves as if they formed one more coarse class.
+
+        Parameters
+        ----------
+        coarse_analysis : str
+            Analysis whose partition is refined; it is computed and persisted first if missing
+
+        Returns
+        -------
+        int
+            Number of alias classes
+        """
+        if coarse_analysis == self._analysis:
+            print(f"MustAlias:refine_partition: cannot refine the partition of {coarse_analysis} with itself")
+            return 0
+        coarse = self.partition_table(coarse_analysis)
+        table = self.partition_table(refined_from=coarse_analysis)
+        pointsto = self._ci_pointsto_table()
+        conn = sqlite3.connect(DATABASE_PATH)
+        try:
+            if not is_persisted(conn, coarse):
+                print(f"\t\tNo persisted partition {coarse}; computing it")
+                MustAlias(self._bm, coarse_analysis, self._ir, profiler=self.profiler).compute_ci_partition()
+            with self.profiler.stage(f'{self._ir}:refine_must_alias'):
+                start = time.time()
+                conn.execute('DROP TABLE IF EXISTS temp.multi_classes')
+                conn.execute(f'CREATE TEMP TABLE multi_classes AS SELECT classId from {coarse} '
+                             f'group by classId having count(*) > 1')
+                writer = _PartitionWriter(conn, table)
+                singletons = (f'SELECT c.var from {coarse} c '
+                              f'where c.classId not in (SELECT classId from multi_classes) '
+                              f'and EXISTS (SELECT 1 from {pointsto} p where p.var = c.var) order by c.classId')
+                for (var,) in conn.execute(singletons):
+                    writer.add_class([var])
+                nb_singletons = writer.nb_classes
+                candidates = (
+                    f'SELECT DISTINCT c.classId, c.var, p.heapObj '
+                    f'from {coarse} c JOIN {pointsto} p on p.var = c.var '
+                    f'where c.classId in (SELECT classId from multi_classes) '
+                    f'UNION ALL '
+                    f'SELECT DISTINCT -1, p.var, p.heapObj from {pointsto} p '
+                    f'where NOT EXISTS (SELECT 1 from {coarse} c where c.var = p.var) '
+                    f'order by 1, 2, 3'
+                )
+                current_class, current_var = None, None
+                heap_objs: List[str] = []
+                sub_classes: Dict[bytes, List[str]] = {}
+
+                def split_class() -> None:
+                    for sub_class in sub_classes.values():
+                        writer.add_class(sub_class)
+                    sub_classes.clear()
+
+                for class_id, var, heap_obj in conn.execute(candidates):
+                    if var != current_var:
+                        if current_var is not None:
+                            sub_classes.setdefault(ci_set_digest(heap_objs), []).append(current_var)
+                        if class_id != current_class:
+                            split_class()
+                            current_class = class_id
+                        current_var = var
+                        heap_objs = []
+                    heap_objs.append(heap_obj)
+                if current_var is not None:
+                    sub_classes.setdefault(ci_set_digest(heap_objs), []).append(current_var)
+                split_class()
+                writer.close(refined_from=coarse_analysis)
+                print(f"\t\tRefined {coarse} into {writer.nb_classes} alias classes in {table} "
+                      f"({nb_singletons} singletons kept) in {time.time() - start} seconds")
+                return writer.nb_classes
+        except Error as e:
+            print(f"MustAlias:refine_partition: {e}")
+            return 0
+
+    def ci_alias_classes(self, analysis: Optional[str] = None, refined_from: str = '') -> Iterator[Set[str]]:
+        """
+        Stream the classes of a persisted context-insensitive partition.
+
+        The partition computed from scratch is read unless ``refined_from`` names the
+        coarser analysis a refined one was built from.
+        """
+        conn = sqlite3.connect(DATABASE_PATH)
+        table = self.partition_table(analysis, refined_from)
+        query = f'SELECT classId, var from {table} order by classId'
+        current_class = None
+        group: Set[str] = set()
+        try:
+            if not is_persisted(conn, table, refined_from):
+                print(f"MustAlias:ci_alias_classes: no complete partition {table}")
+                return
+            for row in conn.execute(query):
+                if row[0] != current_class:
+                    if group:
+                        yield group
+                    current_class = row[0]
+                    group = set()
+                group.add(row[1])
+        except Error as e:
+            print(f"MustAlias:ci_alias_classes: {e}")
+        if group:
+            yield group
@@ -0,0 +1,94 @@
+import os
+import sqlite3
+from typing import Optional
+
+from utils import DATABASE_PATH
+
+# Rough in-memory footprint of one points-to row held as a Python tuple of strings.
+BYTES_PER_ROW = 400
+DEFAULT_MEMORY_BUDGET_MB = 4096
+
+
+# Spill directory set for this process, see ``set_spill_dir``.
+_spill_dir: Optional[str] = None
+
+
+def _quote(value: str) -> str:
+    """SQL string literal of ``value``; pragmas do not accept bound parameters."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+def set_spill_dir(conn: sqlite3.Connection, spill_dir: str) -> None:
+    """
+    Make SQLite write the temporary files of this process to ``spill_dir``.
+
+    SQLite reads ``SQLITE_TMPDIR`` once, when the ``sqlite3`` module is imported,
+    so a directory chosen on the command line can only be set with the deprecated
+    ``PRAGMA temp_store_directory``. That setting is global: it applies to every
+    connection of the process, so only the first spill directory is used and
+    later, different ones are reported and ignored. Exporting ``SQLITE_TMPDIR``
+    before starting pointeval has the same effect without the pragma.
+    """
+    global _spill_dir
+    if _spill_dir is not None:
+        if os.path.abspath(spill_dir) != _spill_dir:
+            print(f"set_spill_dir: SQLite already spills to {_spill_dir}; ignoring {spill_dir}")
+        return
+    _spill_dir = os.path.abspath(spill_dir)
+    os.makedirs(_spill_dir, exist_ok=True)
+    conn.execute(f'PRAGMA temp_store_directory = {_quote(_spill_dir)}')
+    if not conn.execute('PRAGMA temp_store_directory').fetchone():
+        # SQLite built without deprecated pragmas
+        print(f"set_spill_dir: this SQLite cannot change its temporary directory; "
+              f"export SQLITE_TMPDIR={_spill_dir} instead")
+
+
+class MemoryBudget:
+    """
+    RAM budget for the out-of-core execution mode.
+
+    When a table is estimated not to fit in the budget, intermediate sets and
+    groupings are kept in SQLite temporary tables instead of Python collections.
+    SQLite then sorts, groups and joins them with its own external algorithms,
+    spilling to ``spill_dir`` (or SQLite's default temporary directory).
+
+    Parameters
+    ----------
+    megabytes : int
+        Memory budget in MiB
+    spill_dir : Optional[str]
+        Directory for SQLite temporary files
+    bytes_per_row : int
+        Estimated in-memory size of one points-to row
+    """
+    def __init__(self, megabytes: int, spill_dir: Optional[str] = None, bytes_per_row: int = BYTES_PER_ROW) -> None:
+        self.megabytes = megabytes
+        self.spill_dir = spill_dir
+        self.bytes_per_row = bytes_per_row
+
+    def __repr__(self) -> str:
+        return f'MemoryBudget [megabytes = {self.megabytes}, spill_dir = {self.spill_dir}]'
+
+    @property
+    def nbytes(self) -> int:
+        return self.megabytes * 1024 * 1024
+
+    def exceeded_by(self, nb_rows: int) -> bool:
+        """Check whether materializing ``nb_rows`` points-to rows in Python would exceed the budget."""
+        return nb_rows * self.bytes_per_row > self.nbytes
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Open a database connection whose page cache is bounded by the budget.
+
+        Temporary tables and sorter runs are written to disk rather than memory,
+        so only the page cache (a quarter of the budget) is resident.
+
+        See ``set_spill_dir`` for where the temporary files go.
+        """
+        conn = sqlite3.connect(DATABASE_PATH)
+        if self.spill_dir is not None:
+            set_spill_dir(conn, self.spill_dir)
+        conn.execute('PRAGMA temp_store = FILE')
+        conn.execute(f'PRAGMA cache_size = -{max(self.nbytes // 4 // 1024, 2048)}')
+        return conn
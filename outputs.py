@@ -0,0 +1,283 @@
+"""
+Buffered, optionally compressed and asynchronous writers for heap dumps and logs.
+
+Records (tuples of strings) are written either as text lines or in a compact
+binary format where every distinct string is stored once and later occurrences
+are replaced by its index. Output is encoded into large buffers, and with
+``asynchronous`` the compression and file writes of full buffers happen in a
+background thread while the caller keeps computing.
+"""
+import gzip
+import queue
+import threading
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+BUFFER_SIZE = 1 << 20
+BINARY_MAGIC = b'PEVREC1\n'
+COMPRESSIONS = ('gz', 'zst')
+# Buffers queued for the background writer before ``write`` blocks.
+MAX_PENDING_BUFFERS = 8
+
+
+def _zstd_module() -> Any:
+    try:
+        from compression import zstd  # Python 3.14+
+        return zstd
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        raise ImportError("zstd output needs Python 3.14 or the zstandard package "
+                          "(pip install pointeval[zstd])") from None
+
+
+def _open_output(path: Path, compression: Optional[str], stack: ExitStack) -> BinaryIO:
+    if compression is None:
+        return stack.enter_context(open(path, 'wb'))
+    if compression == 'gz':
+        return stack.enter_context(gzip.open(path, 'wb', compresslevel=6))
+    if compression == 'zst':
+        zstd = _zstd_module()
+        if hasattr(zstd, 'open'):
+            return stack.enter_context(zstd.open(path, 'wb'))
+        raw = stack.enter_context(open(path, 'wb'))
+        return stack.enter_context(zstd.ZstdCompressor().stream_writer(raw))
+    raise ValueError(f"unknown compression {compression}, expected one of {COMPRESSIONS}")
+
+
+def _open_input(path: Path, stack: ExitStack) -> BinaryIO:
+    if path.suffix == '.gz':
+        return stack.enter_context(gzip.open(path, 'rb'))
+    if path.suffix == '.zst':
+        zstd = _zstd_module()
+        if hasattr(zstd, 'open'):
+            return stack.enter_context(zstd.open(path, 'rb'))
+        raw = stack.enter_context(open(path, 'rb'))
+        return stack.enter_context(zstd.ZstdDecompressor().stream_reader(raw))
+    return stack.enter_context(open(path, 'rb'))
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _read_varint(fh: BinaryIO) -> Optional[int]:
+    value = shift = 0
+    while True:
+        b = fh.read(1)
+        if not b:
+            if shift:
+                raise EOFError("truncated record file")
+            return None
+        value |= (b[0] & 0x7f) << shift
+        if not b[0] & 0x80:
+            return value
+        shift += 7
+
+
+class RecordWriter:
+    """
+    Streaming writer of records to a text or binary, optionally compressed file.
+
+    Parameters
+    ----------
+    path : str
+        Output file; ``.gz``/``.zst`` is appended when compressing
+    binary : bool
+        Write the string-interned binary format read back by ``iter_records``
+        instead of one ``text_format(record)`` line per record
+    compression : Optional[str]
+        ``gz``, ``zst`` or None
+    asynchronous : bool
+        Compress and write full buffers in a background thread
+    distinct : bool
+        Drop records already written (pass False for input that is already duplicate-free)
+    text_format : Callable[[Tuple], str]
+        Line of a record in text mode
+    buffer_size : int
+        Bytes encoded before a buffer is handed to the file
+    """
+    def __init__(
+        self,
+        path: str,
+        binary: bool = False,
+        compression: Optional[str] = None,
+        asynchronous: bool = False,
+        distinct: bool = False,
+        text_format: Callable[[Tuple], str] = str,
+        buffer_size: int = BUFFER_SIZE,
+    ) -> None:
+        self.path = Path(f'{path}.{compression}' if compression else path)
+        self.binary = binary
+        self.distinct = distinct
+        self.text_format = text_format
+        self.buffer_size = buffer_size
+        self.nb_records = 0
+        # set by ``finish``, after which no record may be written
+        self.finished = False
+        self._seen: set = set()
+        self._strings: Dict[str, int] = {}
+        self._buffer = bytearray(BINARY_MAGIC if binary else b'')
+        self._stack = ExitStack()
+        self._fh = _open_output(self.path, compression, self._stack)
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+        if asynchronous:
+            self._queue = queue.Queue(MAX_PENDING_BUFFERS)
+            self._thread = threading.Thread(target=self._drain, name=f'RecordWriter({self.path.name})', daemon=True)
+            self._thread.start()
+
+    def __repr__(self) -> str:
+        return f'RecordWriter [path = {self.path}, records = {self.nb_records}]'
+
+    def __enter__(self) -> 'RecordWriter':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def _drain(self) -> None:
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            if self._error is None:
+                try:
+                    self._fh.write(chunk)
+                except BaseException as e:  # reported by close()
+                    self._error = e
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        chunk = bytes(self._buffer)
+        self._buffer.clear()
+        if self._queue is not None:
+            self._queue.put(chunk)
+        else:
+            self._fh.write(chunk)
+
+    def _encode(self, record: Tuple) -> None:
+        if not self.binary:
+            self._buffer += f'{self.text_format(record)}\n'.encode()
+            return
+        buffer = self._buffer
+        buffer += _varint(len(record))
+        for field in record:
+            field = str(field)
+            index = self._strings.get(field)
+            if index is None:
+                self._strings[field] = len(self._strings)
+                data = field.encode()
+                buffer += b'\x00' + _varint(len(data)) + data
+            else:
+                buffer += _varint(index + 1)
+
+    def write(self, record: Tuple) -> None:
+        if self.finished:
+            raise ValueError(f"{self.path} is finished")
+        if self.distinct:
+            if record in self._seen:
+                return
+            self._seen.add(record)
+        self._encode(record)
+        self.nb_records += 1
+        if len(self._buffer) >= self.buffer_size:
+            self._flush()
+
+    def write_all(self, records: Iterable[Tuple]) -> int:
+        for record in records:
+            self.write(record)
+        return self.nb_records
+
+    def finish(self) -> None:
+        """
+        Hand the last buffer over and free the records and strings kept to write the next ones.
+
+        A background writer goes on writing the queued buffers until ``close``.
+        """
+        if self.finished:
+            return
+        self.finished = True
+        self._flush()
+        self._seen.clear()
+        self._strings.clear()
+        if self._thread is not None:
+            self._queue.put(None)
+
+    def close(self) -> None:
+        """Finish, wait for the background writer and close the file."""
+        if self._fh is None:
+            return
+        self.finish()
+        if self._thread is not None:
+            self._thread.join()
+        self._stack.close()
+        self._fh = None
+        if self._error is not None:
+            raise self._error
+
+
+def iter_records(path: str) -> Iterator[Tuple[str, ...]]:
+    """Read back the records of a binary file written by ``RecordWriter``."""
+    with ExitStack() as stack:
+        fh = _open_input(Path(path), stack)
+        if fh.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f"{path} is not a binary record file")
+        strings: List[str] = []
+        while True:
+            nb_fields = _read_varint(fh)
+            if nb_fields is None:
+                return
+            record = []
+            for _ in range(nb_fields):
+                tag = _read_varint(fh)
+                if tag == 0:
+                    field = fh.read(_read_varint(fh)).decode()
+                    strings.append(field)
+                else:
+                    field = strings[tag - 1]
+                record.append(field)
+            yield tuple(record)
+
+
+class OutputOptions:
+    """
+    Format of the heap dumps and logs written while computing precision.
+
+    Parameters
+    ----------
+    binary : bool
+        Use the binary record format
+    compression : Optional[str]
+        ``gz``, ``zst`` or None
+    asynchronous : bool
+        Compress and write in a background thread; pending writers are closed by the caller
+    """
+    def __init__(self, binary: bool = False, compression: Optional[str] = None, asynchronous: bool = False) -> None:
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError(f"unknown compression {compression}, expected one of {COMPRESSIONS}")
+        self.binary = binary
+        self.compression = compression
+        self.asynchronous = asynchronous
+
+    def __repr__(self) -> str:
+        return (f'OutputOptions [binary = {self.binary}, compression = {self.compression}, '
+                f'asynchronous = {self.asynchronous}]')
+
+    def writer(self, path: str, **kwargs: Any) -> RecordWriter:
+        return RecordWriter(path, binary=self.binary, compression=self.compression,
+                            asynchronous=self.asynchronous, **kwargs)
@@ -0,0 +1,259 @@
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+from sqlite3 import Error
+from typing import Any, Dict, List, Optional, Tuple
+
+from facts import load_stamp
+from memprofile import MemoryProfiler
+from utils import DATABASE_PATH, IRS
+
+HISTORY_PATH = Path(".") / "db" / "perf_history.db"
+# Relative increase over the base run above which a stage is reported as a regression.
+DEFAULT_THRESHOLD = 0.2
+# Stages faster than this in both runs are too noisy to compare.
+MIN_SECONDS = 1.0
+
+
+def split_stage_name(name: str) -> Tuple[str, str]:
+    """Split a profiler stage name such as ``soot:ir_precision`` into (ir, stage); shared stages have no IR."""
+    ir, sep, stage = name.partition(':')
+    return (ir, stage) if sep and ir in IRS else ('', name)
+
+
+def table_fingerprint(conn: sqlite3.Connection, table: str) -> Tuple[int, str]:
+    """
+    Identify the contents of a table.
+
+    Tables loaded by ``facts.load_relation`` or ``sharedfacts.load_relation_shared``
+    are identified by the stamp of their last load, without reading them. Other
+    tables are digested row by row; the digest adds up a hash of every row, so it
+    does not depend on the order SQLite returns them in.
+
+    Returns
+    -------
+    Tuple[int, str]
+        Number of rows and a short hex digest, or (0, '') when the table does not exist
+    """
+    if not conn.execute(f'PRAGMA table_info({table})').fetchall():
+        return 0, ''
+    stamp = load_stamp(conn, table)
+    if stamp is not None:
+        return stamp
+    nb_rows = 0
+    total = 0
+    for row in conn.execute(f'SELECT * from {table}'):
+        nb_rows += 1
+        total += int.from_bytes(hashlib.sha1(repr(row).encode()).digest()[:8], 'big')
+    return nb_rows, f'{total % (1 << 64):016x}'
+
+
+def input_tables(benchmark: str, analysis: str) -> List[Tuple[str, str]]:
+    """(IR, table) of the points-to and virtual call tables a precision run of a benchmark reads."""
+    return [(ir, table) for ir in IRS
+            for table in (f'{benchmark}_{analysis}_{ir}', f'virtualcall_var_{benchmark}_{analysis}_{ir}')]
+
+
+def inputs_fingerprint(benchmark: str, analysis: str) -> str:
+    """Combined digest of the fingerprints of every input table of a benchmark, or '' if they cannot be read."""
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        fingerprints = [(table,) + table_fingerprint(conn, table) for _, table in input_tables(benchmark, analysis)]
+    except Error as e:
+        print(f"inputs_fingerprint: {e}")
+        return ''
+    return hashlib.sha1(repr(fingerprints).encode()).hexdigest()[:16]
+
+
+class PerfHistory:
+    """
+    Append-only store of per-stage timings and memory of precision runs.
+
+    Every run records, per benchmark and IR, the time, largest intermediate
+    collection and peak memory of each profiled stage, together with the
+    fingerprints of the input tables. ``compare`` then tells regressions caused
+    by the code (same fingerprints) from those caused by new data.
+
+    Parameters
+    ----------
+    path : Path
+        SQLite file holding the history
+    """
+    def __init__(self, path: Path = HISTORY_PATH) -> None:
+        self.path = path
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS runs (runId integer PRIMARY KEY AUTOINCREMENT, '
+                         'started string, analysis string, label string, options string)')
+            conn.execute('CREATE TABLE IF NOT EXISTS stages (runId integer, benchmark string, ir string, '
+                         'stage string, seconds real, nbRows integer, peakRss integer, tracedPeak integer, '
+                         'aborted integer)')
+            conn.execute('CREATE TABLE IF NOT EXISTS fingerprints (runId integer, benchmark string, ir string, '
+                         'tableName string, nbRows integer, fingerprint string)')
+            conn.execute('CREATE INDEX IF NOT EXISTS stages_runId ON stages (runId)')
+            conn.execute('CREATE INDEX IF NOT EXISTS fingerprints_runId ON fingerprints (runId)')
+            conn.commit()
+        except Error as e:
+            print(f"PerfHistory: {e}")
+
+    def __repr__(self) -> str:
+        return f'PerfHistory [path = {self.path}]'
+
+    def start_run(self, analysis: str, label: str = '', options: Optional[Dict[str, Any]] = None) -> int:
+        """Register a new run and return its ID."""
+        conn = sqlite3.connect(self.path)
+        try:
+            cur = conn.execute('INSERT INTO runs (started, analysis, label, options) VALUES (?,?,?,?)',
+                               (time.strftime('%Y-%m-%d %H:%M:%S'), analysis, label, repr(options or {})))
+            conn.commit()
+            return cur.lastrowid
+        except Error as e:
+            print(f"PerfHistory:start_run: {e}")
+            return 0
+
+    def record_stages(self, run_id: int, benchmark: str, profiler: MemoryProfiler) -> None:
+        """Append the stages recorded by the profiler of one benchmark."""
+        rows = []
+        for s in profiler.stages:
+            ir, stage = split_stage_name(s.name)
+            rows.append((run_id, benchmark, ir, stage, s.seconds, s.rows(), s.peak_rss, s.traced_peak, s.aborted))
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.executemany('INSERT INTO stages VALUES (?,?,?,?,?,?,?,?,?)', rows)
+            conn.commit()
+        except Error as e:
+            print(f"PerfHistory:record_stages: {e}")
+
+    def record_fingerprints(self, run_id: int, benchmark: str, analysis: str) -> None:
+        """Append the fingerprints of the points-to and virtual call tables of one benchmark."""
+        rows = []
+        conn = sqlite3.connect(DATABASE_PATH)
+        try:
+            for ir, table in input_tables(benchmark, analysis):
+                nb_rows, fingerprint = table_fingerprint(conn, table)
+                rows.append((run_id, benchmark, ir, table, nb_rows, fingerprint))
+        except Error as e:
+            print(f"PerfHistory:record_fingerprints: {e}")
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.executemany('INSERT INTO fingerprints VALUES (?,?,?,?,?,?)', rows)
+            conn.commit()
+        except Error as e:
+            print(f"PerfHistory:record_fingerprints: {e}")
+
+    def runs(self, analysis: Optional[str] = None) -> List[Dict[str, Any]]:
+        """List the recorded runs, oldest first, optionally for one analysis."""
+        conn = sqlite3.connect(self.path)
+        query = ('SELECT r.runId, r.started, r.analysis, r.label, count(DISTINCT s.benchmark), total(s.seconds) '
+                 'from runs r LEFT JOIN stages s on s.runId = r.runId')
+        params: Tuple[str, ...] = ()
+        if analysis is not None:
+            query += ' where r.analysis = ?'
+            params = (analysis,)
+        query += ' group by r.runId order by r.runId'
+        try:
+            return [{'run': r[0], 'started': r[1], 'analysis': r[2], 'label': r[3], 'benchmarks': r[4],
+                     'seconds': r[5]} for r in conn.execute(query, params)]
+        except Error as e:
+            print(f"PerfHistory:runs: {e}")
+            return []
+
+    def latest_run(self, analysis: Optional[str] = None) -> Optional[int]:
+        runs = self.runs(analysis)
+        return runs[-1]['run'] if runs else None
+
+    def run_analysis(self, run_id: int) -> Optional[str]:
+        conn = sqlite3.connect(self.path)
+        try:
+            row = conn.execute('SELECT analysis from runs where runId = ?', (run_id,)).fetchone()
+            return row[0] if row else None
+        except Error as e:
+            print(f"PerfHistory:run_analysis: {e}")
+            return None
+
+    def stage_metrics(self, run_id: int) -> Dict[Tuple[str, str, str], Tuple[float, int, int, Optional[int]]]:
+        """(seconds, rows, peak rss, traced peak) of every completed (benchmark, ir, stage) of a run."""
+        conn = sqlite3.connect(self.path)
+        query = ('SELECT benchmark, ir, stage, total(seconds), max(nbRows), max(peakRss), max(tracedPeak) '
+                 'from stages where runId = ? and aborted = 0 group by benchmark, ir, stage')
+        try:
+            return {(r[0], r[1], r[2]): (r[3], r[4], r[5], r[6]) for r in conn.execute(query, (run_id,))}
+        except Error as e:
+            print(f"PerfHistory:stage_metrics: {e}")
+            return {}
+
+    def fingerprints(self, run_id: int) -> Dict[Tuple[str, str], Tuple[str, ...]]:
+        """Fingerprints of the input tables of every (benchmark, ir) of a run."""
+        conn = sqlite3.connect(self.path)
+        query = 'SELECT benchmark, ir, fingerprint from fingerprints where runId = ? order by tableName'
+        res: Dict[Tuple[str, str], Tuple[str, ...]] = {}
+        try:
+            for r in conn.execute(query, (run_id,)):
+                res[(r[0], r[1])] = res.get((r[0], r[1]), ()) + (r[2],)
+            return res
+        except Error as e:
+            print(f"PerfHistory:fingerprints: {e}")
+            return {}
+
+    def compare(
+        self,
+        base_run: int,
+        run: int,
+        threshold: float = DEFAULT_THRESHOLD,
+        memory_threshold: Optional[float] = None,
+        min_seconds: float = MIN_SECONDS,
+    ) -> List[Dict[str, Any]]:
+        """
+        Find the stages of ``run`` whose time or peak memory regressed against ``base_run``.
+
+        Parameters
+        ----------
+        base_run : int
+            ID of the reference run
+        run : int
+            ID of the run to check
+        threshold : float
+            Relative time increase above which a stage is reported (0.2 = 20% slower)
+        memory_threshold : Optional[float]
+            Relative peak memory increase above which a stage is reported (``threshold`` by default)
+        min_seconds : float
+            Stages faster than this in both runs are not compared on time
+
+        Returns
+        -------
+        List[Dict[str, Any]]
+            One entry per regressed metric, largest ratio first. ``data_changed`` tells
+            whether the input table fingerprints differ between the two runs, i.e.
+            whether the regression may come from the data rather than the code.
+        """
+        if memory_threshold is None:
+            memory_threshold = threshold
+        base, current = self.stage_metrics(base_run), self.stage_metrics(run)
+        base_fps, current_fps = self.fingerprints(base_run), self.fingerprints(run)
+        regressions = []
+        for key in sorted(base.keys() & current.keys()):
+            benchmark, ir, stage = key
+            base_seconds, base_rows, base_rss, base_traced = base[key]
+            seconds, rows, rss, traced = current[key]
+            if ir:
+                data_changed = base_fps.get((benchmark, ir)) != current_fps.get((benchmark, ir))
+            else:
+                data_changed = any(base_fps.get((benchmark, i)) != current_fps.get((benchmark, i)) for i in IRS)
+            # the traced peak only counts what the stage allocated, whereas the RSS sampled during
+            # a stage also includes the memory earlier stages still hold
+            if base_traced is not None and traced is not None:
+                checks = [('traced_peak', base_traced, traced, memory_threshold)]
+            else:
+                checks = [('peak_rss', base_rss, rss, memory_threshold)]
+            if max(base_seconds, seconds) >= min_seconds:
+                checks.append(('seconds', base_seconds, seconds, threshold))
+            for metric, before, after, limit in checks:
+                if before and after > before * (1 + limit):
+                    regressions.append({
+                        'benchmark': benchmark, 'ir': ir, 'stage': stage, 'metric': metric,
+                        'base': before, 'current': after, 'ratio': after / before,
+                        'base_rows': base_rows, 'rows': rows, 'data_changed': data_changed,
+                    })
+        regressions.sort(key=lambda r: r['ratio'], reverse=True)
+        return regressions
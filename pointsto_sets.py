@@ -0,0 +1,141 @@
+import hashlib
+import sqlite3
+import time
+from sqlite3 import Error
+from typing import Dict, Iterator, List, Tuple
+
+INSERT_BATCH_SIZE = 50000
+
+
+def sets_table(table: str) -> str:
+    """Name of the table holding each distinct points-to set once, keyed by set ID."""
+    return f'{table}_pts_sets'
+
+
+def var_sets_table(table: str) -> str:
+    """Name of the table mapping every (varCtx, var) pair to its points-to set ID."""
+    return f'{table}_var_sets'
+
+
+def drop_pointsto_sets(conn: sqlite3.Connection, table: str) -> None:
+    """
+    Drop the points-to sets of a table whose rows change.
+
+    ``VarPointsToTable`` answers from them whenever they exist, so they must not
+    outlive the rows they were built from.
+    """
+    for name in (sets_table(table), var_sets_table(table)):
+        conn.execute(f'DROP TABLE IF EXISTS {name}')
+
+
+def set_digest(heap_objs: List[Tuple[str, str]]) -> bytes:
+    """Digest of a sorted, duplicate-free list of (heapCtx, heapObj) pairs."""
+    h = hashlib.sha1()
+    for heap_ctx, heap_obj in heap_objs:
+        h.update(heap_ctx.encode())
+        h.update(b'\x00')
+        h.update(heap_obj.encode())
+        h.update(b'\x01')
+    return h.digest()
+
+
+def ci_set_digest(heap_objs: List[str]) -> bytes:
+    """Digest of a sorted, duplicate-free list of context-insensitive heap objects."""
+    h = hashlib.sha1()
+    for heap_obj in heap_objs:
+        h.update(heap_obj.encode())
+        h.update(b'\x01')
+    return h.digest()
+
+
+def iter_pointsto_sets(
+    cursor: sqlite3.Cursor,
+    table: str,
+) -> Iterator[Tuple[Tuple[str, str], List[Tuple[str, str]]]]:
+    """
+    Stream the points-to set of every variable of a table.
+
+    Rows are read ordered by variable (SQLite sorts on disk when needed), so only
+    one variable's set is held in memory at a time.
+
+    Yields
+    ------
+    Tuple[Tuple[str, str], List[Tuple[str, str]]]
+        (varCtx, var) pair and its sorted, duplicate-free (heapCtx, heapObj) pairs
+    """
+    query = (
+        f'SELECT varCtx, var, heapCtx, heapObj from {table} '
+        f'order by var asc, varCtx asc, heapCtx asc, heapObj asc'
+    )
+    current_var = None
+    current_heaps: List[Tuple[str, str]] = []
+    for row in cursor.execute(query):
+        var = (row[0], row[1])
+        heap = (row[2], row[3])
+        if var != current_var:
+            if current_var is not None:
+                yield current_var, current_heaps
+            current_var = var
+            current_heaps = []
+        if not current_heaps or current_heaps[-1] != heap:
+            current_heaps.append(heap)
+    if current_var is not None:
+        yield current_var, current_heaps
+
+
+def build_pointsto_sets(conn: sqlite3.Connection, table: str) -> None:
+    """
+    Hash-cons the points-to sets of a table.
+
+    The table is streamed ordered by variable, so each variable's points-to set
+    arrives contiguously and in canonical order. Every distinct set is written
+    once to ``<table>_pts_sets`` and each variable is mapped to its set ID in
+    ``<table>_var_sets``. Only a digest per distinct set is kept in memory.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Connection to the points-to database
+    table : str
+        Name of the context-sensitive points-to table
+    """
+    pts_sets = sets_table(table)
+    var_sets = var_sets_table(table)
+    start = time.time()
+    cur = conn.cursor()
+    try:
+        cur.execute(f'DROP TABLE IF EXISTS {pts_sets}')
+        cur.execute(f'DROP TABLE IF EXISTS {var_sets}')
+        cur.execute(f'CREATE TABLE {pts_sets} (setId integer, heapCtx string, heapObj string)')
+        cur.execute(f'CREATE TABLE {var_sets} (varCtx string, var string, setId integer)')
+
+        set_ids: Dict[bytes, int] = {}
+        set_rows: List[Tuple[int, str, str]] = []
+        var_rows: List[Tuple[str, str, int]] = []
+
+        def intern(var: Tuple[str, str], heap_objs: List[Tuple[str, str]]) -> None:
+            digest = set_digest(heap_objs)
+            set_id = set_ids.get(digest)
+            if set_id is None:
+                set_id = len(set_ids)
+                set_ids[digest] = set_id
+                set_rows.extend((set_id, h[0], h[1]) for h in heap_objs)
+            var_rows.append((var[0], var[1], set_id))
+            if len(var_rows) >= INSERT_BATCH_SIZE:
+                conn.executemany(f'INSERT INTO {pts_sets} VALUES (?,?,?)', set_rows)
+                conn.executemany(f'INSERT INTO {var_sets} VALUES (?,?,?)', var_rows)
+                set_rows.clear()
+                var_rows.clear()
+
+        for var, heap_objs in iter_pointsto_sets(conn.cursor(), table):
+            intern(var, heap_objs)
+        conn.executemany(f'INSERT INTO {pts_sets} VALUES (?,?,?)', set_rows)
+        conn.executemany(f'INSERT INTO {var_sets} VALUES (?,?,?)', var_rows)
+
+        cur.execute(f'CREATE INDEX {pts_sets}_setId ON {pts_sets} (setId)')
+        cur.execute(f'CREATE INDEX {var_sets}_var ON {var_sets} (var, varCtx)')
+        cur.execute(f'CREATE INDEX {var_sets}_setId ON {var_sets} (setId)')
+        conn.commit()
+        print(f'Hash-consed {len(set_ids)} distinct points-to sets for {table} in {time.time() - start} seconds')
+    except Error as e:
+        print(f"build_pointsto_sets: {e}")
@@ -1,49 +1,141 @@
 import argparse
 import sys
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Optional, TextIO, Tuple
 
+from checkpoint import SERIES, Checkpoint
 from computeprecision import ComputePrecision
-from utils import pretty_print_csv, pretty_print_latex, pretty_print_stats, print_wilcoxon_results
-
-BENCHMARKS = [
-    'avrora', 'batik', 'eclipse', 'h2', 'jython', 'lusearch', 'luindex',
-    'pmd', 'sunflow', 'tradebeans', 'xalan'
-]
-
-
-def runner_single_benchmark(analysis: str, benchmark: List[str]) -> None:
+from memprofile import MemoryLimitExceeded, MemoryProfiler
+from outofcore import DEFAULT_MEMORY_BUDGET_MB, MemoryBudget
+from outputs import COMPRESSIONS, OutputOptions
+from perfhistory import PerfHistory, inputs_fingerprint
+from sketches import HyperLogLog
+from utils import (
+    BENCHMARKS, IRS, pretty_print_csv, pretty_print_latex, pretty_print_stats, print_bootstrap_results,
+    print_wilcoxon_results,
+)
+from virtual_call_stats import has_virtual_calls
+
+
+def runner_single_benchmark(
+    analysis: str,
+    benchmark: List[str],
+    memory_budget: Optional[MemoryBudget] = None,
+    approximate: bool = False,
+    output: Optional[OutputOptions] = None,
+    soft_memory_limit: Optional[int] = None,
+    trace_memory: bool = False,
+) -> None:
     print(f"analysis= {analysis}, benchmark= {benchmark[0]}")
-    precision_obj = ComputePrecision(analysis=analysis, benchmark=benchmark[0])
-    precision_obj.wala_ir_precision()
-    precision_obj.soot_ir_precision()
-    precision_obj.soot_class_hierarchy_precision()
-    precision_obj.wala_class_hierarchy_precision()
-
-
-def runner(analysis: str, benchmarks: List[str]) -> None:
-    ir_results_soot = []
-    ir_results_wala = []
-    soot_cha_results = []
-    wala_cha_results = []
-    results_dir = Path(".") / "results"
+    profiler = MemoryProfiler(soft_limit_mb=soft_memory_limit, trace=trace_memory)
+    precision_obj = None
+    try:
+        precision_obj = ComputePrecision(analysis=analysis, benchmark=benchmark[0], memory_budget=memory_budget,
+                                         approximate=approximate, profiler=profiler, output=output)
+        precision_obj.wala_ir_precision()
+        precision_obj.soot_ir_precision()
+        precision_obj.soot_class_hierarchy_precision()
+        precision_obj.wala_class_hierarchy_precision()
+    except MemoryLimitExceeded as e:
+        print(f"Skipping {benchmark[0]}: {e}")
+    finally:
+        if precision_obj is not None:
+            precision_obj.close_outputs()
+    print(profiler.report())
+
+
+def write_memory_reports(memory_reports: List[Tuple[str, str]], op_file: TextIO) -> None:
+    op_file.write("\n\n~~~~~~~~~~~~~~~~~~~~~~~~ Memory profile ~~~~~~~~~~~~~~~~~~~~~~~~\n")
+    for b, report in memory_reports:
+        op_file.write(f"\n[{b}]\n{report}\n")
+
+
+def runner(
+    analysis: str,
+    benchmarks: List[str],
+    memory_budget: Optional[MemoryBudget] = None,
+    approximate: bool = False,
+    soft_memory_limit: Optional[int] = None,
+    trace_memory: bool = False,
+    history: Optional[PerfHistory] = None,
+    history_label: str = '',
+    fresh: bool = False,
+    output: Optional[OutputOptions] = None,
+) -> None:
+    checkpoint = Checkpoint(analysis, approximate)
+    if fresh:
+        checkpoint.clear()
+    if history is None:
+        history = PerfHistory()
+    run_id = history.start_run(analysis, history_label, {
+        'memory_budget': memory_budget.megabytes if memory_budget else None,
+        'approximate': approximate,
+    })
     for b in benchmarks:
         print(f'\n\n{b}')
-        ir_precision_soot_res = {'benchmark': b}
-        ir_precision_wala_res = {'benchmark': b}
-        soot_cha_precision_res = {'benchmark': b}
-        wala_cha_precision_res = {'benchmark': b}
-
-        precisions = ComputePrecision(analysis=analysis, benchmark=b)
-        ir_precision_soot_res.update(precisions.soot_ir_precision())
-        ir_precision_wala_res.update(precisions.wala_ir_precision())
-        soot_cha_precision_res.update(precisions.soot_class_hierarchy_precision())
-        wala_cha_precision_res.update(precisions.wala_class_hierarchy_precision())
-
-        ir_results_soot.append(ir_precision_soot_res)
-        ir_results_wala.append(ir_precision_wala_res)
-        soot_cha_results.append(soot_cha_precision_res)
-        wala_cha_results.append(wala_cha_precision_res)
+        if not has_virtual_calls(analysis, b, IRS):
+            print(f"Skipping {b}: no virtual call count for {analysis} in virtual_call_stats.VIRTUAL_CALLS")
+            continue
+        fingerprint = inputs_fingerprint(b, analysis)
+        completed = checkpoint.completed(b, fingerprint)
+        missing = [series for series in SERIES if series not in completed]
+        if not missing:
+            print(f"Restored {b} from {checkpoint}")
+            continue
+        stored = checkpoint.completed(b)
+        stale = [series for series in SERIES if series in stored and series not in completed]
+        if stale:
+            print(f"Recomputing {', '.join(stale)} of {b}: its tables changed since they were checkpointed")
+
+        profiler = MemoryProfiler(soft_limit_mb=soft_memory_limit, trace=trace_memory)
+        precisions = None
+        try:
+            precisions = ComputePrecision(analysis=analysis, benchmark=b, memory_budget=memory_budget,
+                                          approximate=approximate, profiler=profiler, output=output)
+            compute = {
+                'soot_ir': precisions.soot_ir_precision,
+                'wala_ir': precisions.wala_ir_precision,
+                'soot_cha': precisions.soot_class_hierarchy_precision,
+                'wala_cha': precisions.wala_class_hierarchy_precision,
+            }
+            for series in missing:
+                res = {'benchmark': b}
+                res.update(compute[series]())
+                checkpoint.save(b, series, res, fingerprint)
+                for ir, sketches in precisions.sketches.items():
+                    checkpoint.save_sketches(b, {f'{ir}_{name}': sketch for name, sketch in sketches.items()})
+        except (MemoryLimitExceeded, ValueError) as e:
+            # a benchmark that cannot be computed (over the soft limit, no virtual call count) is reported
+            # and skipped, so that the rest of the sweep and its reports still complete
+            print(f"Skipping {b}: {e}")
+            checkpoint.save_memory_report(b, f"{profiler.report()}\nABORTED: {e}")
+            history.record_stages(run_id, b, profiler)
+            continue
+        finally:
+            if precisions is not None:
+                precisions.close_outputs()
+        checkpoint.save_memory_report(b, profiler.report())
+        history.record_stages(run_id, b, profiler)
+        history.record_fingerprints(run_id, b, analysis)
+
+    write_reports(analysis, checkpoint, benchmarks)
+
+
+def write_reports(analysis: str, checkpoint: Checkpoint, benchmarks: Optional[List[str]] = None) -> None:
+    """Write the LaTeX, CSV and statistics reports of a sweep from the checkpointed results."""
+    ir_results_soot = checkpoint.results('soot_ir', benchmarks)
+    ir_results_wala = checkpoint.results('wala_ir', benchmarks)
+    soot_cha_results = checkpoint.results('soot_cha', benchmarks)
+    wala_cha_results = checkpoint.results('wala_cha', benchmarks)
+    suite_sketches = checkpoint.suite_sketches(benchmarks)
+    memory_reports = checkpoint.memory_reports(benchmarks)
+    results_dir = Path(".") / "results"
+
+    if not (ir_results_soot and ir_results_wala and soot_cha_results and wala_cha_results):
+        print(f"No benchmark completed for {analysis}")
+        with open(results_dir / f"results_{analysis}.txt", "w") as op_file:
+            write_memory_reports(memory_reports, op_file)
+        return
 
     pretty_print_latex(ir_results_soot, str(results_dir / f"soot-ir-results-{analysis}.tex"))
     pretty_print_latex(ir_results_wala, str(results_dir / f"wala-ir-results-{analysis}.tex"))
@@ -70,48 +162,85 @@ def runner(analysis: str, benchmarks: List[str]) -> None:
         print_wilcoxon_results(soot_cha_results, ('precision_prev', 'precision'), "Soot CHA Results", op_file)
         print_wilcoxon_results(wala_cha_results, ('precision_prev', 'precision'), "Wala CHA Results", op_file)
 
+        op_file.write("\n\n~~~~~~~~~~~~~~~~~~~~~~~~ Bootstrap confidence intervals ~~~~~~~~~~~~~~~~~~~~~~~~\n")
+        print_bootstrap_results({
+            "Soot IR Bootstrap": (ir_results_soot, ('precision_ir', 'precision_actual')),
+            "Wala IR Bootstrap": (ir_results_wala, ('precision_ir', 'precision_actual')),
+            "Soot CHA Bootstrap": (soot_cha_results, ('precision_prev', 'precision')),
+            "Wala CHA Bootstrap": (wala_cha_results, ('precision_prev', 'precision')),
+        }, op_file)
+
+        if suite_sketches:
+            op_file.write("\n\n~~~~~~~~~~~~~~~~~~~~~~~~ Suite-wide estimates ~~~~~~~~~~~~~~~~~~~~~~~~\n")
+            for key, sketch in sorted(suite_sketches.items()):
+                op_file.write(f"{key} = {sketch.estimate():.0f} +/- {sketch.error_bound():.0f}\n")
+
+        write_memory_reports(memory_reports, op_file)
+
 
-def compute_precision_1cs() -> None:
+def compute_precision_1cs(memory_budget: Optional[MemoryBudget] = None, **options: Any) -> None:
     print("Running 1cs")
-    runner("1cs", BENCHMARKS)
+    runner("1cs", BENCHMARKS, memory_budget, **options)
 
 
-def compute_precision_1os() -> None:
+def compute_precision_1os(memory_budget: Optional[MemoryBudget] = None, **options: Any) -> None:
     print("Running 1os")
-    runner("1os", BENCHMARKS)
+    runner("1os", BENCHMARKS, memory_budget, **options)
 
 
-def compute_precision_2cs() -> None:
+def compute_precision_2cs(memory_budget: Optional[MemoryBudget] = None, **options: Any) -> None:
+    # eclipse and jython only fit under 2cs when processed out of core
     print("Running 2cs")
-    benchmarks = BENCHMARKS.copy()
-    benchmarks.remove('eclipse')
-    benchmarks.remove('jython')
-    runner("2cs", benchmarks)
+    runner("2cs", BENCHMARKS, memory_budget or MemoryBudget(DEFAULT_MEMORY_BUDGET_MB), **options)
 
 
-def compute_precision_2os() -> None:
+def compute_precision_2os(memory_budget: Optional[MemoryBudget] = None, **options: Any) -> None:
+    # eclipse and jython only fit under 2os when processed out of core; benchmarks without
+    # virtual call counts (eclipse and jython so far) are skipped by the runner
     print("Running 2os")
-    benchmarks = BENCHMARKS.copy()
-    benchmarks.remove('eclipse')
-    benchmarks.remove('jython')
-    runner("2os", benchmarks)
+    runner("2os", BENCHMARKS, memory_budget or MemoryBudget(DEFAULT_MEMORY_BUDGET_MB), **options)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser("metrics compute")
     parser.add_argument('-a', choices=['1cs', '2cs', '1os', '2os', '1csheap'])
     parser.add_argument('-b', choices=BENCHMARKS)
+    parser.add_argument('--memory-budget', type=int, metavar='MB',
+                        help='RAM budget in MiB; larger tables are processed out of core')
+    parser.add_argument('--spill-dir', help='directory for out-of-core temporary files')
+    parser.add_argument('--approximate', action='store_true',
+                        help='estimate distinct variable counts with HyperLogLog sketches')
+    parser.add_argument('--soft-memory-limit', type=int, metavar='MB',
+                        help='abort a benchmark with a diagnostic when resident memory exceeds this limit')
+    parser.add_argument('--trace-memory', action='store_true', help='record tracemalloc snapshots per stage')
+    parser.add_argument('--history-label', default='', help='label of this run in the performance history')
+    parser.add_argument('--fresh', action='store_true', help='discard the checkpointed results of this analysis')
+    parser.add_argument('--dump-format', choices=['text', 'binary'], default='text',
+                        help='format of the heap dumps and method logs')
+    parser.add_argument('--dump-compression', choices=COMPRESSIONS, help='compress the heap dumps and method logs')
+    parser.add_argument('--async-dumps', action='store_true',
+                        help='write the heap dumps and method logs in a background thread')
     args = vars(parser.parse_args(sys.argv[1:]))
     has_benchmark = bool(args['b'])
     analysis_opt = args['a']
+    budget = MemoryBudget(args['memory_budget'], args['spill_dir']) if args['memory_budget'] else None
+    options = {
+        'approximate': args['approximate'],
+        'soft_memory_limit': args['soft_memory_limit'],
+        'trace_memory': args['trace_memory'],
+        'history_label': args['history_label'],
+        'fresh': args['fresh'],
+        'output': OutputOptions(args['dump_format'] == 'binary', args['dump_compression'], args['async_dumps']),
+    }
     if not has_benchmark:
         if analysis_opt == '1cs':
-            compute_precision_1cs()
+            compute_precision_1cs(budget, **options)
         elif analysis_opt == '1os':
-            compute_precision_1os()
+            compute_precision_1os(budget, **options)
         elif analysis_opt == '2cs':
-            compute_precision_2cs()
+            compute_precision_2cs(budget, **options)
         elif analysis_opt == '2os':
-            compute_precision_2os()
+            compute_precision_2os(budget, **options)
     else:
-        runner_single_benchmark(analysis_opt, [args['b']])
+        runner_single_benchmark(analysis_opt, [args['b']], budget, args['approximate'], options['output'],
+                                args['soft_memory_limit'], args['trace_memory'])
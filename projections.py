@@ -0,0 +1,68 @@
+import sqlite3
+from sqlite3 import Error
+
+
+def ci_table(table: str) -> str:
+    """Name of the context-insensitive var -> heapObj projection of a points-to table."""
+    return f'{table}_ci'
+
+
+def ci_method_table(table: str) -> str:
+    """Name of the per-method distinct variable count projection of a points-to table."""
+    return f'{table}_ci_method'
+
+
+def table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    """Check whether a table (or view) with the given name exists in the database."""
+    query = "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?"
+    return conn.execute(query, (name,)).fetchone() is not None
+
+
+def drop_ci_projections(conn: sqlite3.Connection, table: str) -> None:
+    """
+    Drop the projections of a points-to table whose rows change.
+
+    ``VarPointsToTable`` answers from them whenever they exist, so they must not
+    outlive the rows they were built from.
+    """
+    for name in (ci_table(table), ci_method_table(table)):
+        conn.execute(f'DROP TABLE IF EXISTS {name}')
+
+
+def build_ci_projections(conn: sqlite3.Connection, table: str) -> None:
+    """
+    Materialize the context-insensitive projections of a points-to table.
+
+    Two tables are created next to ``table``: ``<table>_ci`` holds the distinct
+    (var, heapObj) pairs together with the columns derived from them, and
+    ``<table>_ci_method`` holds the number of distinct variables per enclosing method.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Connection to the points-to database
+    table : str
+        Name of the context-sensitive points-to table
+    """
+    ci = ci_table(table)
+    ci_method = ci_method_table(table)
+    cur = conn.cursor()
+    try:
+        cur.execute(f'DROP TABLE IF EXISTS {ci}')
+        cur.execute(f'DROP TABLE IF EXISTS {ci_method}')
+        cur.execute(
+            f'CREATE TABLE {ci} AS '
+            f'SELECT DISTINCT var, heapObj, heapType, enclosingMethod, varType from {table}'
+        )
+        cur.execute(f'CREATE INDEX {ci}_var ON {ci} (var)')
+        cur.execute(f'CREATE INDEX {ci}_enclosingMethod ON {ci} (enclosingMethod)')
+        cur.execute(f'CREATE INDEX {ci}_varType ON {ci} (varType)')
+        cur.execute(
+            f'CREATE TABLE {ci_method} AS '
+            f'SELECT enclosingMethod, count(distinct var) AS nbVars from {ci} group by enclosingMethod'
+        )
+        cur.execute(f'CREATE UNIQUE INDEX {ci_method}_enclosingMethod ON {ci_method} (enclosingMethod)')
+        conn.commit()
+        print(f'Built context-insensitive projections {ci}, {ci_method}')
+    except Error as e:
+        print(f"build_ci_projections: {e}")
@@ -0,0 +1,194 @@
+"""
+Thin client of the resident query server.
+
+``QueryClient(address).table(benchmark, analysis, ir)`` and its ``precision``
+and ``must_alias`` counterparts return proxies with the methods of
+``VarPointsToTable``, ``ComputePrecision`` and ``MustAlias``, answered by a
+``pointeval serve`` process. This module only needs the standard library.
+
+Messages are JSON lines. Tuples, sets and dictionaries with non-string keys are
+tagged so that the proxies return the same types as the local classes.
+"""
+import functools
+import json
+import socket
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_ADDRESS = '127.0.0.1:7474'
+
+# Calls answered remotely, per target.
+TABLE_METHODS = (
+    '__len__', 'has_projections', 'has_pointsto_sets', 'has_context_trie', 'get_heap_types',
+    'get_var_enclosing_method', 'all_variables_ctx_pair', 'all_heap_ctx_pair', 'variables_of_enclosed_method',
+    'variables_by_enclosed_method_class', 'count_nb_of_variables_method', 'number_vars_type',
+    'distinct_heap_objs_for_variables', 'heap_objs_for_var', 'number_of_heap_objs', 'get_database_size',
+    'get_variables_for_heap_obj', 'pointsto_set_ids', 'pointsto_set', 'pointsto_set_groups',
+    'count_variables_ctx_pair', 'receivers_per_call_site', 'context_trie_nodes', 'truncated_context_ids',
+    'context_strings',
+)
+PRECISION_METHODS = (
+    'soot_ir_precision', 'wala_ir_precision', 'soot_class_hierarchy_precision', 'wala_class_hierarchy_precision',
+)
+MUST_ALIAS_METHODS = ('compute_must_alias', 'compute_ci_partition', 'refine_partition', 'ci_alias_classes')
+
+
+class QueryError(Exception):
+    """A remote call failed on the server."""
+
+
+def encode(obj: Any) -> Any:
+    """Tag the tuples, sets and non-string-keyed dictionaries of a value for JSON."""
+    if isinstance(obj, tuple):
+        return {'__tuple__': [encode(o) for o in obj]}
+    if isinstance(obj, (set, frozenset)):
+        return {'__set__': [encode(o) for o in obj]}
+    if isinstance(obj, dict):
+        if all(isinstance(k, str) for k in obj):
+            return {k: encode(v) for k, v in obj.items()}
+        return {'__items__': [[encode(k), encode(v)] for k, v in obj.items()]}
+    if isinstance(obj, list):
+        return [encode(o) for o in obj]
+    return obj
+
+
+def decode(obj: Dict[str, Any]) -> Any:
+    """``json`` object hook reverting ``encode``."""
+    if len(obj) == 1:
+        tag, value = next(iter(obj.items()))
+        if tag == '__tuple__':
+            return tuple(value)
+        if tag == '__set__':
+            return set(value)
+        if tag == '__items__':
+            return {k: v for k, v in value}
+    return obj
+
+
+def dumps(message: Dict[str, Any]) -> bytes:
+    return json.dumps(encode(message)).encode() + b'\n'
+
+
+def loads(line: bytes) -> Dict[str, Any]:
+    return json.loads(line, object_hook=decode)
+
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    """``unix:PATH`` or ``HOST:PORT`` -> (family, socket address)."""
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return 'tcp', (host or '127.0.0.1', int(port))
+
+
+class QueryClient:
+    """
+    Blocking client of a ``QueryServer``.
+
+    Parameters
+    ----------
+    address : str
+        ``HOST:PORT`` or ``unix:PATH`` of the server
+    """
+    def __init__(self, address: str = DEFAULT_ADDRESS) -> None:
+        self.address = address
+        family, addr = parse_address(address)
+        if family == 'unix':
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.connect(addr)
+        else:
+            self._sock = socket.create_connection(addr)
+        self._file = self._sock.makefile('rwb')
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def __repr__(self) -> str:
+        return f'QueryClient [address = {self.address}]'
+
+    def __enter__(self) -> 'QueryClient':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def request(self, target: str, key: Optional[Dict[str, Any]], method: str, *args: Any) -> Any:
+        with self._lock:
+            self._next_id += 1
+            self._file.write(dumps({'id': self._next_id, 'target': target, 'key': key, 'method': method,
+                                    'args': list(args)}))
+            self._file.flush()
+            line = self._file.readline()
+        if not line:
+            raise QueryError(f"connection to {self.address} closed")
+        response = loads(line)
+        if 'error' in response:
+            raise QueryError(f"{target}.{method}: {response['error']}")
+        return response['result']
+
+    def table(self, benchmark: str, analysis: str, ir: str) -> 'RemoteVarPointsToTable':
+        return RemoteVarPointsToTable(self, benchmark, analysis, ir)
+
+    def precision(self, benchmark: str, analysis: str, approximate: bool = False) -> 'RemoteComputePrecision':
+        return RemoteComputePrecision(self, benchmark, analysis, approximate)
+
+    def must_alias(self, benchmark: str, analysis: str, ir: str) -> 'RemoteMustAlias':
+        return RemoteMustAlias(self, benchmark, analysis, ir)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.request('server', None, 'stats')
+
+    def evict(self) -> int:
+        """Drop every cached table; returns the number of tables evicted."""
+        return self.request('server', None, 'evict')
+
+    def close(self) -> None:
+        self._file.close()
+        self._sock.close()
+
+
+class _Remote:
+    target = ''
+    methods: Tuple[str, ...] = ()
+
+    def __init__(self, client: QueryClient, **key: Any) -> None:
+        self._client = client
+        self._key = key
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__} ({', '.join(f'{k}= {v}' for k, v in self._key.items())})"
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_') or name not in self.methods:
+            raise AttributeError(name)
+        return functools.partial(self._client.request, self.target, self._key, name)
+
+
+class RemoteVarPointsToTable(_Remote):
+    """``VarPointsToTable`` answered by the server."""
+    target = 'table'
+    methods = TABLE_METHODS
+
+    def __init__(self, client: QueryClient, benchmark: str, analysis: str, ir: str) -> None:
+        super().__init__(client, benchmark=benchmark, analysis=analysis, ir=ir)
+        self.db = f'{benchmark}_{analysis}_{ir}'
+
+    def __len__(self) -> int:
+        return self._client.request(self.target, self._key, '__len__')
+
+
+class RemoteComputePrecision(_Remote):
+    """``ComputePrecision`` answered by the server."""
+    target = 'precision'
+    methods = PRECISION_METHODS
+
+    def __init__(self, client: QueryClient, benchmark: str, analysis: str, approximate: bool = False) -> None:
+        super().__init__(client, benchmark=benchmark, analysis=analysis, approximate=approximate)
+
+
+class RemoteMustAlias(_Remote):
+    """``MustAlias`` answered by the server; alias classes come back as lists."""
+    target = 'must_alias'
+    methods = MUST_ALIAS_METHODS
+
+    def __init__(self, client: QueryClient, benchmark: str, analysis: str, ir: str) -> None:
+        super().__init__(client, benchmark=benchmark, analysis=analysis, ir=ir)
@@ -0,0 +1,444 @@
+"""
+Resident query server keeping points-to tables and their derived sets warm.
+
+A long-running process answers ``VarPointsToTable``, ``ComputePrecision`` and
+``MustAlias`` calls of ``queryclient`` proxies over a localhost or Unix socket,
+so that notebooks and scripts do not reopen SQLite and rebuild the same sets on
+every invocation. Query results are cached per table; tables left idle, or the
+least recently used ones when the cache outgrows the memory budget, are evicted,
+and so are tables whose contents changed since they were cached (for example
+after ``pointeval load``).
+"""
+import asyncio
+import copy
+import functools
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from computeprecision import ComputePrecision
+from memprofile import estimate_size
+from must_alias import MustAlias
+from outofcore import MemoryBudget
+from perfhistory import input_tables, table_fingerprint
+from queryclient import (
+    DEFAULT_ADDRESS, MUST_ALIAS_METHODS, PRECISION_METHODS, TABLE_METHODS, dumps, loads, parse_address,
+)
+from utils import DATABASE_PATH
+from varpointstodb import VarPointsToTable
+
+# Seconds after which a table nobody queried is evicted.
+DEFAULT_IDLE_TIMEOUT = 600.0
+DEFAULT_WORKERS = 4
+# Longest request line the server accepts.
+MAX_MESSAGE = 1 << 30
+# Table queries whose results are kept; the table flags are already cached by VarPointsToTable.
+CACHED_TABLE_METHODS = tuple(m for m in TABLE_METHODS if not m.startswith('has_')) + ('pointsto_map',)
+# Queries run for a preloaded table.
+WARM_METHODS = ('get_var_enclosing_method', 'count_nb_of_variables_method', 'all_heap_ctx_pair',
+                'all_variables_ctx_pair')
+
+
+def _freeze(obj: Any) -> Any:
+    if isinstance(obj, (set, frozenset)):
+        return frozenset(_freeze(o) for o in obj)
+    if isinstance(obj, (list, tuple)):
+        return tuple(_freeze(o) for o in obj)
+    return obj
+
+
+def _size(obj: Any) -> int:
+    return estimate_size(obj) if hasattr(obj, '__len__') else sys.getsizeof(obj)
+
+
+class WarmTable(VarPointsToTable):
+    """
+    ``VarPointsToTable`` whose query results are kept in memory.
+
+    Cached results are shallow-copied on the way out, since callers such as
+    ``ComputePrecision`` modify the sets they receive. The fingerprint of the
+    points-to and virtual call tables is taken first, so that the cache can tell
+    when they are loaded again.
+
+    Parameters
+    ----------
+    data_version : int
+        ``PRAGMA data_version`` of the cache when the fingerprint is taken
+    """
+    def __init__(self, benchmark: str, analysis: str, ir: str, data_version: int = 0) -> None:
+        super().__init__(benchmark, analysis, ir)
+        self.key = (benchmark, analysis, ir)
+        self.nbytes = 0
+        self.last_used = time.time()
+        self._results: Dict[Tuple[str, Any], Any] = {}
+        self._lock = threading.Lock()
+        self.fingerprint = self.current_fingerprint()
+        # the fingerprint is checked once per data version, by whichever call comes first
+        self._fingerprint_lock = threading.Lock()
+        self._checked_version = data_version
+        self._changed = False
+
+    def current_fingerprint(self) -> Tuple:
+        conn = sqlite3.connect(DATABASE_PATH)
+        try:
+            benchmark, analysis, ir = self.key
+            return tuple(table_fingerprint(conn, table) for table_ir, table in input_tables(benchmark, analysis)
+                         if table_ir == ir)
+        except sqlite3.Error as e:
+            print(f"WarmTable: {e}")
+            return ()
+
+    def changed(self, data_version: int) -> bool:
+        """Check whether the tables changed since they were fingerprinted; concurrent checks wait for the first."""
+        with self._fingerprint_lock:
+            if data_version != self._checked_version:
+                self._checked_version = data_version
+                self._changed = self._changed or self.current_fingerprint() != self.fingerprint
+            return self._changed
+
+    def cached(self, name: str, *args: Any) -> Any:
+        self.last_used = time.time()
+        method = getattr(VarPointsToTable, name)
+        try:
+            key = (name, _freeze(args))
+            hash(key)
+        except TypeError:
+            return method(self, *args)
+        with self._lock:
+            found = key in self._results
+            res = self._results.get(key)
+        if not found:
+            res = method(self, *args)
+            if isinstance(res, Iterator):
+                res = list(res)
+            with self._lock:
+                if key not in self._results:
+                    self._results[key] = res
+                    self.nbytes += _size(res)
+        return copy.copy(res) if isinstance(res, (set, dict, list)) else res
+
+    def forget_tables(self) -> None:
+        """Check again which projections, sets, trie or shared tables exist; a load may have dropped them."""
+        self._table_flags.clear()
+
+    def nb_results(self) -> int:
+        return len(self._results)
+
+
+def _memoized(name: str) -> Any:
+    @functools.wraps(getattr(VarPointsToTable, name))
+    def method(self: WarmTable, *args: Any) -> Any:
+        return self.cached(name, *args)
+    return method
+
+
+for _name in CACHED_TABLE_METHODS:
+    setattr(WarmTable, _name, _memoized(_name))
+
+
+class TableCache:
+    """
+    Warm tables and the precision and must-alias objects built on them.
+
+    ``ComputePrecision`` and ``MustAlias`` objects share the ``WarmTable`` of
+    their benchmark, analysis and IR, and are evicted together with it. Calls on
+    the same object are serialized; calls on different objects run concurrently.
+    Tables are fingerprinted outside of the cache lock, so a slow scan only holds
+    up the calls on that table.
+
+    Parameters
+    ----------
+    memory_budget : Optional[MemoryBudget]
+        Bound on the estimated size of the cached results, also passed on to the
+        computations; unbounded by default
+    idle_timeout : float
+        Seconds after which an unused table is evicted
+    """
+    def __init__(self, memory_budget: Optional[MemoryBudget] = None,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT) -> None:
+        self.memory_budget = memory_budget
+        self.idle_timeout = idle_timeout
+        self.tables: Dict[Tuple[str, str, str], WarmTable] = {}
+        # (target, *key) -> (object, keys of its tables, object lock, estimated size)
+        self.objects: Dict[Tuple, Tuple[Any, Tuple[Tuple[str, str, str], ...], threading.Lock, int]] = {}
+        self._busy: Dict[Tuple[str, str, str], int] = {}
+        self._lock = threading.RLock()
+        # objects under construction, so that concurrent first calls build each object once
+        self._building: Dict[Tuple, threading.Lock] = {}
+        # ComputePrecision objects of a benchmark write the same heap dumps and logs
+        self._benchmark_locks: Dict[str, threading.Lock] = {}
+        # PRAGMA data_version of this connection changes whenever another connection commits
+        self._watch = sqlite3.connect(DATABASE_PATH, check_same_thread=False)
+        self._data_version = self._watch.execute('PRAGMA data_version').fetchone()[0]
+
+    def __repr__(self) -> str:
+        return f'TableCache [tables = {len(self.tables)}, objects = {len(self.objects)}, nbytes = {self.nbytes()}]'
+
+    def table(self, benchmark: str, analysis: str, ir: str) -> WarmTable:
+        key = (benchmark, analysis, ir)
+        with self._lock:
+            if key in self.tables:
+                return self.tables[key]
+            building = self._building.setdefault(('table',) + key, threading.Lock())
+            data_version = self._data_version
+        with building:
+            with self._lock:
+                if key in self.tables:
+                    return self.tables[key]
+            table = WarmTable(benchmark, analysis, ir, data_version)
+            with self._lock:
+                self.tables[key] = table
+                self._building.pop(('table',) + key, None)
+            return table
+
+    def _object(self, target: str, key: Dict[str, Any]) -> Tuple[Any, Tuple[Tuple[str, str, str], ...], threading.Lock]:
+        if target == 'precision':
+            obj_key = (target, key['benchmark'], key['analysis'], bool(key.get('approximate', False)))
+        else:
+            obj_key = (target, key['benchmark'], key['analysis'], key['ir'])
+        with self._lock:
+            if obj_key in self.objects:
+                obj, table_keys, lock, _ = self.objects[obj_key]
+                return obj, table_keys, lock
+            building = self._building.setdefault(obj_key, threading.Lock())
+        with building:
+            with self._lock:
+                if obj_key in self.objects:
+                    obj, table_keys, lock, _ = self.objects[obj_key]
+                    return obj, table_keys, lock
+            if target == 'precision':
+                obj = ComputePrecision(benchmark=key['benchmark'], analysis=key['analysis'],
+                                       memory_budget=self.memory_budget, approximate=obj_key[3])
+                obj.soot_db = self.table(key['benchmark'], key['analysis'], 'soot')
+                obj.wala_db = self.table(key['benchmark'], key['analysis'], 'wala')
+                table_keys = ((key['benchmark'], key['analysis'], 'soot'), (key['benchmark'], key['analysis'], 'wala'))
+                nbytes = _size(obj.soot_virtualcall_vars) + _size(obj.wala_virtualcall_vars)
+                with self._lock:
+                    lock = self._benchmark_locks.setdefault(key['benchmark'], threading.Lock())
+            else:
+                obj = MustAlias(benchmark=key['benchmark'], analysis=key['analysis'], ir=key['ir'],
+                                memory_budget=self.memory_budget)
+                obj.table = self.table(key['benchmark'], key['analysis'], key['ir'])
+                table_keys = ((key['benchmark'], key['analysis'], key['ir']),)
+                nbytes = 0
+                lock = threading.Lock()
+            with self._lock:
+                self.objects[obj_key] = (obj, table_keys, lock, nbytes)
+                self._building.pop(obj_key, None)
+        return obj, table_keys, lock
+
+    def call(self, target: str, key: Dict[str, Any], method: str, args: List[Any]) -> Any:
+        """Run one remote call; iterators are returned as lists."""
+        methods = {'table': TABLE_METHODS, 'precision': PRECISION_METHODS, 'must_alias': MUST_ALIAS_METHODS}
+        if method not in methods.get(target, ()):
+            raise ValueError(f"unknown call {target}.{method}")
+        self.revalidate()
+        if target == 'table':
+            obj, lock = self.table(key['benchmark'], key['analysis'], key['ir']), None
+            table_keys: Tuple[Tuple[str, str, str], ...] = ((key['benchmark'], key['analysis'], key['ir']),)
+        else:
+            obj, table_keys, lock = self._object(target, key)
+        with self._lock:
+            for k in table_keys:
+                self._busy[k] = self._busy.get(k, 0) + 1
+        try:
+            if lock is None:
+                res = getattr(obj, method)(*args)
+            else:
+                with lock:
+                    res = getattr(obj, method)(*args)
+            if isinstance(res, Iterator):
+                res = list(res)
+            return res
+        finally:
+            with self._lock:
+                for k in table_keys:
+                    self._busy[k] -= 1
+                    if k in self.tables:
+                        self.tables[k].last_used = time.time()
+            self.enforce_budget()
+
+    def revalidate(self) -> List[Tuple[str, str, str]]:
+        """
+        Evict the tables whose contents changed since they were cached.
+
+        The tables are only fingerprinted again when the database was written since
+        they were last checked, which ``PRAGMA data_version`` tells without reading it.
+        Every table is checked once per version; concurrent calls wait for that check.
+        """
+        with self._lock:
+            version = self._watch.execute('PRAGMA data_version').fetchone()[0]
+            written = version != self._data_version
+            self._data_version = version
+            tables = list(self.tables.items())
+        stale = [(k, t) for k, t in tables if t.changed(version)]
+        with self._lock:
+            evicted = []
+            for key, table in stale:
+                # a concurrent call may already have evicted it and cached a fresh table
+                if self.tables.get(key) is table:
+                    print(f"Evicted changed table {'_'.join(key)}")
+                    self.evict(key)
+                    evicted.append(key)
+            if written:
+                for table in self.tables.values():
+                    table.forget_tables()
+            return evicted
+
+    def warm(self, benchmark: str, analysis: str, ir: str) -> None:
+        table = self.table(benchmark, analysis, ir)
+        start = time.time()
+        for method in WARM_METHODS:
+            getattr(table, method)()
+        print(f"Warmed {table.db} ({table.nbytes / 2 ** 20:.1f} MiB) in {time.time() - start} seconds")
+
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(t.nbytes for t in self.tables.values()) + sum(o[3] for o in self.objects.values())
+
+    def evict(self, key: Tuple[str, str, str]) -> None:
+        """Drop a table and every object built on it."""
+        with self._lock:
+            self.tables.pop(key, None)
+            for obj_key in [k for k, o in self.objects.items() if key in o[1]]:
+                del self.objects[obj_key]
+
+    def _idle_tables(self, idle_for: float) -> List[Tuple[str, str, str]]:
+        now = time.time()
+        with self._lock:
+            return sorted((k for k, t in self.tables.items() if not self._busy.get(k) and now - t.last_used >= idle_for),
+                          key=lambda k: self.tables[k].last_used)
+
+    def enforce_budget(self) -> List[Tuple[str, str, str]]:
+        """Evict the least recently used idle tables until the cache fits the memory budget."""
+        evicted = []
+        if self.memory_budget is None:
+            return evicted
+        for key in self._idle_tables(0):
+            if self.nbytes() <= self.memory_budget.nbytes:
+                break
+            self.evict(key)
+            evicted.append(key)
+        return evicted
+
+    def evict_idle(self) -> List[Tuple[str, str, str]]:
+        evicted = self._idle_tables(self.idle_timeout)
+        for key in evicted:
+            self.evict(key)
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            tables = [{'table': t.db, 'results': t.nb_results(), 'nbytes': t.nbytes,
+                       'idle_seconds': now - t.last_used} for t in self.tables.values()]
+            objects = [' '.join(str(k) for k in key) for key in self.objects]
+        return {'tables': tables, 'objects': objects, 'nbytes': self.nbytes(),
+                'budget': self.memory_budget.nbytes if self.memory_budget is not None else None}
+
+
+class QueryServer:
+    """
+    Asyncio server answering remote calls from a ``TableCache``.
+
+    Requests of a connection are answered concurrently by a thread pool, each
+    response carrying the ID of its request.
+
+    Parameters
+    ----------
+    address : str
+        ``HOST:PORT`` or ``unix:PATH``
+    memory_budget : Optional[MemoryBudget]
+        Bound on the cached results
+    idle_timeout : float
+        Seconds after which an unused table is evicted
+    workers : int
+        Calls computed at the same time
+    """
+    def __init__(self, address: str = DEFAULT_ADDRESS, memory_budget: Optional[MemoryBudget] = None,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT, workers: int = DEFAULT_WORKERS) -> None:
+        self.address = address
+        self.cache = TableCache(memory_budget, idle_timeout)
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='query')
+
+    def __repr__(self) -> str:
+        return f'QueryServer [address = {self.address}, cache = {self.cache}]'
+
+    def _server_call(self, method: str) -> Any:
+        if method == 'stats':
+            return self.cache.stats()
+        if method == 'evict':
+            keys = list(self.cache.tables)
+            for key in keys:
+                self.cache.evict(key)
+            return len(keys)
+        raise ValueError(f"unknown call server.{method}")
+
+    def _dispatch(self, request: Dict[str, Any]) -> Any:
+        if request['target'] == 'server':
+            return self._server_call(request['method'])
+        return self.cache.call(request['target'], request['key'], request['method'], request.get('args', []))
+
+    async def _answer(self, request: Dict[str, Any], writer: asyncio.StreamWriter, write_lock: asyncio.Lock) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            res = await loop.run_in_executor(self.executor, self._dispatch, request)
+            response = dumps({'id': request['id'], 'result': res})
+        except Exception as e:
+            response = dumps({'id': request.get('id'), 'error': f'{type(e).__name__}: {e}'})
+        async with write_lock:
+            writer.write(response)
+            await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        write_lock = asyncio.Lock()
+        pending = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(self._answer(loads(line), writer, write_lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending)
+        except (ConnectionError, ValueError) as e:
+            print(f"QueryServer: {e}")
+        finally:
+            writer.close()
+
+    async def _evict_idle(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(max(self.cache.idle_timeout / 4, 1.0))
+            for key in await loop.run_in_executor(self.executor, self.cache.evict_idle):
+                print(f"Evicted idle table {'_'.join(key)}")
+
+    async def serve(self, preload: Iterable[Tuple[str, str, str]] = ()) -> None:
+        loop = asyncio.get_running_loop()
+        for key in preload:
+            await loop.run_in_executor(self.executor, self.cache.warm, *key)
+        family, addr = parse_address(self.address)
+        if family == 'unix':
+            server = await asyncio.start_unix_server(self._handle, addr, limit=MAX_MESSAGE)
+        else:
+            server = await asyncio.start_server(self._handle, *addr, limit=MAX_MESSAGE)
+        print(f"Serving points-to queries on {self.address}")
+        evictor = asyncio.create_task(self._evict_idle())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            evictor.cancel()
+
+    def run(self, preload: Iterable[Tuple[str, str, str]] = ()) -> None:
+        try:
+            asyncio.run(self.serve(preload))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.executor.shutdown(wait=False)
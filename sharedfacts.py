@@ -0,0 +1,237 @@
+"""
+Storage of the facts of several analyses of a benchmark with shared strings.
+
+The 1cs, 1os, 2cs and 2os runs of a benchmark and IR mostly report the same heap
+objects, variables, contexts and virtual calls. In the shared mode each of them
+is stored once per (benchmark, IR) in a ``shared_<benchmark>_<ir>_<kind>`` table,
+together with the columns derived from it, and every analysis only stores its
+rows as IDs into those tables (``<table>_ids``). The usual table name becomes a
+view joining them back, so ``VarPointsToTable`` and ``VirtualCallVariablesTable``
+read the same columns and rows as from a plain table.
+"""
+import sqlite3
+import time
+from operator import getitem, itemgetter
+from sqlite3 import Error
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from contexttrie import ctx_strings_table, ctx_table, rows_table
+from facts import (
+    ANALYSIS_LOG_ROOT, READERS, RELATIONS, Relation, fact_dir, find_fact_file, read_facts, stamp_load,
+)
+from pointsto_sets import drop_pointsto_sets
+from projections import drop_ci_projections
+from utils import get_heap_type_info, get_type_info, get_var_method_info
+
+# Shared dimension -> (ID column, key columns, derived (column, function of the first key column), indexes).
+DIMENSIONS: Dict[str, Tuple[str, Tuple[str, ...], Tuple[Tuple[str, Callable[[str], str]], ...], Tuple[str, ...]]] = {
+    'ctxs': ('ctxId', ('ctx',), (), ()),
+    'heaps': ('heapId', ('heapObj',), (('heapType', get_heap_type_info),), ('heapType',)),
+    'vars': ('varId', ('var',), (('enclosingMethod', get_var_method_info), ('varType', get_type_info)),
+             ('enclosingMethod', 'varType')),
+    'calls': ('callId', ('virtualCallSite', 'virtualVar'), (), ()),
+}
+
+# Relation -> (ID column of the rows, dimension, fact columns it interns) per group, and indexes of the rows.
+LAYOUTS: Dict[str, Tuple[Tuple[Tuple[str, str, Tuple[str, ...]], ...], Tuple[str, ...]]] = {
+    'varpointsto': ((('heapCtxId', 'ctxs', ('heapCtx',)), ('heapId', 'heaps', ('heapObj',)),
+                     ('varCtxId', 'ctxs', ('varCtx',)), ('varId', 'vars', ('var',))),
+                    ('varId, varCtxId',)),
+    'virtualcalls': ((('callId', 'calls', ('virtualCallSite', 'virtualVar')),), ()),
+}
+
+
+def shared_table(benchmark: str, ir: str, kind: str) -> str:
+    """Name of the table of a shared dimension of a benchmark and IR."""
+    return f'shared_{benchmark}_{ir}_{kind}'
+
+
+def ids_table(table: str) -> str:
+    """Name of the rows of a table stored as IDs into the shared tables."""
+    return f'{table}_ids'
+
+
+class _Interner(dict):
+    """
+    Map the keys of a shared table to their IDs, assigning new IDs to unseen keys.
+
+    Keys of one-column dimensions are plain strings, which hash faster than tuples.
+    The new keys are added to the table when flushed.
+    """
+    def __init__(self, conn: sqlite3.Connection, table: str, kind: str) -> None:
+        super().__init__()
+        self.conn = conn
+        self.table = table
+        id_column, self.columns, self.derived, indexes = DIMENSIONS[kind]
+        columns = ', '.join(f'{c} string' for c in self.columns + tuple(c for c, _ in self.derived))
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {table} ({id_column} integer PRIMARY KEY, {columns})')
+        conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {table}_key ON {table} ({", ".join(self.columns)})')
+        for column in indexes:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})')
+        query = f'SELECT {id_column}, {", ".join(self.columns)} from {table}'
+        if len(self.columns) == 1:
+            self.update((r[1], r[0]) for r in conn.execute(query))
+        else:
+            self.update((tuple(r[1:]), r[0]) for r in conn.execute(query))
+        self.next_id = max(self.values(), default=0) + 1
+        self.new: List[Tuple] = []
+
+    def __missing__(self, key: Any) -> int:
+        key_id = self[key] = self.next_id
+        self.next_id += 1
+        if len(self.columns) == 1:
+            self.new.append((key_id, key) + tuple(fn(key) for _, fn in self.derived))
+        else:
+            self.new.append((key_id,) + key)
+        return key_id
+
+    def flush(self) -> int:
+        placeholders = ','.join('?' * (1 + len(self.columns) + len(self.derived)))
+        self.conn.executemany(f'INSERT INTO {self.table} VALUES ({placeholders})', self.new)
+        nb_new = len(self.new)
+        self.new = []
+        return nb_new
+
+
+def _drop(conn: sqlite3.Connection, name: str) -> None:
+    row = conn.execute("SELECT type from sqlite_master where name = ? and type IN ('table', 'view')",
+                       (name,)).fetchone()
+    if row is not None:
+        conn.execute(f'DROP {row[0].upper()} {name}')
+
+
+def _like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def prune_shared(conn: sqlite3.Connection, benchmark: str, ir: str, kinds: Iterable[str]) -> int:
+    """
+    Delete the rows of shared tables that no analysis of the benchmark and IR refers to any more.
+
+    Rows are only added when loading, so the heap objects, variables, contexts or
+    calls an analysis stopped reporting would otherwise stay forever.
+
+    Returns
+    -------
+    int
+        Number of rows deleted
+    """
+    nb_deleted = 0
+    for kind in kinds:
+        references = []
+        for name, (groups, _) in LAYOUTS.items():
+            columns = [id_column for id_column, group_kind, _ in groups if group_kind == kind]
+            if not columns:
+                continue
+            # the ID tables of every analysis: the name with the analysis as the only wildcard
+            pattern = _like(ids_table(RELATIONS[name].table_name(benchmark, '\0', ir))).replace('\0', '%')
+            query = "SELECT name from sqlite_master where type = 'table' and name LIKE ? ESCAPE '\\'"
+            references += [f'SELECT {c} from {r[0]}' for r in conn.execute(query, (pattern,)) for c in columns]
+        if references:
+            cur = conn.execute(f'DELETE FROM {shared_table(benchmark, ir, kind)} '
+                               f'where {DIMENSIONS[kind][0]} NOT IN ({" UNION ".join(references)})')
+            nb_deleted += cur.rowcount
+    return nb_deleted
+
+
+def drop_derived_tables(conn: sqlite3.Connection, table: str) -> None:
+    """
+    Drop the projections, points-to sets and context trie built from a table whose rows change.
+
+    ``VarPointsToTable`` answers from them whenever they exist, so they must not
+    outlive the rows they were built from. A view reading from them must be gone first.
+    """
+    drop_ci_projections(conn, table)
+    drop_pointsto_sets(conn, table)
+    for name in (ctx_table(table), rows_table(table), ctx_strings_table(table)):
+        conn.execute(f'DROP TABLE IF EXISTS {name}')
+
+
+def load_relation_shared(
+    conn: sqlite3.Connection,
+    relation: Relation,
+    benchmark: str,
+    analysis: str,
+    ir: str,
+    root: str = ANALYSIS_LOG_ROOT,
+) -> int:
+    """
+    Load the facts of a relation for one analysis run, sharing their strings with the other analyses.
+
+    The analysis' previous table (plain or shared) and every table derived from it
+    are replaced. The rows are loaded into a staging table first and swapped in
+    within the same transaction, so a missing or corrupt fact file leaves the
+    previous table untouched. Derived columns are only computed for heap objects
+    and variables no other analysis has stored yet, and shared rows no analysis
+    refers to any more are deleted.
+
+    Returns
+    -------
+    int
+        Number of rows loaded (0 when the fact file is missing)
+    """
+    if relation.name not in LAYOUTS:
+        print(f"load_relation_shared: {relation.name} has no shared layout")
+        return 0
+    directory = fact_dir(analysis, benchmark, ir, root)
+    path = find_fact_file(directory, relation.file_name)
+    if path is None:
+        print(f"load_relation_shared: no {relation.file_name}[{'|'.join(s for s in READERS if s)}] in {directory}")
+        return 0
+    groups, indexes = LAYOUTS[relation.name]
+    table = relation.table_name(benchmark, analysis, ir)
+    ids = ids_table(table)
+    staging = f'{ids}_new'
+    start = time.time()
+    if conn.in_transaction:
+        conn.commit()
+    try:
+        interners = {kind: _Interner(conn, shared_table(benchmark, ir, kind), kind) for _, kind, _ in groups}
+        facts = read_facts(relation, path, derived=False)
+        if [columns for _, _, columns in groups] == [(c,) for c in relation.columns]:
+            # one fact column per group, in order: look every field up in its interner in one C-level pass
+            lookups = [interners[kind] for _, kind, _ in groups]
+            rows = (tuple(map(getitem, lookups, fields)) for fields in facts)
+        else:
+            getters = [(interners[kind], itemgetter(*(relation.columns.index(c) for c in columns)))
+                       for _, kind, columns in groups]
+            rows = ([interner[get(fields)] for interner, get in getters] for fields in facts)
+        conn.execute('BEGIN')
+        conn.execute(f'DROP TABLE IF EXISTS {staging}')
+        conn.execute(f'CREATE TABLE {staging} ({", ".join(f"{c} integer" for c, _, _ in groups)})')
+        conn.executemany(f'INSERT INTO {staging} VALUES ({",".join("?" * len(groups))})', rows)
+        nb_new = {kind: interner.flush() for kind, interner in interners.items()}
+
+        # every row was read: swap the staging table in, the view first since it reads from the old one
+        _drop(conn, table)
+        drop_derived_tables(conn, table)
+        conn.execute(f'DROP TABLE IF EXISTS {ids}')
+        conn.execute(f'ALTER TABLE {staging} RENAME TO {ids}')
+        for i, columns in enumerate(indexes):
+            conn.execute(f'CREATE INDEX {ids}_{i} ON {ids} ({columns})')
+
+        # every fact column comes from the key of its group, every derived column from the group of its source
+        group_of = {c: g for g, (_, _, columns) in enumerate(groups) for c in columns}
+        source = {c: f'd{group_of[c]}.{DIMENSIONS[kind][1][columns.index(c)]}'
+                  for _, kind, columns in groups for c in columns}
+        for column, position, _ in relation.derived:
+            source[column] = f'd{group_of[relation.columns[position]]}.{column}'
+        joins = ' '.join(f'JOIN {shared_table(benchmark, ir, kind)} d{g} on d{g}.{DIMENSIONS[kind][0]} = r.{id_column}'
+                         for g, (id_column, kind, _) in enumerate(groups))
+        selected = ', '.join(f'{source[c]} AS {c}' for c in relation.all_columns)
+        conn.execute(f'CREATE VIEW {table} AS SELECT {selected} from {ids} r {joins}')
+        nb_pruned = prune_shared(conn, benchmark, ir, interners)
+        nb_rows = conn.execute(f'SELECT count(*) from {ids}').fetchone()[0]
+        stamp_load(conn, table, nb_rows)
+        conn.commit()
+        new = ', '.join(f'{n} {kind}' for kind, n in nb_new.items())
+        print(f'Loaded {nb_rows} rows of {path} into {table} ({new} new, {nb_pruned} unused deleted) '
+              f'in {time.time() - start} seconds')
+        return nb_rows
+    except (ImportError, OSError, EOFError) as e:
+        conn.rollback()
+        print(f"load_relation_shared: {e}")
+    except Error as e:
+        conn.rollback()
+        print(f"load_relation_shared: {e}")
+    return 0
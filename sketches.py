@@ -0,0 +1,95 @@
+import hashlib
+import math
+from typing import Iterable, Tuple, Union
+
+DEFAULT_PRECISION = 14
+
+SketchItem = Union[str, Tuple[str, ...]]
+
+
+def _hash64(item: SketchItem) -> int:
+    """Stable 64-bit hash, identical across processes so that sketches can be merged."""
+    data = '\x00'.join(item) if isinstance(item, tuple) else item
+    return int.from_bytes(hashlib.blake2b(data.encode(), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """
+    HyperLogLog sketch estimating the number of distinct items in fixed memory.
+
+    Parameters
+    ----------
+    precision : int
+        Number of index bits; the sketch uses ``2 ** precision`` one-byte registers
+        and has a relative standard error of ``1.04 / sqrt(2 ** precision)``
+    """
+    def __init__(self, precision: int = DEFAULT_PRECISION) -> None:
+        if not 4 <= precision <= 18:
+            raise ValueError(f"precision must be between 4 and 18, got {precision}")
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+
+    def __repr__(self) -> str:
+        return f'HyperLogLog [precision = {self.precision}, estimate = {self.estimate():.0f}]'
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def add(self, item: SketchItem) -> None:
+        h = _hash64(item)
+        idx = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def update(self, items: Iterable[SketchItem]) -> None:
+        for item in items:
+            self.add(item)
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        """Merge another sketch into this one (the union of both item streams)."""
+        if other.precision != self.precision:
+            raise ValueError(f"cannot merge sketches of precision {self.precision} and {other.precision}")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def __or__(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        return HyperLogLog(self.precision).merge(self).merge(other)
+
+    def estimate(self) -> float:
+        """Estimated number of distinct items, with the small-range (linear counting) correction."""
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        raw = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * self.m and zeros != 0:
+            return self.m * math.log(self.m / zeros)
+        return raw
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def error_bound(self, z: float = 1.96) -> float:
+        """Absolute error bound of the estimate (``z`` standard errors, 95% by default)."""
+        return z * self.relative_error * self.estimate()
+
+    def to_bytes(self) -> bytes:
+        return bytes([self.precision]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HyperLogLog':
+        sketch = cls(data[0])
+        sketch.registers = bytearray(data[1:])
+        return sketch
+
+
+def merge_sketches(sketches: Iterable[HyperLogLog]) -> HyperLogLog:
+    """Merge sketches, e.g. across IRs or benchmarks, into a new sketch."""
+    merged = None
+    for sketch in sketches:
+        merged = HyperLogLog(sketch.precision).merge(sketch) if merged is None else merged.merge(sketch)
+    if merged is None:
+        raise ValueError("no sketches to merge")
+    return merged
@@ -0,0 +1,73 @@
+"""
+Context strings must survive the trie: parsing, storing and truncating a context
+gives back the string Doop printed, also for contexts that are not in brackets.
+"""
+import sqlite3
+
+import pytest
+
+from contexttrie import ContextTrie, build_context_trie, format_context, node_context, parse_context, truncation_map
+
+CONTEXTS = [
+    '[]',
+    '[<pkg.D: void x()>/invoke0]',
+    '[<pkg.D: void x()>/invoke0, <pkg.C: void m(int,int)>/invoke1]',
+    '[<pkg.F: void f()>/new pkg.E/0, <pkg.D: void x()>/invoke0, <pkg.C: void m(int,int)>/invoke1]',
+    '<<immutable-context>>',
+    '<pkg.D: void x()>/invoke0',
+]
+
+
+def trie_strings(trie):
+    nodes = {ctx_id: (parent, elem) for ctx_id, parent, elem, _ in trie.nodes}
+    return {ctx_id: node_context(nodes, ctx_id) for ctx_id in nodes}
+
+
+@pytest.mark.parametrize('ctx', [c for c in CONTEXTS if c.startswith('[')])
+def test_parse_format_round_trip(ctx):
+    assert format_context(parse_context(ctx)) == ctx
+
+
+def test_parse_keeps_signatures_whole():
+    assert parse_context(CONTEXTS[2]) == ('<pkg.C: void m(int,int)>/invoke1', '<pkg.D: void x()>/invoke0')
+
+
+def test_trie_round_trip():
+    trie = ContextTrie()
+    ids = {ctx: trie.add(ctx) for ctx in CONTEXTS}
+    assert len(set(ids.values())) == len(CONTEXTS)
+    strings = trie_strings(trie)
+    assert all(strings[ctx_id] == ctx for ctx, ctx_id in ids.items())
+
+
+def test_unbracketed_context_is_its_own_node():
+    trie = ContextTrie()
+    bracketed = trie.add('[<pkg.D: void x()>/invoke0]')
+    unbracketed = trie.add('<pkg.D: void x()>/invoke0')
+    assert bracketed != unbracketed
+    assert trie_strings(trie)[unbracketed] == '<pkg.D: void x()>/invoke0'
+
+
+@pytest.mark.parametrize('depth', [0, 1, 2, 3])
+def test_truncation_keeps_most_recent_elements(depth):
+    trie = ContextTrie()
+    ids = {ctx: trie.add(ctx) for ctx in CONTEXTS}
+    ancestor = truncation_map(((ctx_id, parent, d) for ctx_id, parent, _, d in trie.nodes), depth)
+    strings = trie_strings(trie)
+    for ctx, ctx_id in ids.items():
+        if ctx.startswith('['):
+            assert strings[ancestor[ctx_id]] == format_context(parse_context(ctx)[:depth])
+        else:
+            assert ancestor[ctx_id] == ctx_id
+
+
+def test_trie_view_returns_loaded_strings(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'vpt.db')
+    conn.execute('CREATE TABLE t (heapCtx string, heapObj string, varCtx string, var string, '
+                 'heapType string, enclosingMethod string, varType string)')
+    rows = [(h, f'h{i}', v, f'v{i}', 'T', 'm', 'T') for i, (h, v) in enumerate(zip(CONTEXTS, reversed(CONTEXTS)))]
+    conn.executemany('INSERT INTO t VALUES (?,?,?,?,?,?,?)', rows)
+    conn.commit()
+    build_context_trie(conn, 't', replace=True)
+    assert conn.execute("SELECT type from sqlite_master where name = 't'").fetchone() == ('view',)
+    assert sorted(conn.execute('SELECT * from t')) == sorted(rows)
@@ -0,0 +1,58 @@
+"""
+Soot and WALA variables must normalize to the same key for the same source-level
+local, and compiler-generated locals must never match across IRs.
+"""
+import pytest
+
+pytest.importorskip('bitsets')
+
+from irdiff import heap_key, normalize_variable, variable_key  # noqa: E402
+
+METHOD = '<pkg.C: void m(int,java.lang.String)>'
+# enclosing method of a variable, without the angle brackets
+SIGNATURE = METHOD[1:-1]
+
+
+@pytest.mark.parametrize('var, local', [
+    (f'{METHOD}/count', 'count'),
+    (f'{METHOD}/count#_12', 'count'),
+    (f'{METHOD}/i2', 'i2'),
+    (f'{METHOD}/s1#_3', 's1'),
+    (f'{METHOD}/@this', 'this'),
+    (f'{METHOD}/name\n', 'name'),
+])
+def test_soot_source_locals(var, local):
+    assert normalize_variable(var, 'soot') == (SIGNATURE, local, True)
+
+
+@pytest.mark.parametrize('local', ['$r1', '$stack3', 'r0', 'z1', 'temp$0', '$r2#_5'])
+def test_soot_generated_locals(local):
+    method, key, source = normalize_variable(f'{METHOD}/{local}', 'soot')
+    assert method == SIGNATURE and not source and key.startswith('soot:')
+
+
+@pytest.mark.parametrize('var, expected', [
+    (f'{METHOD}/count', (SIGNATURE, 'count', True)),
+    (f'{METHOD}/@this', (SIGNATURE, 'this', True)),
+    (f'{METHOD}/v3', (SIGNATURE, 'wala:v3', False)),
+    (f'{METHOD}/count#_1', (SIGNATURE, 'count#_1', True)),
+])
+def test_wala_locals(var, expected):
+    assert normalize_variable(var, 'wala') == expected
+
+
+def test_keys_match_across_irs():
+    assert variable_key('soot', f'{METHOD}/count#_4') == variable_key('wala', f'{METHOD}/count')
+    assert variable_key('soot', f'{METHOD}/@this') == variable_key('wala', f'{METHOD}/@this')
+    assert variable_key('soot', f'{METHOD}/v3') != variable_key('wala', f'{METHOD}/v3')
+    assert variable_key('soot', f'{METHOD}/r1') != variable_key('wala', f'{METHOD}/r1')
+
+
+def test_keys_sort_by_method_then_local():
+    keys = [variable_key('wala', f'{m}/{local}') for m, local in
+            [('<pkg.C: void m()>', 'b'), ('<pkg.C: void m()>', 'a'), ('<pkg.C: void m(int)>', 'a')]]
+    assert sorted(keys) == [keys[1], keys[0], keys[2]]
+
+
+def test_heap_key_drops_instruction_index():
+    assert heap_key(f'{METHOD}/new pkg.T/0') == heap_key(f'{METHOD}/new pkg.T/3') == f'{METHOD}/new pkg.T'
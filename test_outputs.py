@@ -0,0 +1,73 @@
+"""
+Records written by ``RecordWriter`` must read back unchanged through ``iter_records``,
+whatever the compression and whether a background thread writes them.
+"""
+import gzip
+
+import pytest
+
+from outputs import OutputOptions, RecordWriter, iter_records
+
+RECORDS = [(f'<pkg.C{i % 7}: void m{i % 11}()>/new pkg.T{i % 5}/0', f'pkg.T{i % 5}', 'é') for i in range(2000)]
+
+
+def write(path, records, **kwargs):
+    writer = RecordWriter(str(path), binary=True, buffer_size=256, **kwargs)
+    writer.write_all(records)
+    writer.close()
+    return writer
+
+
+@pytest.mark.parametrize('compression', [None, 'gz'])
+@pytest.mark.parametrize('asynchronous', [False, True])
+def test_round_trip(tmp_path, compression, asynchronous):
+    writer = write(tmp_path / 'heaps.dump', RECORDS, compression=compression, asynchronous=asynchronous)
+    assert writer.nb_records == len(RECORDS)
+    assert list(iter_records(writer.path)) == RECORDS
+
+
+def test_gzip_output_is_gzip(tmp_path):
+    writer = write(tmp_path / 'heaps.dump', RECORDS, compression='gz')
+    assert writer.path.name == 'heaps.dump.gz'
+    with gzip.open(writer.path, 'rb') as fh:
+        assert fh.read(4) == b'PEVR'
+
+
+def test_distinct_drops_duplicates(tmp_path):
+    writer = write(tmp_path / 'heaps.dump', RECORDS + RECORDS, distinct=True, asynchronous=True)
+    assert list(iter_records(writer.path)) == list(dict.fromkeys(RECORDS))
+
+
+def test_finish_frees_state_before_close(tmp_path):
+    writer = RecordWriter(str(tmp_path / 'heaps.dump'), binary=True, asynchronous=True, distinct=True)
+    writer.write_all(RECORDS)
+    writer.finish()
+    assert not writer._seen and not writer._strings
+    with pytest.raises(ValueError):
+        writer.write(RECORDS[0])
+    writer.close()
+    assert list(iter_records(writer.path)) == list(dict.fromkeys(RECORDS))
+
+
+def test_text_output(tmp_path):
+    writer = RecordWriter(str(tmp_path / 'types.log'), compression='gz', asynchronous=True,
+                          text_format=lambda r: f'{r[0]}:{r[1]}')
+    writer.write_all(RECORDS[:3])
+    writer.close()
+    with gzip.open(writer.path, 'rt') as fh:
+        assert fh.read().splitlines() == [f'{r[0]}:{r[1]}' for r in RECORDS[:3]]
+
+
+def test_failed_dump_is_closed(tmp_path):
+    pytest.importorskip('bitsets')
+    from computeprecision import dump_heap_info_to_file
+
+    def heaps():
+        yield from RECORDS[:10]
+        raise RuntimeError('query failed')
+
+    output = OutputOptions(binary=True, compression='gz', asynchronous=True)
+    with pytest.raises(RuntimeError):
+        dump_heap_info_to_file(str(tmp_path / 'heaps.dump'), heaps(), output=output)
+    # a gzip stream only reads back to the end once its writer is closed
+    assert list(iter_records(tmp_path / 'heaps.dump.gz')) == RECORDS[:10]
@@ -0,0 +1,50 @@
+"""
+Values sent through ``queryclient`` messages must come back with the types the
+local classes return.
+"""
+import pytest
+
+from queryclient import dumps, loads, parse_address
+
+VALUES = [
+    3,
+    'var',
+    None,
+    ('ctx', 'var'),
+    [('ctx', 'var'), ('ctx', 'other')],
+    {('ctx', 'heap'), ('ctx2', 'heap')},
+    {'<pkg.C: void m()>': 2, '<pkg.D: void n()>': 0},
+    {('ctx', 'var'): {('hctx', 'heap')}, ('ctx', 'other'): set()},
+    {1: (2, 'h'), 3: (4, 'g')},
+    {'nested': [{'set': {1, 2}}, ((1, 2), [3])]},
+]
+
+
+def round_trip(value):
+    return loads(dumps({'id': 1, 'result': value}))['result']
+
+
+@pytest.mark.parametrize('value', VALUES)
+def test_round_trip(value):
+    assert round_trip(value) == value
+
+
+def test_round_trip_keeps_types():
+    res = round_trip({('ctx', 'var'): {('hctx', 'heap')}, 'tuples': [(1, 2)]})
+    assert type(res['tuples'][0]) is tuple
+    key, heaps = next((k, v) for k, v in res.items() if k != 'tuples')
+    assert type(key) is tuple and type(heaps) is set and type(next(iter(heaps))) is tuple
+
+
+def test_messages_are_lines():
+    line = dumps({'id': 1, 'result': 'a\nb'})
+    assert line.endswith(b'\n') and line.count(b'\n') == 1
+
+
+@pytest.mark.parametrize('address, expected', [
+    ('unix:/tmp/pointeval.sock', ('unix', '/tmp/pointeval.sock')),
+    ('127.0.0.1:7474', ('tcp', ('127.0.0.1', 7474))),
+    (':7475', ('tcp', ('127.0.0.1', 7475))),
+])
+def test_parse_address(address, expected):
+    assert parse_address(address) == expected
@@ -0,0 +1,80 @@
+"""
+The query server must evict idle tables, the least recently used ones over the
+memory budget and the ones whose facts were loaded again, but never a busy one.
+"""
+import importlib
+import sqlite3
+
+import pytest
+
+pytest.importorskip('bitsets')
+
+from outofcore import MemoryBudget  # noqa: E402
+from queryserver import TableCache  # noqa: E402
+from test_sharedfacts import BENCHMARK, IR, facts, write_facts  # noqa: E402
+from utils import DATABASE_PATH  # noqa: E402
+
+
+def key(analysis):
+    return {'benchmark': BENCHMARK, 'analysis': analysis, 'ir': IR}
+
+
+@pytest.fixture
+def loader(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'db').mkdir()
+    return importlib.import_module('create-varpointsto-db')
+
+
+@pytest.fixture
+def cache(loader):
+    for analysis in ('1cs', '2cs'):
+        write_facts(analysis, facts(4, 3))
+        loader.load_var_points_to_db(BENCHMARK, analysis, IR)
+    return TableCache(idle_timeout=60)
+
+
+def test_results_are_cached_and_copied(cache):
+    heap_types = cache.call('table', key('1cs'), 'get_heap_types', [])
+    heap_types.clear()
+    assert cache.call('table', key('1cs'), 'get_heap_types', [])
+    assert cache.tables[(BENCHMARK, '1cs', IR)].nb_results() == 1
+
+
+def test_idle_tables_are_evicted(cache):
+    cache.call('table', key('1cs'), 'get_heap_types', [])
+    cache.call('table', key('2cs'), 'get_heap_types', [])
+    cache.tables[(BENCHMARK, '1cs', IR)].last_used -= 120
+    assert cache.evict_idle() == [(BENCHMARK, '1cs', IR)]
+    assert list(cache.tables) == [(BENCHMARK, '2cs', IR)]
+
+
+def test_busy_tables_are_kept(cache):
+    cache.call('table', key('1cs'), 'get_heap_types', [])
+    cache.tables[(BENCHMARK, '1cs', IR)].last_used -= 120
+    cache._busy[(BENCHMARK, '1cs', IR)] = 1
+    assert cache.evict_idle() == []
+
+
+def test_budget_evicts_least_recently_used_first(cache):
+    cache.call('table', key('2cs'), 'get_heap_types', [])
+    cache.call('table', key('1cs'), 'get_heap_types', [])
+    cache.tables[(BENCHMARK, '2cs', IR)].last_used -= 10
+    cache.memory_budget = MemoryBudget(0)
+    assert cache.enforce_budget() == [(BENCHMARK, '2cs', IR), (BENCHMARK, '1cs', IR)]
+    assert cache.nbytes() == 0
+
+
+def test_reloaded_tables_are_evicted(loader, cache):
+    cache.call('table', key('1cs'), 'get_heap_types', [])
+    cache.call('table', key('2cs'), 'get_heap_types', [])
+    assert cache.revalidate() == []
+
+    # same facts again: only the load stamp tells the new rows apart
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute(f'DROP TABLE {BENCHMARK}_1cs_{IR}')
+    conn.commit()
+    loader.load_var_points_to_db(BENCHMARK, '1cs', IR)
+    assert cache.revalidate() == [(BENCHMARK, '1cs', IR)]
+    assert list(cache.tables) == [(BENCHMARK, '2cs', IR)]
+    assert cache.call('table', key('1cs'), 'get_heap_types', [])
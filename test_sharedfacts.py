@@ -0,0 +1,143 @@
+"""
+Plain and shared loads of the same facts must answer ``VarPointsToTable`` queries alike,
+also when an analysis is loaded again.
+"""
+import importlib
+import sqlite3
+
+import pytest
+
+pytest.importorskip('bitsets')
+
+from facts import RELATIONS, fact_dir  # noqa: E402
+from sharedfacts import ids_table, load_relation_shared, shared_table  # noqa: E402
+from utils import DATABASE_PATH  # noqa: E402
+from varpointstodb import VarPointsToTable  # noqa: E402
+
+RELATION = RELATIONS['varpointsto']
+BENCHMARK = 'bench'
+IR = 'soot'
+
+
+def facts(nb_methods, nb_heaps):
+    rows = []
+    for m in range(nb_methods):
+        method = f'<pkg.C{m % 3}: void m{m}(int)>'
+        ctx = f'[<pkg.D: void x()>/invoke{m % 2}, {method}/invoke{m}]'
+        for v in range(3):
+            for h in range(nb_heaps):
+                heap = f'<pkg.F: void f{h}()>/new pkg.T{(m + v + h) % 4}/0'
+                rows.append((f'[<pkg.F: void f{h}()>/new pkg.E/{h % 2}]', heap, ctx, f'{method}/r{v}'))
+    return rows
+
+
+def write_facts(analysis, rows):
+    directory = fact_dir(analysis, BENCHMARK, IR)
+    directory.mkdir(parents=True, exist_ok=True)
+    for old in directory.glob(f'{RELATION.file_name}*'):
+        old.unlink()
+    with open(directory / RELATION.file_name, 'w') as fh:
+        fh.writelines('\t'.join(row) + '\n' for row in rows)
+    return directory
+
+
+def answers(analysis):
+    table = VarPointsToTable(BENCHMARK, analysis, IR)
+    variables = sorted(table.all_variables_ctx_pair())
+    return {
+        'len': len(table),
+        'heap_types': sorted(table.get_heap_types()),
+        'methods': sorted(table.get_var_enclosing_method()),
+        'variables': variables,
+        'heaps': sorted(table.all_heap_ctx_pair()),
+        'per_method': sorted(table.count_nb_of_variables_method().items()),
+        'heap_objs': sorted(table.heap_objs_for_var(set(variables))),
+    }
+
+
+@pytest.fixture
+def loader(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'db').mkdir()
+    return importlib.import_module('create-varpointsto-db')
+
+
+def test_shared_answers_like_plain(loader):
+    write_facts('1cs', facts(6, 4))
+    loader.load_var_points_to_db(BENCHMARK, '1cs', IR)
+    plain = answers('1cs')
+    loader.load_var_points_to_db(BENCHMARK, '1cs', IR, shared=True)
+    assert VarPointsToTable(BENCHMARK, '1cs', IR).has_shared_facts()
+    assert answers('1cs') == plain
+
+
+def test_reload_replaces_rows_and_derived_tables(loader):
+    write_facts('1cs', facts(6, 4))
+    loader.load_var_points_to_db(BENCHMARK, '1cs', IR, projections=True, pointsto_sets=True, ctx_trie=True,
+                                 shared=True)
+    table = VarPointsToTable(BENCHMARK, '1cs', IR)
+    assert table.has_projections() and table.has_pointsto_sets() and table.has_context_trie()
+
+    write_facts('1cs', facts(4, 5))
+    loader.load_var_points_to_db(BENCHMARK, '1cs', IR, shared=True)
+    table = VarPointsToTable(BENCHMARK, '1cs', IR)
+    assert not (table.has_projections() or table.has_pointsto_sets() or table.has_context_trie())
+    reloaded = answers('1cs')
+
+    write_facts('2cs', facts(4, 5))
+    loader.load_var_points_to_db(BENCHMARK, '2cs', IR)
+    assert reloaded == answers('2cs')
+
+
+def test_reload_deletes_unused_shared_rows(loader):
+    write_facts('1cs', facts(6, 4))
+    loader.load_var_points_to_db(BENCHMARK, '1cs', IR, shared=True)
+    write_facts('2cs', facts(3, 2))
+    loader.load_var_points_to_db(BENCHMARK, '2cs', IR, shared=True)
+    reloaded = answers('2cs')
+
+    write_facts('1cs', facts(3, 2))
+    loader.load_var_points_to_db(BENCHMARK, '1cs', IR, shared=True)
+    conn = sqlite3.connect(DATABASE_PATH)
+    used = {value for row in facts(3, 2) for value in row}
+    for kind, column in (('heaps', 'heapObj'), ('vars', 'var'), ('ctxs', 'ctx')):
+        assert {r[0] for r in conn.execute(f'SELECT {column} from {shared_table(BENCHMARK, IR, kind)}')} <= used
+    assert answers('1cs') == answers('2cs') == reloaded
+
+
+def test_plain_reload_drops_projections_and_sets(loader):
+    write_facts('1cs', facts(6, 4))
+    loader.load_var_points_to_db(BENCHMARK, '1cs', IR, projections=True, pointsto_sets=True)
+    table = VarPointsToTable(BENCHMARK, '1cs', IR)
+    assert table.has_projections() and table.has_pointsto_sets()
+
+    write_facts('1cs', facts(4, 5))
+    loader.load_var_points_to_db(BENCHMARK, '1cs', IR)
+    table = VarPointsToTable(BENCHMARK, '1cs', IR)
+    assert not (table.has_projections() or table.has_pointsto_sets())
+
+
+def test_plain_reload_of_trie_view(loader):
+    write_facts('1cs', facts(6, 4))
+    loader.load_var_points_to_db(BENCHMARK, '1cs', IR, ctx_trie=True)
+    once = answers('1cs')
+    loader.load_var_points_to_db(BENCHMARK, '1cs', IR, ctx_trie=True)
+    twice = answers('1cs')
+    assert VarPointsToTable(BENCHMARK, '1cs', IR).has_context_trie()
+    assert twice['len'] == 2 * once['len']
+    assert set(twice['heap_objs']) == set(once['heap_objs'])
+
+
+def test_corrupt_facts_keep_previous_rows(loader):
+    write_facts('1cs', facts(6, 4))
+    loader.load_var_points_to_db(BENCHMARK, '1cs', IR, shared=True)
+    before = answers('1cs')
+
+    directory = write_facts('1cs', [])
+    (directory / RELATION.file_name).unlink()
+    (directory / f'{RELATION.file_name}.gz').write_bytes(b'not a gzip file')
+    conn = sqlite3.connect(DATABASE_PATH)
+    assert load_relation_shared(conn, RELATION, BENCHMARK, '1cs', IR) == 0
+    assert conn.execute("SELECT name from sqlite_master where name like ?",
+                        (f'{ids_table(RELATION.table_name(BENCHMARK, "1cs", IR))}_new',)).fetchone() is None
+    assert answers('1cs') == before
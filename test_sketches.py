@@ -0,0 +1,61 @@
+"""
+HyperLogLog estimates must stay within their error bound, and merged sketches
+must estimate the union of their streams.
+"""
+import pytest
+
+from sketches import HyperLogLog, merge_sketches
+
+
+def sketch(items, precision=12):
+    hll = HyperLogLog(precision)
+    hll.update(items)
+    return hll
+
+
+def heaps(start, stop):
+    return (f'<pkg.C: void m{i % 97}()>/new pkg.T{i}/0' for i in range(start, stop))
+
+
+@pytest.mark.parametrize('nb_items', [10, 1000, 50000])
+def test_estimate_within_error_bound(nb_items):
+    hll = sketch(heaps(0, nb_items))
+    assert abs(hll.estimate() - nb_items) <= hll.error_bound()
+
+
+def test_duplicates_are_not_counted():
+    once = sketch(heaps(0, 5000))
+    twice = sketch(list(heaps(0, 5000)) * 2)
+    assert once.registers == twice.registers
+
+
+def test_tuples_are_items():
+    hll = sketch((f'[ctx{i % 10}]', f'v{i}') for i in range(3000))
+    assert abs(hll.estimate() - 3000) <= hll.error_bound()
+
+
+def test_error_bound_shrinks_with_precision():
+    assert sketch(heaps(0, 20000), 14).error_bound() < sketch(heaps(0, 20000), 10).error_bound()
+
+
+def test_merge_is_union():
+    soot, wala = sketch(heaps(0, 30000)), sketch(heaps(20000, 50000))
+    union = soot | wala
+    assert union.registers == sketch(heaps(0, 50000)).registers
+    assert abs(union.estimate() - 50000) <= union.error_bound()
+    assert merge_sketches([soot, wala]).registers == union.registers
+    # ``|`` leaves both operands unchanged
+    assert soot.registers == sketch(heaps(0, 30000)).registers
+
+
+def test_merge_rejects_other_precision():
+    with pytest.raises(ValueError):
+        sketch(heaps(0, 10), 12).merge(sketch(heaps(0, 10), 10))
+    with pytest.raises(ValueError):
+        merge_sketches([])
+
+
+def test_bytes_round_trip():
+    hll = sketch(heaps(0, 4000))
+    restored = HyperLogLog.from_bytes(hll.to_bytes())
+    assert restored.precision == hll.precision and restored.estimate() == hll.estimate()
@@ -1,11 +1,18 @@
 from pathlib import Path
-from typing import Any, Dict, List, Optional, TextIO
+from typing import Any, Dict, List, Optional, TextIO, Tuple
 
-from tabulate import tabulate
-from scipy.stats import wilcoxon
+# tabulate, scipy and numpy are imported where they are used, so that importing
+# utils (and every script that depends on it) stays cheap.
 
 DATABASE_PATH = Path(".") / "db" / "varpointsto.db"
 
+BENCHMARKS = [
+    'avrora', 'batik', 'eclipse', 'h2', 'jython', 'lusearch', 'luindex',
+    'pmd', 'sunflow', 'tradebeans', 'xalan'
+]
+ANALYSES = ['1cs', '2cs', '1os', '2os']
+IRS = ['wala', 'soot']
+
 
 def get_type_info(variable: str) -> str:
     """Extracts the type information in a variable."""
@@ -16,18 +23,49 @@ def get_type_info(variable: str) -> str:
     return variable
 
 
+def get_var_method_info(variable: str) -> str:
+    """Extracts the containing method (``class: signature``) of a variable or invocation."""
+    pos_angle = variable.find('<')
+    pos_close = variable.find('>')
+    if pos_close != -1 and pos_angle != -1:
+        return variable[pos_angle + 1:pos_close]
+    return variable
+
+
 def print_wilcoxon_results(
     results: List[Dict[str, Any]],
     fields: tuple,
     msg: str,
     file_handler: TextIO,
 ) -> None:
+    from scipy.stats import wilcoxon
     x_col = [i[fields[0]] for i in results]
     y_col = [i[fields[1]] for i in results]
     w, p = wilcoxon(x=x_col, y=y_col, zero_method='zsplit', mode="approx")
     file_handler.write(f"\n{msg} : w = {w}, p = {p}")
 
 
+def print_bootstrap_results(
+    series: Dict[str, Tuple[List[Dict[str, Any]], tuple]],
+    file_handler: TextIO,
+    n_resamples: int = 10000,
+    confidence: float = 0.95,
+) -> None:
+    """Write bootstrap confidence intervals of the paired differences of every series, resampled in one batch."""
+    from bootstrap import bootstrap_confidence_intervals
+    samples = {
+        msg: ([i[fields[0]] for i in results], [i[fields[1]] for i in results])
+        for msg, (results, fields) in series.items()
+    }
+    intervals = bootstrap_confidence_intervals(samples, n_resamples=n_resamples, confidence=confidence)
+    for msg, r in intervals.items():
+        file_handler.write(
+            f"\n{msg} : n = {r['n']}, mean diff = {r['mean_diff']:.4f} "
+            f"[{r['ci_low']:.4f}, {r['ci_high']:.4f}], effect size = {r['effect_size']:.4f} "
+            f"[{r['effect_ci_low']:.4f}, {r['effect_ci_high']:.4f}] ({confidence:.0%} CI)"
+        )
+
+
 def pretty_print_latex(precision_matrix: List[Dict[str, Any]], filepath: str) -> None:
     with open(filepath, 'w') as fh:
         pretty_print_stats(precision_matrix, fh, mode="latex")
@@ -38,6 +76,7 @@ def pretty_print_stats(
     fh: TextIO,
     mode: str = "simple",
 ) -> None:
+    from tabulate import tabulate
     headers = list(precision_matrix[0].keys())
     table_values = [list(x.values()) for x in precision_matrix]
     if mode == "latex":
@@ -60,6 +99,31 @@ def pretty_print_csv(precision_matrix: List[Dict[str, Any]], file_name: str) ->
             fh.write('\n')
 
 
+def _parse_csv_value(value: str) -> Any:
+    for typ in (int, float):
+        try:
+            return typ(value)
+        except ValueError:
+            pass
+    return value
+
+
+def read_results_csv(file_name: str) -> List[Dict[str, Any]]:
+    """
+    Read back a file written by ``pretty_print_csv``.
+
+    Values are not quoted by the writer, so the last column (e.g. ``ex_vars_types``)
+    absorbs any commas it contains. Numeric values are converted back to int or float.
+    """
+    with open(file_name, 'r') as fh:
+        headers = fh.readline().rstrip('\n').split(',')
+        rows = []
+        for line in fh:
+            values = line.rstrip('\n').split(',', len(headers) - 1)
+            rows.append({h: _parse_csv_value(v) for h, v in zip(headers, values)})
+        return rows
+
+
 def pp_dictionary(dictionary: Dict[str, Any]) -> None:
     """
     Pretty print a dictionary where the keys are string. Handle special cases for numeric values.
@@ -1,11 +1,19 @@
 import sqlite3
 from sqlite3 import Error
-from typing import Set, List, Tuple, Dict, Optional
+from typing import Set, List, Tuple, Dict, Iterable, Iterator, Optional
 import time
 from collections import namedtuple, defaultdict
 
 from utils import DATABASE_PATH
 from bitsets import bitset
+from projections import ci_table, ci_method_table, table_exists
+from pointsto_sets import sets_table, var_sets_table
+from contexttrie import ctx_strings_table, ctx_table, node_context, rows_table, truncation_map
+from sharedfacts import ids_table
+from memprofile import MemoryProfiler
+
+# Rows between two soft memory limit checks in long-running loops.
+MEMORY_CHECK_INTERVAL = 100000
 
 
 class VarPointsToTable:
@@ -13,6 +21,16 @@ class VarPointsToTable:
 
     def __init__(self, benchmark: str, analysis: str, ir: str) -> None:
         self.db = f'{benchmark}_{analysis}_{ir}'
+        self.ci_db = ci_table(self.db)
+        self.ci_method_db = ci_method_table(self.db)
+        self.sets_db = sets_table(self.db)
+        self.var_sets_db = var_sets_table(self.db)
+        self.ctx_db = ctx_table(self.db)
+        self.rows_db = rows_table(self.db)
+        self.ctx_strings_db = ctx_strings_table(self.db)
+        self.ids_db = ids_table(self.db)
+        self._table_flags: Dict[str, bool] = {}
+        self.profiler: Optional[MemoryProfiler] = None
 
     def __len__(self) -> int:
         """Return the number of records in the database."""
@@ -33,11 +51,45 @@ class VarPointsToTable:
     def __str__(self) -> str:
         return self.__repr__()
 
+    def _check_memory(self, where: str) -> None:
+        if self.profiler is not None:
+            self.profiler.check(f'{self.db}:{where}')
+
+    def _has_tables(self, *names: str) -> bool:
+        """Check (once per name) whether the given auxiliary tables were built at load time."""
+        missing = [n for n in names if n not in self._table_flags]
+        if missing:
+            conn = sqlite3.connect(DATABASE_PATH)
+            for name in missing:
+                try:
+                    self._table_flags[name] = table_exists(conn, name)
+                except Error as e:
+                    print(f"_has_tables: {e}")
+                    self._table_flags[name] = False
+        return all(self._table_flags[n] for n in names)
+
+    def has_projections(self) -> bool:
+        """Check whether the context-insensitive projections were built at load time."""
+        return self._has_tables(self.ci_db, self.ci_method_db)
+
+    def has_pointsto_sets(self) -> bool:
+        """Check whether the hash-consed points-to sets were built at load time."""
+        return self._has_tables(self.sets_db, self.var_sets_db)
+
+    def has_context_trie(self) -> bool:
+        """Check whether the contexts were stored in a trie at load time."""
+        return self._has_tables(self.ctx_db, self.rows_db, self.ctx_strings_db)
+
+    def has_shared_facts(self) -> bool:
+        """Check whether the table is a view over facts shared with the other analyses."""
+        return self._has_tables(self.ids_db)
+
     def get_heap_types(self) -> List[str]:
         """Get all distinct heap types."""
         conn = sqlite3.connect(DATABASE_PATH)
         try:
-            query = f'SELECT DISTINCT heapType from {self.db}'
+            table = self.ci_db if self.has_projections() else self.db
+            query = f'SELECT DISTINCT heapType from {table}'
             results = conn.execute(query)
             return [r[0] for r in results]
         except Error as e:
@@ -48,7 +100,10 @@ class VarPointsToTable:
         """Get all distinct enclosing methods."""
         conn = sqlite3.connect(DATABASE_PATH)
         try:
-            query = f'SELECT DISTINCT enclosingMethod from {self.db}'
+            if self.has_projections():
+                query = f'SELECT enclosingMethod from {self.ci_method_db}'
+            else:
+                query = f'SELECT DISTINCT enclosingMethod from {self.db}'
             results = conn.execute(query)
             return {r[0] for r in results}
         except Error as e:
@@ -136,7 +191,10 @@ class VarPointsToTable:
             Mapping of method to variable count
         """
         conn = sqlite3.connect(DATABASE_PATH)
-        query = f"SELECT enclosingMethod, count(distinct var) from {self.db} group by enclosingMethod"
+        if self.has_projections():
+            query = f"SELECT enclosingMethod, nbVars from {self.ci_method_db}"
+        else:
+            query = f"SELECT enclosingMethod, count(distinct var) from {self.db} group by enclosingMethod"
         try:
             res = conn.execute(query)
             return dict(res)
@@ -181,9 +239,13 @@ class VarPointsToTable:
                     f"where varCtx in {cases_query_varctx} and var in {cases_query_vars} "
                     f"and heapObj not like '%null%'"
                 )
-                res = cursor.execute(query).fetchall()
+                res = []
+                for r in cursor.execute(query):
+                    res.append((r[0], r[1]))
+                    if len(res) % MEMORY_CHECK_INTERVAL == 0:
+                        self._check_memory('heap_objs_for_var')
                 print(f"\t\t\tFetched {len(res)} rows in {time.time() - start_time} seconds")
-                return [(r[0], r[1]) for r in res]
+                return res
             except Error as e:
                 print(f"heap_objs_for_var: {e}, {query}")
                 return []
@@ -201,6 +263,8 @@ class VarPointsToTable:
         heap_ctx_pairs = set(self.all_heap_ctx_pair())
         HeapObjs = bitset('HeapObjs', tuple(heap_ctx_pairs))
         pointsto_map = defaultdict(lambda: HeapObjs.infimum)
+        if self.has_pointsto_sets():
+            return self._pointsto_map_from_sets(HeapObjs, pointsto_map)
 
         HeapVarRow = namedtuple('HeapVarRow', ['var', 'heap'])
         conn = sqlite3.connect(DATABASE_PATH)
@@ -216,6 +280,8 @@ class VarPointsToTable:
                 heap_objs = hvrow.heap
                 pointsto_map[var] = pointsto_map[var].union(HeapObjs([heap_objs]))
                 count += 1
+                if count % MEMORY_CHECK_INTERVAL == 0:
+                    self._check_memory('pointsto_map')
             print(f"\t\tCreated {count} points-to map entries in {time.time() - start} seconds")
             return pointsto_map
         except Error as e:
@@ -244,4 +310,299 @@ class VarPointsToTable:
         except Error as e:
             print(f"VarPointsToTable:get_variables_for_heap_obj: {e}")
             print(query)
-            return []
\ No newline at end of file
+            return []
+
+    def _pointsto_map_from_sets(self, HeapObjs: type, pointsto_map: Dict) -> Dict:
+        """Build the points-to map from the hash-consed sets, sharing one bitset per distinct set."""
+        conn = sqlite3.connect(DATABASE_PATH)
+        cursor = conn.cursor()
+        try:
+            start = time.time()
+            print("\t\tCreating points-to map from hash-consed sets")
+            set_members: Dict[int, List[Tuple[str, str]]] = defaultdict(list)
+            for row in cursor.execute(f'select setId, heapCtx, heapObj from {self.sets_db}'):
+                set_members[row[0]].append((row[1], row[2]))
+            set_bitsets = {set_id: HeapObjs(members) for set_id, members in set_members.items()}
+            del set_members
+            count = 0
+            for row in cursor.execute(f'select varCtx, var, setId from {self.var_sets_db}'):
+                pointsto_map[(row[0], row[1])] = set_bitsets[row[2]]
+                count += 1
+                if count % MEMORY_CHECK_INTERVAL == 0:
+                    self._check_memory('pointsto_map')
+            print(f"\t\tCreated {count} points-to map entries over {len(set_bitsets)} distinct sets "
+                  f"in {time.time() - start} seconds")
+            return pointsto_map
+        except Error as e:
+            print(f"VarPointsToTable:_pointsto_map_from_sets: {e}")
+            return pointsto_map
+
+    def pointsto_set_ids(self) -> Dict[Tuple[str, str], int]:
+        """
+        Map every variable to the ID of its hash-consed points-to set.
+
+        Returns
+        -------
+        Dict[Tuple[str, str], int]
+            Mapping of (varCtx, var) pairs to set IDs
+        """
+        conn = sqlite3.connect(DATABASE_PATH)
+        try:
+            query = f'select varCtx, var, setId from {self.var_sets_db}'
+            return {(r[0], r[1]): r[2] for r in conn.execute(query)}
+        except Error as e:
+            print(f"VarPointsToTable:pointsto_set_ids: {e}")
+            return {}
+
+    def pointsto_set(self, set_id: int) -> Set[Tuple[str, str]]:
+        """Return the (heapCtx, heapObj) pairs of a hash-consed points-to set."""
+        conn = sqlite3.connect(DATABASE_PATH)
+        try:
+            query = f'select heapCtx, heapObj from {self.sets_db} where setId = ?'
+            return {(r[0], r[1]) for r in conn.execute(query, (set_id,))}
+        except Error as e:
+            print(f"VarPointsToTable:pointsto_set: {e}")
+            return set()
+
+    def pointsto_set_groups(self) -> Iterator[Set[Tuple[str, str]]]:
+        """
+        Group variables by hash-consed points-to set ID.
+
+        Yields
+        ------
+        Set[Tuple[str, str]]
+            (varCtx, var) pairs sharing the same points-to set
+        """
+        conn = sqlite3.connect(DATABASE_PATH)
+        query = f'select setId, varCtx, var from {self.var_sets_db} order by setId'
+        current_set = None
+        group: Set[Tuple[str, str]] = set()
+        try:
+            for row in conn.execute(query):
+                if row[0] != current_set:
+                    if group:
+                        yield group
+                    current_set = row[0]
+                    group = set()
+                group.add((row[1], row[2]))
+        except Error as e:
+            print(f"VarPointsToTable:pointsto_set_groups: {e}")
+        if group:
+            yield group
+
+    def count_variables_ctx_pair(self) -> int:
+        """Return the number of distinct (varCtx, var) pairs without materializing them."""
+        conn = sqlite3.connect(DATABASE_PATH)
+        try:
+            query = f'SELECT count(*) from (SELECT DISTINCT varCtx, var from {self.db})'
+            return conn.execute(query).fetchone()[0]
+        except Error as e:
+            print(f"count_variables_ctx_pair: {e}")
+            return 0
+
+    @staticmethod
+    def spill_values(conn: sqlite3.Connection, name: str, values: Iterable[str]) -> None:
+        """Store a collection of strings in a temporary table ``name(value)``."""
+        conn.execute(f'DROP TABLE IF EXISTS temp.{name}')
+        conn.execute(f'CREATE TEMP TABLE {name} (value string PRIMARY KEY) WITHOUT ROWID')
+        conn.executemany(f'INSERT OR IGNORE INTO {name} VALUES (?)', ((v,) for v in values))
+        # do not hold a transaction (and its lock on the database) until the connection is collected
+        conn.commit()
+
+    def spill_variables(
+        self,
+        conn: sqlite3.Connection,
+        name: str,
+        virtualcall_table: str,
+        column: Optional[str] = None,
+        values: Optional[str] = None,
+    ) -> int:
+        """
+        Store the virtual call variables of this table in a temporary table.
+
+        Parameters
+        ----------
+        conn : sqlite3.Connection
+            Connection holding the temporary tables
+        name : str
+            Name of the temporary (varCtx, var) table to create
+        virtualcall_table : str
+            Table of virtual call sites whose ``virtualVar`` column selects the variables
+        column : Optional[str]
+            Column to filter on (``enclosingMethod`` or ``varType``), or None for all variables
+        values : Optional[str]
+            Temporary table created by ``spill_values`` holding the accepted column values
+
+        Returns
+        -------
+        int
+            Number of distinct (varCtx, var) pairs stored
+        """
+        condition = f"var in (SELECT virtualVar from {virtualcall_table})"
+        if column is not None:
+            condition += f" and {column} in (SELECT value from {values})"
+        try:
+            conn.execute(f'DROP TABLE IF EXISTS temp.{name}')
+            conn.execute(f'CREATE TEMP TABLE {name} AS SELECT DISTINCT varCtx, var from {self.db} where {condition}')
+            return conn.execute(f'SELECT count(*) from {name}').fetchone()[0]
+        except Error as e:
+            print(f"spill_variables: {e}")
+            return 0
+
+    def iter_heap_objs_for_spilled(
+        self,
+        conn: sqlite3.Connection,
+        name: str,
+        distinct: bool = False,
+    ) -> Iterator[Tuple[str, str]]:
+        """
+        Stream the heap objects of the variables stored by ``spill_variables``.
+
+        Uses the same selection as ``heap_objs_for_var``, with the contexts and
+        variables read from the temporary table instead of inlined in the query.
+        """
+        select = 'SELECT DISTINCT' if distinct else 'SELECT'
+        query = (
+            f"{select} heapCtx, heapObj "
+            f"from {self.db} "
+            f"where varCtx in (SELECT varCtx from {name}) and var in (SELECT var from {name}) "
+            f"and heapObj not like '%null%'"
+        )
+        try:
+            for r in conn.execute(query):
+                yield r[0], r[1]
+        except Error as e:
+            print(f"iter_heap_objs_for_spilled: {e}, {query}")
+
+    def iter_rows(self, *columns: str) -> Iterator[Tuple[str, ...]]:
+        """Stream the given columns of every row of the table."""
+        conn = sqlite3.connect(DATABASE_PATH)
+        query = f"SELECT {', '.join(columns)} from {self.db}"
+        try:
+            yield from conn.execute(query)
+        except Error as e:
+            print(f"iter_rows: {e}, {query}")
+
+    def ensure_var_index(self) -> None:
+        """Create the index on ``var`` used to join the table against virtual call sites, if missing."""
+        if self.has_context_trie() or self.has_shared_facts():
+            # the rows behind the context trie or the shared facts are already indexed on var
+            return
+        conn = sqlite3.connect(DATABASE_PATH)
+        try:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {self.db}_var ON {self.db} (var)')
+            conn.commit()
+        except Error as e:
+            print(f"ensure_var_index: {e}")
+
+    def receivers_per_call_site(self, virtualcall_table: str) -> Dict[str, Tuple[int, int]]:
+        """
+        Count the receiver objects and types of every virtual call site in one indexed join.
+
+        Receivers do not depend on contexts, so the join uses the context-insensitive
+        projection when it exists.
+
+        Parameters
+        ----------
+        virtualcall_table : str
+            Table of (virtualCallSite, virtualVar) rows
+
+        Returns
+        -------
+        Dict[str, Tuple[int, int]]
+            Mapping of call site to (#receiver objects, #receiver types); sites whose
+            receiver points to nothing map to (0, 0)
+        """
+        if self.has_projections():
+            table = self.ci_db
+        else:
+            table = self.db
+            self.ensure_var_index()
+        conn = sqlite3.connect(DATABASE_PATH)
+        query = (
+            f"SELECT v.virtualCallSite, count(DISTINCT p.heapObj), count(DISTINCT p.heapType) "
+            f"from {virtualcall_table} v LEFT JOIN {table} p "
+            f"on p.var = v.virtualVar and p.heapObj not like '%null%' "
+            f"group by v.virtualCallSite"
+        )
+        try:
+            start = time.time()
+            res = {r[0]: (r[1], r[2]) for r in conn.execute(query)}
+            print(f"\t\tCounted receivers of {len(res)} call sites in {time.time() - start} seconds")
+            return res
+        except Error as e:
+            print(f"receivers_per_call_site: {e}, {query}")
+            return {}
+
+    def context_trie_nodes(self) -> List[Tuple[int, Optional[int], int]]:
+        """Return the (ctxId, parent, depth) of every context trie node, parents first."""
+        conn = sqlite3.connect(DATABASE_PATH)
+        try:
+            query = f'SELECT ctxId, parent, depth from {self.ctx_db} order by ctxId'
+            return [(r[0], r[1], r[2]) for r in conn.execute(query)]
+        except Error as e:
+            print(f"context_trie_nodes: {e}")
+            return []
+
+    def truncated_context_ids(self, depth: int) -> Dict[int, int]:
+        """Map every context ID to the ID of the same context truncated to ``depth`` elements."""
+        return truncation_map(self.context_trie_nodes(), depth)
+
+    def context_strings(self, ctx_ids: Iterable[int]) -> Dict[int, str]:
+        """Return the context strings of the given context IDs."""
+        conn = sqlite3.connect(DATABASE_PATH)
+        try:
+            self.spill_values(conn, 'ctx_ids', ctx_ids)
+            query = f'SELECT i.value, s.ctx from ctx_ids i LEFT JOIN {self.ctx_strings_db} s on s.ctxId = i.value'
+            res = {r[0]: r[1] for r in conn.execute(query)}
+            missing = [ctx_id for ctx_id, ctx in res.items() if ctx is None]
+            if missing:
+                # truncated contexts that no row uses are only stored in the trie
+                nodes = {r[0]: (r[1], r[2]) for r in conn.execute(f'SELECT ctxId, parent, elem from {self.ctx_db}')}
+                for ctx_id in missing:
+                    res[ctx_id] = node_context(nodes, ctx_id)
+            return res
+        except Error as e:
+            print(f"context_strings: {e}")
+            return {}
+
+    def truncated_rows(self, var_depth: int, heap_depth: Optional[int] = None) -> Iterator[Tuple[int, str, int, str]]:
+        """
+        Stream the points-to relation with contexts truncated to shallower depths.
+
+        Truncating a context keeps its most recent elements, that is one of its
+        ancestors in the trie, so a k-limited relation is computed from the stored
+        one without reparsing any context string. For example, the rows of a 2cs
+        table truncated to depth 1 approximate the 1cs relation.
+
+        Parameters
+        ----------
+        var_depth : int
+            Maximum number of elements kept in variable contexts
+        heap_depth : Optional[int]
+            Maximum number of elements kept in heap contexts (``var_depth`` by default)
+
+        Yields
+        ------
+        Tuple[int, str, int, str]
+            Distinct (heapCtxId, heapObj, varCtxId, var) rows; ``context_strings`` maps the IDs back
+        """
+        if heap_depth is None:
+            heap_depth = var_depth
+        nodes = self.context_trie_nodes()
+        conn = sqlite3.connect(DATABASE_PATH)
+        try:
+            conn.execute('DROP TABLE IF EXISTS temp.trunc')
+            conn.execute('CREATE TEMP TABLE trunc (ctxId integer PRIMARY KEY, varTruncId integer, heapTruncId integer)')
+            var_ids = truncation_map(nodes, var_depth)
+            heap_ids = truncation_map(nodes, heap_depth)
+            conn.executemany('INSERT INTO trunc VALUES (?,?,?)',
+                             ((ctx_id, var_ids[ctx_id], heap_ids[ctx_id]) for ctx_id in var_ids))
+            conn.commit()
+            query = (
+                f"SELECT DISTINCT th.heapTruncId, r.heapObj, tv.varTruncId, r.var "
+                f"from {self.rows_db} r JOIN trunc tv on tv.ctxId = r.varCtxId JOIN trunc th on th.ctxId = r.heapCtxId"
+            )
+            yield from conn.execute(query)
+        except Error as e:
+            print(f"truncated_rows: {e}")
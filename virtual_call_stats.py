@@ -1,4 +1,4 @@
-from typing import Dict, Tuple
+from typing import Dict, Iterable, Tuple
 
 VIRTUAL_CALLS: Dict[Tuple[str, str], int] = {
     ('1cs','avrora_soot'): 3499,
@@ -72,3 +72,8 @@ def number_virtual_calls(analysis: str, benchmark: str, ir: str) -> int:
     if key in VIRTUAL_CALLS:
         return VIRTUAL_CALLS[key]
     raise ValueError(f"Key {key} not found in VIRTUAL_CALLS")
+
+
+def has_virtual_calls(analysis: str, benchmark: str, irs: Iterable[str]) -> bool:
+    """Check that the number of virtual calls is known for a benchmark under every IR."""
+    return all((analysis, f'{benchmark}_{ir}') in VIRTUAL_CALLS for ir in irs)